@@ -23,22 +23,80 @@ login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 
 
-def create_app():
+def create_app(config=None):
+    """Build the app; `config` overrides the defaults (used by benchmarks and tooling)."""
     app = Flask(__name__, instance_relative_config=False)
     upload_folder = os.getenv("UPLOAD_FOLDER") or os.path.join(app.root_path, "..", "uploads")
     app.config.from_mapping(
         SECRET_KEY=os.getenv("SECRET_KEY", "dev-key-flik-ai"),
         UPLOAD_FOLDER=upload_folder,
         MAX_CONTENT_LENGTH=50 * 1024 * 1024,  # 50MB upload limit
-        SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(app.root_path, '..', 'flik_ai.db')}",
-        SQLALCHEMY_TRACK_MODIFICATIONS=False
+        SQLALCHEMY_DATABASE_URI=os.getenv("DATABASE_URL") or f"sqlite:///{os.path.join(app.root_path, '..', 'flik_ai.db')}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SENDFILE_MODE=os.getenv("SENDFILE_MODE", ""),
+        X_ACCEL_PREFIX=os.getenv("X_ACCEL_PREFIX", "/protected-uploads"),
+        PROFILE_TOKEN=os.getenv("PROFILE_TOKEN", ""),
+        METRICS_TOKEN=os.getenv("METRICS_TOKEN", ""),
+        PROFILE_SAMPLE_RATE=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        PROFILE_SLOW_MS=float(os.getenv("PROFILE_SLOW_MS", "0")),
+        PROFILE_SAMPLE_INTERVAL_MS=float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "10")),
+        PROFILE_DIR=os.getenv("PROFILE_DIR") or os.path.join(app.root_path, "..", "profiles"),
+        PROFILE_KEEP=int(os.getenv("PROFILE_KEEP", "200")),
+        CACHE_URL=os.getenv("CACHE_URL", ""),
+        CACHE_TTL=float(os.getenv("CACHE_TTL", "300")),
+        CACHE_MAX_ENTRIES=int(os.getenv("CACHE_MAX_ENTRIES", "5000")),
+        CACHE_ENABLED=os.getenv("CACHE_ENABLED", "1").lower() not in ("0", "false", "no"),
+        REMINDER_LEAD_MINUTES=os.getenv("REMINDER_LEAD_MINUTES", "1440,60"),
+        REMINDER_NOTIFIERS=os.getenv("REMINDER_NOTIFIERS", "log"),
+        REMINDER_WORKER=os.getenv("REMINDER_WORKER", "0").lower() in ("1", "true", "yes"),
+        REMINDER_MAX_SLEEP=float(os.getenv("REMINDER_MAX_SLEEP", "30")),
+        REMINDER_BATCH_SIZE=int(os.getenv("REMINDER_BATCH_SIZE", "100")),
+        REMINDER_LEASE_SECONDS=float(os.getenv("REMINDER_LEASE_SECONDS", "300")),
+        REMINDER_RETRY_SECONDS=float(os.getenv("REMINDER_RETRY_SECONDS", "300")),
+        SENDGRID_API_KEY=os.getenv("SENDGRID_API_KEY", ""),
+        DEFAULT_FROM_EMAIL=os.getenv("DEFAULT_FROM_EMAIL", ""),
+        FIREBASE_CREDENTIALS=os.getenv("FIREBASE_CREDENTIALS", ""),
+        IDENTITY_CACHE_TTL=float(os.getenv("IDENTITY_CACHE_TTL", "60")),
+        IDENTITY_CACHE_MAX_ENTRIES=int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000")),
+        SUGGEST_INDEX_TTL=float(os.getenv("SUGGEST_INDEX_TTL", "300")),
+        SUGGEST_MAX_USERS=int(os.getenv("SUGGEST_MAX_USERS", "1000")),
+        SUGGEST_MAX_TERMS=int(os.getenv("SUGGEST_MAX_TERMS", "5000")),
+        GC_WORKER=os.getenv("GC_WORKER", "1").lower() in ("1", "true", "yes"),
+        GC_BATCH_SIZE=int(os.getenv("GC_BATCH_SIZE", "200")),
+        GC_RETRY_SECONDS=float(os.getenv("GC_RETRY_SECONDS", "60")),
+        GC_SWEEP_GRACE_SECONDS=float(os.getenv("GC_SWEEP_GRACE_SECONDS", "3600")),
+        EXTRACT_SANDBOX=os.getenv("EXTRACT_SANDBOX", "1").lower() in ("1", "true", "yes"),
+        EXTRACT_WORKERS=int(os.getenv("EXTRACT_WORKERS", "2")),
+        EXTRACT_MEMORY_MB=int(os.getenv("EXTRACT_MEMORY_MB", "1024")),
+        EXTRACT_CPU_SECONDS=int(os.getenv("EXTRACT_CPU_SECONDS", "60")),
+        EXTRACT_TIMEOUT_SECONDS=float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "120")),
+        EXTRACT_MAX_JOBS_PER_WORKER=int(os.getenv("EXTRACT_MAX_JOBS_PER_WORKER", "50")),
+        ASGI_IO_THREADS=int(os.getenv("ASGI_IO_THREADS", "32")),
+        ASGI_CPU_WORKERS=int(os.getenv("ASGI_CPU_WORKERS") or os.cpu_count() or 1),
     )
+    if config:
+        app.config.update(config)
 
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
     db.init_app(app)
     login_manager.init_app(app)
 
+    from app.storage import init_storage
+    init_storage(app)
+
+    from app.cache import init_cache
+    init_cache(app)
+
+    from app.identity import init_identity
+    init_identity(app)
+
+    from app.suggest import init_suggest
+    init_suggest(app)
+
+    from app.sandbox import init_sandbox
+    init_sandbox(app)
+
     # Print AI status
     try:
         dotenv_loaded = bool(_DOTENV_PATH)
@@ -51,8 +109,19 @@ def create_app():
 
     app.jinja_env.filters['format_file_size'] = format_file_size
 
+    from app.assets import init_assets
+    init_assets(app)
+
+    from app.instrumentation import init_instrumentation
+    init_instrumentation(app)
+
+    from app.profiling import init_profiling
+    init_profiling(app)
+
     with app.app_context():
         db.create_all()
+        from app.schema import upgrade_schema
+        upgrade_schema(db)
 
     from .routes import bp
     app.register_blueprint(bp)
@@ -60,13 +129,30 @@ def create_app():
     from .auth import auth_bp
     app.register_blueprint(auth_bp)
 
+    from .admin import admin_bp
+    app.register_blueprint(admin_bp)
+
+    from .api import api_bp
+    app.register_blueprint(api_bp)
+
+    from .commands import register_commands
+    register_commands(app)
+
+    # After create_all/upgrade_schema: the in-process scheduler queries todo right away
+    from app.reminders import init_reminders
+    init_reminders(app)
+
+    from app.garbage import init_garbage
+    init_garbage(app)
+
     return app
 
 from app.models import User
 
 @login_manager.user_loader
 def load_user(user_id):
+    from app.identity import load_identity
     try:
-        return User.query.get(int(user_id))
+        return load_identity(int(user_id))
     except Exception:
         return None
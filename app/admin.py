@@ -0,0 +1,61 @@
+from functools import wraps
+
+from flask import Blueprint, abort, render_template, send_file
+from flask_login import current_user, login_required
+
+from app.profiling import get_profiler
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin', template_folder='templates')
+
+
+def is_admin(user=None):
+    """Admins are the signed-in users whose is_admin flag was set with `flask admins grant`."""
+    user = user or current_user
+    if not getattr(user, 'is_authenticated', False):
+        return False
+    return bool(getattr(user, 'is_admin', False))
+
+
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if not is_admin():
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+@admin_bp.route('/profiles')
+@admin_required
+def profiles():
+    profiler = get_profiler()
+    return render_template('admin_profiles.html', profiles=profiler.store.list(), profiler=profiler)
+
+
+@admin_bp.route('/profiles/<profile_id>')
+@admin_required
+def profile_detail(profile_id):
+    record = get_profiler().store.load(profile_id)
+    if record is None:
+        abort(404)
+    profile = record.get('profile') or {}
+    hot = []
+    if profile.get('type') == 'sampling':
+        # Leaf frames across all samples: where the time was actually spent
+        leaves = {}
+        for stack, count in profile['stacks']:
+            leaf = stack.rsplit(';', 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        hot = sorted(leaves.items(), key=lambda kv: kv[1], reverse=True)[:30]
+    return render_template('admin_profile.html', record=record, profile=profile, hot=hot)
+
+
+@admin_bp.route('/profiles/<profile_id>/raw')
+@admin_required
+def profile_download(profile_id):
+    path = get_profiler().store.raw_path(profile_id)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=f"{profile_id}.prof",
+                     mimetype='application/octet-stream')
@@ -1,9 +1,16 @@
 import re
+import json
+import time
+import threading
 import nltk
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from typing import List, Dict, Tuple, Optional
 import logging
 import os
+from app import metrics
+from app.resilience import CLOSED, CircuitOpenError, Deadline, DeadlineExceeded, OPEN, env_float, get_breaker, record_fallback
 
 # Download required NLTK data
 try:
@@ -21,38 +28,228 @@ _HAS_GEMINI = False
 try:
     import google.generativeai as genai
     if os.getenv('GEMINI_API_KEY'):
-        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        if os.getenv('GEMINI_API_ENDPOINT'):
+            # e.g. the fake server from benchmarks.fakes for offline load tests
+            genai.configure(api_key=os.getenv('GEMINI_API_KEY'), transport='rest',
+                            client_options={'api_endpoint': os.getenv('GEMINI_API_ENDPOINT')})
+        else:
+            genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
         _HAS_GEMINI = True
 except Exception:
     _HAS_GEMINI = False
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n{2,}')
+
+def _split_sentences(text: str) -> List[str]:
+    """Split text into sentences, falling back to a regex if punkt is unavailable."""
+    try:
+        sentences = nltk.sent_tokenize(text)
+    except LookupError:
+        sentences = _SENTENCE_RE.split(text)
+    return [s for s in (s.strip() for s in sentences) if s]
+
+def chunk_text(text: str, chunk_size: int = 8000, overlap: int = 400) -> List[str]:
+    """Split text into chunks of at most chunk_size characters on sentence boundaries.
+
+    Consecutive chunks share up to `overlap` characters of trailing sentences so
+    that an appointment straddling a boundary is seen whole by at least one chunk.
+    """
+    if not text:
+        return []
+    if len(text) <= chunk_size:
+        return [text]
+
+    # Sentences longer than a chunk are hard-split so every piece fits
+    pieces: List[str] = []
+    for sentence in _split_sentences(text):
+        while len(sentence) > chunk_size:
+            pieces.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size:]
+        if sentence:
+            pieces.append(sentence)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for piece in pieces:
+        if current and current_len + len(piece) + 1 > chunk_size:
+            chunks.append(" ".join(current))
+            # Carry trailing sentences into the next chunk as overlap
+            carried: List[str] = []
+            carried_len = 0
+            for prev in reversed(current):
+                if carried_len + len(prev) + 1 > overlap or carried_len + len(prev) + len(piece) + 2 > chunk_size:
+                    break
+                carried.insert(0, prev)
+                carried_len += len(prev) + 1
+            current, current_len = carried, carried_len
+        current.append(piece)
+        current_len += len(piece) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def _select_chunks(count: int, max_chunks: int) -> List[int]:
+    """Indices of at most max_chunks of count chunks, spread evenly (first and last always kept)."""
+    if max_chunks <= 0 or count <= max_chunks:
+        return list(range(count))
+    if max_chunks == 1:
+        return [0]
+    step = (count - 1) / (max_chunks - 1)
+    return [round(i * step) for i in range(max_chunks)]
+
+def _normalize_phrase(value: str) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', (value or '').lower()).strip()
+
+class FakeGeminiModel:
+    """Offline stand-in for genai.GenerativeModel used in tests and local runs.
+
+    `responder(prompt_text)` returns the raw response text; by default the local
+    categorizer and extractor produce a Gemini-shaped JSON answer.
+    """
+    def __init__(self, responder=None, latency: float = 0.0):
+        self.responder = responder or self._local_response
+        self.latency = latency
+        self.calls: List[str] = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, **kwargs):
+        prompt = "\n".join(part for item in contents for part in item.get("parts", []))
+        with self._lock:
+            self.calls.append(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(text=self.responder(prompt))
+
+    def _local_response(self, prompt: str) -> str:
+        content = prompt.split("Content:\n", 1)[-1]
+        category = DocumentCategorizer().categorize_document(content)
+        todos = []
+        for item in AppointmentExtractor().extract_appointments_and_todos(content, category):
+            due = item.get('due_date')
+            todos.append({
+                'type': item['type'],
+                'title': item['title'],
+                'description': item['description'],
+                'due_date_iso': due.isoformat() if due else None,
+            })
+        return json.dumps({'category': category, 'todos': todos, 'entities': EntityExtractor().extract(content)})
+
 class GeminiAnalyzer:
-    """Use Gemini to classify document, extract todos, and entities."""
-    def __init__(self, model_name: str = "gemini-1.5-flash"):
+    """Use Gemini to classify document, extract todos, and entities.
+
+    Long texts are analyzed map-reduce style: the text is split into overlapping
+    sentence-aligned chunks, chunks are sent concurrently, and the per-chunk
+    results are merged. Chunking is tuned with GEMINI_CHUNK_SIZE,
+    GEMINI_CHUNK_OVERLAP, GEMINI_MAX_CHUNKS and GEMINI_PARALLELISM.
+
+    Past GEMINI_MAX_CHUNKS, Gemini reads an even sample of the chunks and the
+    local extractor reads the rest, so appointments deep in a long document
+    are still found.
+
+    Each call is bounded by GEMINI_TIMEOUT and the whole document by
+    GEMINI_DEADLINE, and calls go through the 'gemini' circuit breaker; if any
+    chunk fails the analysis returns None so callers use the local fallback.
+    While the breaker is half-open the first chunk is sent alone as its trial
+    call.
+    """
+    SYSTEM_PROMPT = (
+        "You are a helpful assistant that reads a document's text and returns structured JSON. "
+        "Classify into one of: Medical, Dental, Pharmacy, Insurance, Finance, ID, Legal, Other. "
+        "Extract appointments (date/time if present), reminders/deadlines, and entities like doctor/hospital/medicine/insurance numbers. "
+        "Return ONLY valid JSON with keys: category (string), todos (array of {type:'appointment'|'todo', title, description, due_date_iso|null, category}), entities (object)."
+    )
+
+    def __init__(self, model_name: str = "gemini-1.5-flash", model=None,
+                 chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                 max_chunks: Optional[int] = None, parallelism: Optional[int] = None):
         self.model_name = model_name
-        if _HAS_GEMINI:
+        if model is not None:
+            self.model = model
+        elif _HAS_GEMINI:
             self.model = genai.GenerativeModel(model_name)
         else:
             self.model = None
+        self.chunk_size = max(1000, chunk_size or _env_int('GEMINI_CHUNK_SIZE', 8000))
+        self.chunk_overlap = max(0, chunk_overlap if chunk_overlap is not None else _env_int('GEMINI_CHUNK_OVERLAP', 400))
+        self.max_chunks = max(1, max_chunks or _env_int('GEMINI_MAX_CHUNKS', 8))
+        self.parallelism = max(1, parallelism or _env_int('GEMINI_PARALLELISM', 4))
+        self.timeout = env_float('GEMINI_TIMEOUT', 20.0)
+        self.deadline_seconds = env_float('GEMINI_DEADLINE', 60.0)
+        self.breaker = get_breaker('gemini')
 
     def analyze(self, text: str, filename: str = "") -> Optional[Dict]:
-        if not _HAS_GEMINI or not self.model or not text:
+        if not self.model or not text:
+            return None
+        if self.breaker.state == OPEN:
             return None
-        system_prompt = (
-            "You are a helpful assistant that reads a document's text and returns structured JSON. "
-            "Classify into one of: Medical, Dental, Pharmacy, Insurance, Finance, ID, Legal, Other. "
-            "Extract appointments (date/time if present), reminders/deadlines, and entities like doctor/hospital/medicine/insurance numbers. "
-            "Return ONLY valid JSON with keys: category (string), todos (array of {type:'appointment'|'todo', title, description, due_date_iso|null, category}), entities (object)."
-        )
-        user_text = f"Filename: {filename}\n\nContent:\n{text[:8000]}"  # truncate to keep prompt small
+        deadline = Deadline(self.deadline_seconds)
+        chunks = chunk_text(text, self.chunk_size, self.chunk_overlap)
+        kept = _select_chunks(len(chunks), self.max_chunks)
+        selected = [chunks[i] for i in kept]
+        total = len(selected)
+
+        results = []
+        if total == 1 or self.breaker.state != CLOSED:
+            # A half-open breaker lets a single trial call through, which would reject the sibling
+            # chunks; send the first chunk alone and fan out the rest once it has closed the breaker
+            results.append(self._analyze_chunk(selected[0], filename, 1, total, deadline))
+            if results[0] is None:
+                return None
+        rest = list(enumerate(selected))[len(results):]
+        if rest:
+            with ThreadPoolExecutor(max_workers=min(self.parallelism, len(rest))) as pool:
+                results.extend(pool.map(
+                    lambda args: self._analyze_chunk(args[1], filename, args[0] + 1, total, deadline),
+                    rest
+                ))
+
+        # A partial answer would silently drop the failed chunks' todos
+        if any(r is None for r in results):
+            return None
+        if total == len(chunks):
+            return self._merge(list(zip(selected, results)))
+
+        logging.info("Gemini analysis of %s sampled %d of %d chunks; the local extractor read the rest",
+                     filename or 'document', total, len(chunks))
+        answers = dict(zip(kept, results))
+        category = self._vote(list(zip(selected, results)))
+        for i, chunk in enumerate(chunks):
+            if i not in answers:
+                answers[i] = self._analyze_chunk_locally(chunk, category)
+        return self._merge([(chunk, answers[i]) for i, chunk in enumerate(chunks)])
+
+    def _analyze_chunk_locally(self, chunk: str, category: str) -> Dict:
+        """Todos and entities for a chunk Gemini did not read; it takes no part in the category vote."""
+        return {
+            'category': category,
+            'todos': AppointmentExtractor().extract_appointments_and_todos(chunk, category),
+            'entities': EntityExtractor().extract(chunk),
+            'local': True,
+        }
+
+    def _analyze_chunk(self, chunk: str, filename: str, index: int, total: int,
+                       deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        part = f" (part {index} of {total})" if total > 1 else ""
+        user_text = f"Filename: {filename}{part}\n\nContent:\n{chunk}"
+        timeout = deadline.clamp(self.timeout) if deadline else self.timeout
+        contents = [
+            {"role": "user", "parts": [self.SYSTEM_PROMPT]},
+            {"role": "user", "parts": [user_text]}
+        ]
         try:
-            resp = self.model.generate_content([
-                {"role": "user", "parts": [system_prompt]},
-                {"role": "user", "parts": [user_text]}
-            ])
+            resp = self.breaker.call(
+                lambda: self.model.generate_content(contents, request_options={"timeout": timeout}),
+                timeout=timeout
+            )
             raw = resp.text or "{}"
             # Attempt to locate JSON in response
-            import json
             json_text = raw.strip()
             # Loose guard: extract between first { and last }
             if not json_text.startswith('{'):
@@ -72,12 +269,60 @@ class GeminiAnalyzer:
                     'due_date': self._parse_iso(item.get('due_date_iso')),
                     'category': category
                 })
-            entities = data.get('entities', {})
+            entities = data.get('entities') or {}
             return {'category': category, 'todos': todos, 'entities': entities}
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            logging.warning("Gemini analysis skipped (chunk %d/%d): %s", index, total, e)
+            return None
         except Exception as e:
-            logging.exception("Gemini analysis failed: %s", e)
+            logging.exception("Gemini analysis failed (chunk %d/%d): %s", index, total, e)
             return None
 
+    def _vote(self, parts: List[Tuple[str, Dict]]) -> str:
+        """Length-weighted category vote over Gemini's chunks; 'Other' only wins if nothing else was voted."""
+        votes: Dict[str, float] = {}
+        for chunk, result in parts:
+            if not result.get('local'):
+                votes[result['category']] = votes.get(result['category'], 0.0) + len(chunk)
+        specific = {k: v for k, v in votes.items() if k != 'Other'}
+        pool = specific or votes
+        # max() keeps the first-seen category on ties, i.e. the earliest chunk wins
+        return max(pool, key=pool.get)
+
+    def _merge(self, parts: List[Tuple[str, Dict]]) -> Dict:
+        """Reduce per-chunk results into one answer."""
+        category = self._vote(parts)
+
+        todos: List[Dict] = []
+        seen = set()
+        for _, result in parts:
+            for item in result['todos']:
+                due = item['due_date'].date() if item.get('due_date') else None
+                keys = {('t', item['type'], due, _normalize_phrase(item['title']))} if item['title'] not in ('Task', '') else set()
+                description = _normalize_phrase(item['description'])
+                if description:
+                    keys.add(('d', item['type'], due, description))
+                if not keys:
+                    keys.add(('i', item['type'], due, ''))
+                if keys & seen:
+                    continue
+                seen |= keys
+                todos.append(dict(item, category=category))
+
+        entities: Dict[str, object] = {}
+        for _, result in parts:
+            if not isinstance(result['entities'], dict):
+                continue
+            for key, value in result['entities'].items():
+                values = value if isinstance(value, list) else [value]
+                merged = entities.setdefault(key, [])
+                for v in values:
+                    if v not in (None, '', [], {}) and v not in merged:
+                        merged.append(v)
+        entities = {k: (v[0] if len(v) == 1 else v) for k, v in entities.items() if v}
+
+        return {'category': category, 'todos': todos, 'entities': entities}
+
     def _parse_iso(self, iso_str: Optional[str]) -> Optional[datetime]:
         if not iso_str:
             return None
@@ -355,23 +600,97 @@ class AppointmentExtractor:
         
         return None
 
+class EntityExtractor:
+    """Pattern-based doctor, hospital, medicine and insurance number extraction.
+
+    Used when Gemini is off or returns no entities; the result has the same
+    shape as Gemini's `entities` object ({kind: [value, ...]}).
+    """
+
+    DOCTOR_PATTERNS = [
+        re.compile(r"\b(?:Dr\.?|Doctor)\s+((?:[A-Z][a-zA-Z'-]+|[A-Z]\.)(?:\s+(?:[A-Z][a-zA-Z'-]+|[A-Z]\.)){0,2})"),
+        re.compile(r"\b([A-Z][a-z'-]+(?:\s+[A-Z]\.)?\s+[A-Z][a-z'-]+),?\s+(?:M\.?D|D\.?D\.?S|D\.?M\.?D|D\.?O|N\.?P|P\.?A)\b\.?"),
+    ]
+    HOSPITAL_PATTERN = re.compile(
+        r"\b((?:(?:St\.|[A-Z][\w'&-]*)\s+){1,4}"
+        r"(?:Hospital|Medical Center|Medical Centre|Clinic|Health Center|Health System|Healthcare|"
+        r"Urgent Care|Dental Care|Dental Group|Dental Office|Pharmacy))\b"
+    )
+    MEDICINE_PATTERNS = [
+        re.compile(r"\b([A-Za-z][a-z]{3,})\s+\d+(?:\.\d+)?\s?(?:mg|mcg|ml|g|iu|units?)\b", re.IGNORECASE),
+        re.compile(r"\b(?:Rx|Medication|Medicine|Prescription|Drug)\s*[:#-]\s*([A-Za-z][A-Za-z-]{2,}(?:\s+[A-Za-z][a-z-]{2,})?)"),
+    ]
+    MEDICINE_STOPWORDS = {
+        'take', 'takes', 'taking', 'dose', 'doses', 'dosage', 'daily', 'with', 'tablet', 'tablets', 'capsule',
+        'capsules', 'strength', 'total', 'inject', 'each', 'every', 'about', 'weight', 'refill', 'refills',
+        'quantity', 'supply', 'only', 'once', 'twice', 'amount', 'than', 'least', 'over',
+    }
+    INSURANCE_NUMBER_PATTERN = re.compile(
+        r"\b(?:policy|member|subscriber|group|insurance|claim)\s*(?:number|no\.?|#|id)?\s*[:#]\s*([A-Z0-9][A-Z0-9-]{4,24})\b",
+        re.IGNORECASE
+    )
+
+    def extract(self, text: str) -> Dict[str, List[str]]:
+        if not text:
+            return {}
+        found: Dict[str, List[str]] = {}
+
+        def add(kind, value):
+            value = ' '.join(value.split()).strip(' .,;:-')
+            if value and value not in found.setdefault(kind, []):
+                found[kind].append(value)
+
+        for pattern in self.DOCTOR_PATTERNS:
+            for match in pattern.finditer(text):
+                add('doctor', f"Dr. {match.group(1)}")
+        for match in self.HOSPITAL_PATTERN.finditer(text):
+            add('hospital', match.group(1))
+        for pattern in self.MEDICINE_PATTERNS:
+            for match in pattern.finditer(text):
+                name = match.group(1)
+                if name.split()[0].lower() not in self.MEDICINE_STOPWORDS:
+                    add('medicine', name)
+        for match in self.INSURANCE_NUMBER_PATTERN.finditer(text):
+            if any(ch.isdigit() for ch in match.group(1)):
+                add('insurance_number', match.group(1))
+        return {kind: values for kind, values in found.items() if values}
+
+ANALYSIS_SECONDS = metrics.histogram(
+    'flik_analysis_seconds', 'Document analysis time by analyzer tier and outcome', ('tier', 'outcome'))
+
+
 class AIProcessor:
     """Main AI processor that combines categorization and appointment extraction"""
     
-    def __init__(self):
+    def __init__(self, gemini: Optional[GeminiAnalyzer] = None):
         self.categorizer = DocumentCategorizer()
         self.extractor = AppointmentExtractor()
-        self.gemini = GeminiAnalyzer() if _HAS_GEMINI else None
+        self.entity_extractor = EntityExtractor()
+        self.gemini = gemini or (GeminiAnalyzer() if _HAS_GEMINI else None)
     
-    def process_document(self, text: str, filename: str = "") -> Tuple[str, List[Dict]]:
-        """Process a document and return category and extracted todos/appointments"""
+    def analyze_document(self, text: str, filename: str = "") -> Dict:
+        """Category, todos/appointments and entities ({kind: [value, ...]}) for a document"""
         if self.gemini:
+            started = time.perf_counter()
             result = self.gemini.analyze(text, filename)
+            ANALYSIS_SECONDS.labels(tier='gemini', outcome='ok' if result else 'failed').observe(
+                time.perf_counter() - started)
             if result:
-                category = result.get('category') or 'Other'
-                todos = result.get('todos') or []
-                return category, todos
+                return {
+                    'category': result.get('category') or 'Other',
+                    'todos': result.get('todos') or [],
+                    'entities': result.get('entities') or self.entity_extractor.extract(text),
+                }
+            if text:
+                record_fallback('gemini')
         # Fallback to local logic
-        category = self.categorizer.categorize_document(text, filename)
-        appointments_todos = self.extractor.extract_appointments_and_todos(text, category)
-        return category, appointments_todos
+        with metrics.timer(ANALYSIS_SECONDS, tier='local', outcome='ok'):
+            category = self.categorizer.categorize_document(text, filename)
+            appointments_todos = self.extractor.extract_appointments_and_todos(text, category)
+            entities = self.entity_extractor.extract(text)
+        return {'category': category, 'todos': appointments_todos, 'entities': entities}
+
+    def process_document(self, text: str, filename: str = "") -> Tuple[str, List[Dict]]:
+        """Process a document and return category and extracted todos/appointments"""
+        result = self.analyze_document(text, filename)
+        return result['category'], result['todos']
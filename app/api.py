@@ -0,0 +1,419 @@
+"""JSON API, version 1 (mounted at /api/v1).
+
+It uses the same session login as the HTML pages. The conventions:
+- Lists are keyset-paginated. Pass the `next_cursor` of one page as `cursor` to get the next.
+- `fields=` selects which keys to return. It can also add keys that are omitted by default (extracted_text, content_hash, page_count, todos, entities).
+- GET responses carry an ETag and honour If-None-Match.
+- `ids=1,2,3` fetches many records in one call. PATCH on a collection updates many records at once, and DELETE with {"ids": [...]} deletes them, each in one transaction.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy.orm import defer, selectinload
+
+from app import bulk, entities, events, scoping
+from app.cache import get_cache
+from app.ingest import allowed_file, ingest_upload
+from app.models import Document, DocumentPage, Todo, db
+from app.renditions import RENDITIONS, can_render, rendition_key
+from app.storage import get_storage
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_BATCH = 500
+
+DOCUMENT_UPDATABLE = {'category'}
+TODO_UPDATABLE = {'title', 'description', 'due_date', 'category', 'is_completed'}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api_bp.errorhandler(ApiError)
+def _api_error(error):
+    return jsonify({'error': error.message}), error.status
+
+
+@api_bp.errorhandler(404)
+def _not_found(error):
+    return jsonify({'error': 'not found'}), 404
+
+
+@api_bp.before_request
+def _require_login():
+    if not current_user.is_authenticated:
+        return jsonify({'error': 'authentication required'}), 401
+
+
+# ---------------------------------------------------------------------------
+# helpers
+
+def _conditional(payload, status=200):
+    """JSON response with a body-hash ETag; answers If-None-Match with 304."""
+    response = jsonify(payload)
+    response.status_code = status
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _requested_fields():
+    raw = request.args.get('fields', '')
+    return {f.strip() for f in raw.split(',') if f.strip()} or None
+
+
+def _limit():
+    return min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+
+
+def _ids_param():
+    raw = request.args.get('ids')
+    if raw is None:
+        return None
+    try:
+        ids = [int(x) for x in raw.split(',') if x.strip()]
+    except ValueError:
+        raise ApiError('ids must be comma-separated integers')
+    if len(ids) > MAX_BATCH:
+        raise ApiError(f'at most {MAX_BATCH} ids per request')
+    return ids
+
+
+def _encode_cursor(last_id):
+    return base64.urlsafe_b64encode(json.dumps({'id': last_id}).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))['id'])
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise ApiError('invalid cursor')
+
+
+def _paginate(query, id_column, serialize):
+    """Keyset pagination on the id column. The order is `order=desc` (default) or `asc`."""
+    ascending = request.args.get('order', 'desc') == 'asc'
+    after = _decode_cursor(request.args.get('cursor'))
+    if after is not None:
+        query = query.filter(id_column > after if ascending else id_column < after)
+    limit = _limit()
+    rows = query.order_by(id_column.asc() if ascending else id_column.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+    return {'data': [serialize(r) for r in rows[:limit]], 'next_cursor': next_cursor}
+
+
+def _by_ids(model, ids, serialize, query):
+    rows = {r.id: r for r in query.filter(model.id.in_(ids)).all()} if ids else {}
+    return {
+        'data': [serialize(rows[i]) for i in ids if i in rows],
+        'missing': [i for i in ids if i not in rows],
+    }
+
+
+def _select(payload, fields):
+    if not fields:
+        return payload
+    return {k: v for k, v in payload.items() if k in fields or k == 'id'}
+
+
+def _document_query(fields):
+    query = scoping.documents().options(defer(Document.minhash))
+    if not fields or 'extracted_text' not in fields:
+        query = query.options(defer(Document.extracted_text))
+    if fields and 'todos' in fields:
+        query = query.options(selectinload(Document.todos))
+    return query
+
+
+def _document_payload(document, fields):
+    payload = document.to_dict()
+    if fields:
+        if 'extracted_text' in fields:
+            payload['extracted_text'] = document.extracted_text
+        if 'content_hash' in fields:
+            payload['content_hash'] = document.content_hash
+        if 'duplicate_score' in fields:
+            payload['duplicate_score'] = document.duplicate_score
+        if 'page_count' in fields:
+            payload['page_count'] = document.pages.count()
+        if 'todos' in fields:
+            payload['todos'] = [t.to_dict() for t in document.todos]
+        if 'entities' in fields:
+            payload['entities'] = [e.to_dict() for e in document.entities]
+    return _select(payload, fields)
+
+
+def _todo_payload(todo, fields):
+    return _select(todo.to_dict(), fields)
+
+
+def _json_body(key):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get(key), list):
+        raise ApiError(f'expected a JSON object with a "{key}" list')
+    items = body[key]
+    if len(items) > MAX_BATCH:
+        raise ApiError(f'at most {MAX_BATCH} items per request')
+    return items
+
+
+def _id_list():
+    ids = _json_body('ids')
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ApiError('"ids" must be a list of integers')
+    return ids
+
+
+def _parse_due_date(value):
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ApiError(f'invalid due_date: {value!r}')
+
+
+def _apply_updates(model, query, items, allowed, apply):
+    """Shared body of the batch PATCH endpoints; returns (updated_ids, missing_ids)."""
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+            raise ApiError('every update needs an integer "id"')
+        unknown = set(item) - allowed - {'id'}
+        if unknown:
+            raise ApiError(f'cannot update: {", ".join(sorted(unknown))}')
+    rows = {r.id: r for r in query.filter(model.id.in_([i['id'] for i in items])).all()}
+    updated, missing = [], []
+    for item in items:
+        row = rows.get(item['id'])
+        if row is None:
+            missing.append(item['id'])
+            continue
+        apply(row, item)
+        updated.append(row.id)
+    db.session.commit()
+    return updated, missing
+
+
+# ---------------------------------------------------------------------------
+# documents
+
+@api_bp.route('/documents')
+def list_documents():
+    fields = _requested_fields()
+    query = _document_query(fields)
+    serialize = lambda d: _document_payload(d, fields)
+    ids = _ids_param()
+    if ids is not None:
+        return _conditional(_by_ids(Document, ids, serialize, query))
+    if request.args.get('category'):
+        query = query.filter(Document.category == request.args['category'])
+    if request.args.get('file_type'):
+        query = query.filter(Document.file_type == request.args['file_type'].lower())
+    selected = entities.parse_selection(request.args.getlist('entity'))
+    if selected:
+        query = entities.filter_documents(query, selected, current_user.id)
+    return _conditional(_paginate(query, Document.id, serialize))
+
+
+@api_bp.route('/facets')
+def list_facets():
+    """Entity facet counts: {"doctor": [{"value", "normalized", "count"}, ...], ...}.
+
+    Takes the same category/file_type/entity filters as /documents.
+    """
+    limit = min(max(request.args.get('limit', entities.FACET_LIMIT, type=int), 1), MAX_LIMIT)
+    user_id = current_user.id
+    query = scoping.documents()
+    if request.args.get('category'):
+        query = query.filter(Document.category == request.args['category'])
+    if request.args.get('file_type'):
+        query = query.filter(Document.file_type == request.args['file_type'].lower())
+    selected = entities.parse_selection(request.args.getlist('entity'))
+    if selected:
+        query = entities.filter_documents(query, selected, user_id)
+    if selected or request.args.get('category') or request.args.get('file_type'):
+        facets = entities.facet_counts(user_id, query.with_entities(Document.id), limit)
+    else:
+        facets = get_cache().get_or_set('entities', user_id, f'facets:{limit}',
+                                        lambda: entities.facet_counts(user_id, limit=limit))
+    return _conditional({
+        kind: [{'value': value, 'normalized': normalized, 'count': count} for normalized, value, count in values]
+        for kind, values in facets.items()
+    })
+
+
+@api_bp.route('/documents/<int:document_id>')
+def get_document(document_id):
+    fields = _requested_fields()
+    document = _document_query(fields).filter(Document.id == document_id).first_or_404()
+    return _conditional(_document_payload(document, fields))
+
+
+@api_bp.route('/documents', methods=['PATCH'])
+def update_documents():
+    """Body: {"updates": [{"id": 1, "category": "Medical"}, ...]}"""
+    def apply(document, item):
+        if 'category' in item:
+            document.category = str(item['category'] or 'Other')
+
+    updated, missing = _apply_updates(Document, scoping.documents(), _json_body('updates'), DOCUMENT_UPDATABLE, apply)
+    if updated:
+        events.fire(events.document_recategorized, user_id=current_user.id, document_ids=updated)
+    return jsonify({'updated': updated, 'missing': missing})
+
+
+@api_bp.route('/documents', methods=['DELETE'])
+def delete_documents():
+    """Body: {"ids": [1, 2, 3]}; files are removed after commit by the storage GC queue."""
+    deleted, missing = bulk.delete_documents(scoping.documents(), _id_list())
+    if deleted:
+        events.fire(events.document_deleted, user_id=current_user.id, document_ids=deleted)
+    return jsonify({'deleted': deleted, 'missing': missing})
+
+
+# ---------------------------------------------------------------------------
+# todos
+
+@api_bp.route('/todos')
+def list_todos():
+    fields = _requested_fields()
+    serialize = lambda t: _todo_payload(t, fields)
+    ids = _ids_param()
+    if ids is not None:
+        return _conditional(_by_ids(Todo, ids, serialize, scoping.todos()))
+    query = scoping.todos()
+    completed = request.args.get('completed')
+    if completed is not None:
+        query = query.filter(Todo.is_completed == (completed.lower() in ('1', 'true', 'yes')))
+    if request.args.get('document_id'):
+        query = query.filter(Todo.document_id == request.args.get('document_id', type=int))
+    if request.args.get('due_after'):
+        query = query.filter(Todo.due_date >= _parse_due_date(request.args['due_after']))
+    if request.args.get('due_before'):
+        query = query.filter(Todo.due_date < _parse_due_date(request.args['due_before']))
+    return _conditional(_paginate(query, Todo.id, serialize))
+
+
+@api_bp.route('/todos/<int:todo_id>')
+def get_todo(todo_id):
+    return _conditional(_todo_payload(scoping.todo_or_404(todo_id), _requested_fields()))
+
+
+@api_bp.route('/todos', methods=['PATCH'])
+def update_todos():
+    """Body: {"updates": [{"id": 7, "is_completed": true}, {"id": 8, "due_date": "2025-03-14"}]}"""
+    def apply(todo, item):
+        if 'title' in item:
+            if not str(item['title'] or '').strip():
+                raise ApiError(f'todo {todo.id}: title cannot be empty')
+            todo.title = str(item['title']).strip()
+        if 'description' in item:
+            todo.description = item['description']
+        if 'category' in item:
+            todo.category = str(item['category'] or 'Other')
+        if 'due_date' in item:
+            todo.due_date = _parse_due_date(item['due_date'])
+        if 'is_completed' in item:
+            todo.is_completed = bool(item['is_completed'])
+
+    try:
+        updated, missing = _apply_updates(Todo, scoping.todos(), _json_body('updates'), TODO_UPDATABLE, apply)
+    except ApiError:
+        db.session.rollback()
+        raise
+    if updated:
+        events.fire(events.todo_updated, user_id=current_user.id, todo_ids=updated)
+    return jsonify({'updated': updated, 'missing': missing})
+
+
+@api_bp.route('/todos', methods=['DELETE'])
+def delete_todos():
+    """Body: {"ids": [7, 8]}"""
+    deleted, missing = bulk.delete_todos(scoping.todos(), _id_list())
+    if deleted:
+        events.fire(events.todo_deleted, user_id=current_user.id, todo_ids=deleted)
+    return jsonify({'deleted': deleted, 'missing': missing})
+
+
+# ---------------------------------------------------------------------------
+# search
+
+@api_bp.route('/search')
+def search():
+    from app.routes import search_page_hits
+
+    query_text = request.args.get('q', '').strip()
+    if not query_text:
+        raise ApiError('q is required')
+    fields = _requested_fields()
+    query = _document_query(fields).filter(
+        (Document.filename.contains(query_text)) |
+        (Document.original_filename.contains(query_text)) |
+        (Document.extracted_text.contains(query_text))
+    )
+    result = _paginate(query, Document.id, lambda d: _document_payload(d, fields))
+    hits = search_page_hits(query_text, [d['id'] for d in result['data']])
+    for item in result['data']:
+        item['pages'] = hits.get(item['id'], [])
+    result['query'] = query_text
+    return _conditional(result)
+
+
+# ---------------------------------------------------------------------------
+# uploads
+
+def upload_status_payload(document):
+    storage = get_storage()
+    renditions = {}
+    if can_render(document.file_type):
+        renditions = {kind: storage.exists(rendition_key(document.file_path, kind)) for kind in RENDITIONS}
+    pages = db.session.query(DocumentPage.extraction_method, db.func.count(DocumentPage.id)).filter(
+        DocumentPage.document_id == document.id).group_by(DocumentPage.extraction_method).all()
+    return {
+        'document_id': document.id,
+        'status': 'complete',
+        'extraction': {
+            'pages': sum(n for _, n in pages),
+            'methods': sorted(m for m, _ in pages if m),
+            'has_text': bool(document.has_text),
+        },
+        'analysis': {'category': document.category, 'todos': len(document.todos)},
+        'duplicate_of_id': document.duplicate_of_id,
+        'renditions': renditions,
+        'document_url': url_for('api.get_document', document_id=document.id),
+    }
+
+
+@api_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """Multipart upload (field "file"); runs the same pipeline as the upload form."""
+    file = request.files.get('file')
+    if file is None or not file.filename:
+        raise ApiError('no file uploaded')
+    if not allowed_file(file.filename):
+        raise ApiError('file type not allowed', 415)
+    result = ingest_upload(file, current_user.id)
+    payload = upload_status_payload(result.document)
+    response = jsonify(payload)
+    response.status_code = 201
+    response.headers['Location'] = url_for('api.upload_status', document_id=result.document.id)
+    return response
+
+
+@api_bp.route('/uploads/<int:document_id>')
+def upload_status(document_id):
+    document = _document_query(None).filter(Document.id == document_id).first_or_404()
+    return _conditional(upload_status_payload(document))
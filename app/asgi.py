@@ -0,0 +1,291 @@
+"""Optional ASGI serving mode.
+
+Uploads spend most of their time waiting on Document AI, Gemini, OCR and
+storage, which pins a sync worker for seconds at a time. Under an ASGI server
+the two upload endpoints, the HTML form (POST /upload) and the JSON API
+(POST /api/v1/uploads), are handled here as coroutines:
+
+- waiting work (spooling, Document AI, OCR, Gemini, storage, the database
+  write) runs on a bounded thread pool, ASGI_IO_THREADS per process
+- CPU-bound extraction (pdfplumber, TXT, DOCX) runs in the extraction
+  sandbox (app.sandbox), waited on from the thread pool; with
+  EXTRACT_SANDBOX off it runs on a process pool of ASGI_CPU_WORKERS per
+  process instead. Either way it does not hold the GIL against the event loop
+
+Both run the same ingest stages as the sync path, so responses, metrics and
+events are unchanged. Every other request, including all HTML pages, goes to
+the Flask app through a WSGI adapter; requests without a session user also
+fall through, so Flask-Login handles redirects, 401s and remember-me cookies.
+
+    uvicorn asgi:application --workers 2
+
+Needs starlette and python-multipart; a2wsgi is used for the WSGI bridge when
+installed.
+"""
+import asyncio
+import multiprocessing
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import flash, redirect, session, url_for
+from itsdangerous import BadSignature
+
+from app import create_app
+from app import ingest
+from app import sandbox
+from app.api import upload_status_payload
+from app.models import User, db
+from app.utils import extract_pages_locally, extract_pages_with_document_ai, record_extraction
+
+try:
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, Response
+    _HAS_STARLETTE = True
+except ImportError:
+    _HAS_STARLETTE = False
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    try:
+        from starlette.middleware.wsgi import WSGIMiddleware
+    except ImportError:
+        WSGIMiddleware = None
+
+# OCR shells out to tesseract (or sleeps, for the fake backend), so a thread is enough
+THREAD_EXTRACTED_TYPES = {'png', 'jpg', 'jpeg'}
+
+
+class AsyncUploads:
+    """ASGI app: async upload handlers in front of the mounted Flask app."""
+
+    def __init__(self, flask_app):
+        if not _HAS_STARLETTE or WSGIMiddleware is None:
+            raise RuntimeError('ASGI mode needs starlette (pip install starlette python-multipart uvicorn)')
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app)
+        self.io_pool = ThreadPoolExecutor(max_workers=flask_app.config['ASGI_IO_THREADS'],
+                                          thread_name_prefix='flik-io')
+        self.sandboxed = 'flik_sandbox' in flask_app.extensions
+        # The sandbox has its own worker processes
+        cpu_workers = 0 if self.sandboxed else flask_app.config['ASGI_CPU_WORKERS']
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        self.cpu_pool = ProcessPoolExecutor(max_workers=cpu_workers,
+                                            mp_context=multiprocessing.get_context('spawn')) if cpu_workers else None
+        with flask_app.test_request_context():
+            self.routes = {
+                url_for('main.upload_file'): self.upload_form,
+                url_for('api.create_upload'): self.upload_api,
+            }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        handler = self.routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'POST' else None
+        if handler is not None:
+            limit = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+            request = Request(scope, _limit_body(receive, limit) if limit else receive)
+            user_id = await self.io(self._session_user_id, request.cookies)
+            if user_id is not None:
+                response = await handler(request, user_id)
+                await response(scope, receive, send)
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        self.io_pool.shutdown(wait=False)
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown(wait=False)
+        if self.sandboxed:
+            self.flask_app.extensions['flik_sandbox'].close()
+
+    # -----------------------------------------------------------------------
+    # executors
+
+    def _in_context(self, fn, args):
+        with self.flask_app.test_request_context():
+            return fn(*args)
+
+    async def io(self, fn, *args):
+        """Run fn(*args) on the I/O thread pool, inside an app and request context."""
+        return await asyncio.get_running_loop().run_in_executor(self.io_pool, self._in_context, fn, args)
+
+    async def cpu(self, fn, *args):
+        """Run fn(*args) in a worker process (or the I/O pool when ASGI_CPU_WORKERS=0)."""
+        if self.cpu_pool is None:
+            return await self.io(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.cpu_pool, fn, *args)
+
+    # -----------------------------------------------------------------------
+    # session
+
+    def _session_user_id(self, cookies):
+        """The Flask-Login user id in the signed session cookie, if that user exists."""
+        app = self.flask_app
+        cookie = cookies.get(app.config['SESSION_COOKIE_NAME'])
+        serializer = app.session_interface.get_signing_serializer(app)
+        if not cookie or serializer is None:
+            return None
+        try:
+            data = serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+        try:
+            user_id = int(data.get('_user_id'))
+        except (TypeError, ValueError):
+            return None
+        return user_id if db.session.get(User, user_id) is not None else None
+
+    # -----------------------------------------------------------------------
+    # pipeline
+
+    async def _ingest(self, upload_file, user_id):
+        """Run the ingest stages up to analysis for a Starlette UploadFile; returns the PendingUpload."""
+        upload = await self.io(ingest.begin, upload_file.filename, upload_file.content_type, user_id)
+        try:
+            with ingest.stage(upload, 'save'):
+                await self.io(_spool, upload_file.file, upload.tmp_path)
+            await self.io(ingest.hash_file, upload)
+            await self._extract(upload)
+            await self.io(ingest.store, upload)
+        except Exception:
+            ingest.failed(upload)
+            raise
+        finally:
+            await self.io(ingest.discard, upload)
+        await self.io(ingest.analyze, upload)
+        return upload
+
+    async def _extract(self, upload):
+        with ingest.stage(upload, 'extract'):
+            started = time.perf_counter()
+            pages = []
+            if upload.file_type == 'pdf':
+                pages = await self.io(extract_pages_with_document_ai, upload.tmp_path)
+            if not any(p['text'] for p in pages) and self.sandboxed:
+                pages = await self.io(sandbox.extract_pages, upload.tmp_path, upload.file_type)
+            elif not any(p['text'] for p in pages):
+                run = self.io if upload.file_type in THREAD_EXTRACTED_TYPES else self.cpu
+                pages = await run(extract_pages_locally, upload.tmp_path, upload.file_type)
+            record_extraction(upload.file_type, pages, started)
+            ingest.set_pages(upload, pages)
+
+    async def _read_upload(self, request):
+        """(UploadFile or None, error message, status) from a multipart request."""
+        limit = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+        length = request.headers.get('content-length')
+        if limit and length and length.isdigit() and int(length) > limit:
+            return None, 'file too large', 413
+        try:
+            form = await request.form()
+        except _BodyTooLarge:
+            # Chunked bodies have no Content-Length; the receive wrapper counts them instead
+            return None, 'file too large', 413
+        upload_file = form.get('file')
+        if upload_file is None or isinstance(upload_file, str):
+            return None, 'no file uploaded', 400
+        if not upload_file.filename:
+            return None, 'no selected file', 400
+        if not ingest.allowed_file(upload_file.filename):
+            return None, 'file type not allowed', 415
+        return upload_file, None, 200
+
+    # -----------------------------------------------------------------------
+    # handlers
+
+    async def upload_api(self, request, user_id):
+        """POST /api/v1/uploads; same response as api.create_upload."""
+        upload_file, error, status = await self._read_upload(request)
+        if upload_file is None:
+            return JSONResponse({'error': error}, status_code=status)
+        upload = await self._ingest(upload_file, user_id)
+        payload, location = await self.io(_record_api, upload)
+        return JSONResponse(payload, status_code=201, headers={'Location': location})
+
+    async def upload_form(self, request, user_id):
+        """POST /upload; flashes and redirects like routes.upload_file."""
+        upload_file, error, status = await self._read_upload(request)
+        if upload_file is None:
+            message = {'no file uploaded': 'No file part', 'no selected file': 'No selected file',
+                       'file type not allowed': 'File type not allowed'}.get(error, error)
+            return await self._flash_redirect(request, [(message, 'error')], str(request.url))
+        upload = await self._ingest(upload_file, user_id)
+        filename, original_filename = await self.io(_record_form, upload)
+        if original_filename:
+            message = f"Uploaded: {filename} (near-duplicate of {original_filename})"
+        else:
+            message = f"Uploaded: {filename}"
+        return await self._flash_redirect(request, [(message, 'success')], None)
+
+    async def _flash_redirect(self, request, messages, location):
+        """Redirect with flashed messages, saved through Flask's own session interface."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.io_pool, self._build_flash_redirect, request.headers.get('cookie'), messages, location)
+
+    def _build_flash_redirect(self, cookie_header, messages, location):
+        app = self.flask_app
+        with app.test_request_context(headers={'Cookie': cookie_header} if cookie_header else {}):
+            for message, category in messages:
+                flash(message, category)
+            response = redirect(location or url_for('main.index'))
+            app.session_interface.save_session(app, session, response)
+        return _to_starlette(response)
+
+
+class _BodyTooLarge(Exception):
+    """The request body grew past MAX_CONTENT_LENGTH while it was being received."""
+
+
+def _limit_body(receive, limit):
+    """Wrap an ASGI receive callable so it raises _BodyTooLarge once more than limit body bytes arrive."""
+    received = 0
+
+    async def limited():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise _BodyTooLarge(f'request body exceeds {limit} bytes')
+        return message
+    return limited
+
+
+def _spool(source, path):
+    source.seek(0)
+    with open(path, 'wb') as out:
+        shutil.copyfileobj(source, out, 1024 * 1024)
+
+
+def _record_api(upload):
+    document = ingest.finish(upload).document
+    return upload_status_payload(document), url_for('api.upload_status', document_id=document.id)
+
+
+def _record_form(upload):
+    result = ingest.finish(upload)
+    return result.document.filename, result.original.original_filename if result.original else None
+
+
+def _to_starlette(response):
+    converted = Response(response.get_data(), status_code=response.status_code)
+    converted.raw_headers = [(key.lower().encode('latin-1'), value.encode('latin-1'))
+                             for key, value in response.headers.items()]
+    return converted
+
+
+def create_asgi_app(flask_app=None):
+    """Wrap `flask_app` (default: create_app()) for an ASGI server."""
+    return AsyncUploads(flask_app or create_app())
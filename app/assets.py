@@ -0,0 +1,119 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask assets build` copies every file under app/static into app/static/dist
+with a content hash in its name (css/style.css -> css/style.3f9a1c2b7d.css),
+writes .gz and, when the brotli package is installed, .br siblings for
+compressible types, and records the mapping in dist/manifest.json.
+
+Templates call asset_url('css/style.css'). With a manifest present this points
+at /assets/<fingerprinted name>, which negotiates the precompressed variant and
+is cacheable for a year; without one it falls back to the plain static URL.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+    _HAS_BROTLI = True
+except Exception:
+    _HAS_BROTLI = False
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+MIN_COMPRESS_BYTES = 256
+ONE_YEAR = 365 * 24 * 3600
+
+
+def _fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:10]
+
+
+def build_assets(static_folder):
+    """Write fingerprinted and compressed copies of the static files; returns the manifest."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != dist]
+        for filename in filenames:
+            source = os.path.join(dirpath, filename)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            base, ext = os.path.splitext(logical)
+            hashed = f"{base}.{_fingerprint(source)}{ext}"
+            target = os.path.join(dist, *hashed.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+
+            if ext.lower() in COMPRESSIBLE and os.path.getsize(source) >= MIN_COMPRESS_BYTES:
+                with open(source, 'rb') as f:
+                    data = f.read()
+                # mtime=0 keeps the .gz byte-identical across builds
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if _HAS_BROTLI:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[logical] = hashed
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app):
+    manifest = _load_manifest(app.static_folder)
+
+    def asset_url(filename):
+        hashed = manifest.get(filename)
+        if hashed:
+            return url_for('serve_asset', filename=hashed)
+        return url_for('static', filename=filename)
+
+    def serve_asset(filename):
+        dist = os.path.join(app.static_folder, DIST_DIR)
+        path = os.path.abspath(os.path.join(dist, filename))
+        if not path.startswith(os.path.abspath(dist) + os.sep) or not os.path.isfile(path):
+            abort(404)
+
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.isfile(path + suffix):
+                encoding = candidate
+                break
+        body_path = path + ('.br' if encoding == 'br' else '.gz' if encoding == 'gzip' else '')
+
+        response = send_file(body_path, mimetype=_mimetype(filename), conditional=True,
+                             etag=f"{os.path.basename(filename)}-{encoding or 'identity'}",
+                             max_age=ONE_YEAR)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+        return response
+
+    app.add_url_rule('/assets/<path:filename>', 'serve_asset', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
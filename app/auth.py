@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User
-from app import db
+from app import db, identity
 
 auth_bp = Blueprint('auth', __name__, template_folder='templates')
 
@@ -35,6 +35,7 @@ def signup():
         user.set_password(password)
         db.session.add(user)
         db.session.commit()
+        identity.remember(user)
         login_user(user)
         flash('Welcome to Flik.ai!', 'success')
         return redirect(url_for('main.index'))
@@ -49,6 +50,7 @@ def login():
         
         user = User.query.filter_by(email=email).first()
         if user and user.check_password(password):
+            identity.remember(user)
             login_user(user)
             flash('Logged in successfully', 'success')
             next_url = request.args.get('next') or url_for('main.index')
@@ -62,11 +64,11 @@ def login():
 @auth_bp.route('/profile')
 @login_required
 def profile():
-    from app.models import Document, Todo
+    from app import scoping
     
     # Get user statistics
-    total_documents = Document.query.count()
-    total_todos = Todo.query.count()
+    total_documents = scoping.documents().count()
+    total_todos = scoping.todos().count()
     
     return render_template('profile.html', 
                          total_documents=total_documents,
@@ -90,15 +92,15 @@ def edit_profile():
             flash('An account with that email already exists', 'error')
             return redirect(url_for('auth.edit_profile'))
         
-        # Update user fields, handling cases where columns might not exist
-        if hasattr(current_user, 'first_name'):
-            current_user.first_name = first_name
-        if hasattr(current_user, 'last_name'):
-            current_user.last_name = last_name
-        current_user.email = email
-        current_user.name = f"{first_name} {last_name}"  # Update for backward compatibility
+        # current_user is a cached snapshot (see app.identity); change the row itself
+        user = db.session.get(User, current_user.id)
+        user.first_name = first_name
+        user.last_name = last_name
+        user.email = email
+        user.name = f"{first_name} {last_name}"  # Update for backward compatibility
         
         db.session.commit()
+        identity.remember(user)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('auth.profile'))
     
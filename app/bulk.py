@@ -0,0 +1,64 @@
+"""Batch operations on documents and todos.
+
+Each function takes a scoped base query (see app.scoping) and a list of ids.
+It applies the change to every matching row in one transaction and commits.
+It returns (ids changed, ids not found). Callers fire the matching event.
+
+Deleting documents never touches storage here: the files are queued in the
+same transaction and removed later by app.garbage.
+"""
+from app import garbage
+from app.models import Document, DocumentEntity, DocumentLSHBand, DocumentPage, Todo, db
+
+
+def _split(found, ids):
+    found = set(found)
+    return [i for i in ids if i in found], [i for i in ids if i not in found]
+
+
+def delete_documents(query, ids):
+    rows = query.filter(Document.id.in_(ids)).with_entities(
+        Document.id, Document.file_path, Document.file_type).all()
+    deleted, missing = _split([row.id for row in rows], ids)
+    if not rows:
+        return deleted, missing
+    found = [row.id for row in rows]
+    # Todos outlive their source document; near-duplicates lose their link
+    Todo.query.filter(Todo.document_id.in_(found)).update(
+        {Todo.document_id: None}, synchronize_session=False)
+    Document.query.filter(Document.duplicate_of_id.in_(found)).update(
+        {Document.duplicate_of_id: None, Document.duplicate_score: None}, synchronize_session=False)
+    DocumentPage.query.filter(DocumentPage.document_id.in_(found)).delete(synchronize_session=False)
+    DocumentLSHBand.query.filter(DocumentLSHBand.document_id.in_(found)).delete(synchronize_session=False)
+    DocumentEntity.query.filter(DocumentEntity.document_id.in_(found)).delete(synchronize_session=False)
+    Document.query.filter(Document.id.in_(found)).delete(synchronize_session=False)
+    garbage.enqueue(key for row in rows for key in garbage.document_keys(row.file_path, row.file_type))
+    db.session.commit()
+    db.session.expire_all()
+    return deleted, missing
+
+
+def recategorize_documents(query, ids, category):
+    found = [i for (i,) in query.filter(Document.id.in_(ids)).with_entities(Document.id)]
+    if found:
+        Document.query.filter(Document.id.in_(found)).update(
+            {Document.category: category}, synchronize_session=False)
+        db.session.commit()
+    return _split(found, ids)
+
+
+def set_todos_completed(query, ids, completed):
+    # Loaded rather than bulk-updated so the reminder schedule listener runs
+    todos = query.filter(Todo.id.in_(ids)).all()
+    for todo in todos:
+        todo.is_completed = completed
+    db.session.commit()
+    return _split([todo.id for todo in todos], ids)
+
+
+def delete_todos(query, ids):
+    found = [i for (i,) in query.filter(Todo.id.in_(ids)).with_entities(Todo.id)]
+    if found:
+        Todo.query.filter(Todo.id.in_(found)).delete(synchronize_session=False)
+        db.session.commit()
+    return _split(found, ids)
@@ -0,0 +1,225 @@
+"""Fragment and query-result cache for per-user dashboard views.
+
+Entries are keyed by group, user and a generation number per group. Write
+paths fire app.events signals, and the receivers here bump the generation of
+each group the write affects. Later reads then miss and rebuild rather than
+serve the old value. Nothing is deleted: stale entries age out by TTL or LRU.
+
+Entries live in process memory (LRU, CACHE_MAX_ENTRIES), or in Redis shared
+by all workers when CACHE_URL is a redis:// URL. Generations are always
+shared, so a write in one gunicorn worker invalidates every worker. They live
+in Redis when it is configured, otherwise in the cache_generation table (one
+small query per request, memoized on flask.g).
+"""
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_request_context
+from sqlalchemy.exc import IntegrityError
+
+from app import events, metrics
+from app.models import CacheGeneration, db
+
+try:
+    import redis as _redis
+    _HAS_REDIS = True
+except Exception:
+    _HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = metrics.counter('flik_cache_requests_total', 'Fragment cache lookups by group and result', ('group', 'result'))
+CACHE_INVALIDATIONS = metrics.counter('flik_cache_invalidations_total', 'Cache group invalidations', ('group',))
+
+GLOBAL_SCOPE = '*'
+
+# The cached groups each event makes stale
+EVENT_GROUPS = {
+    events.document_uploaded: ('documents', 'todos', 'categories', 'stats', 'entities'),
+    events.document_deleted: ('documents', 'todos', 'categories', 'stats', 'entities'),
+    events.document_recategorized: ('categories',),
+    events.todo_added: ('todos', 'stats'),
+    events.todo_toggled: ('todos', 'stats'),
+    events.todo_updated: ('todos', 'stats'),
+    events.todo_deleted: ('todos', 'stats'),
+}
+GROUPS = sorted({group for groups in EVENT_GROUPS.values() for group in groups})
+
+_MISSING = object()
+
+
+def _gen_name(group, scope):
+    return f"{group}:{scope}"
+
+
+class LocalBackend:
+    """Per-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Entries and generations in Redis, shared by every worker and node."""
+
+    def __init__(self, url, prefix='flik:cache:'):
+        if not _HAS_REDIS:
+            raise RuntimeError("CACHE_URL needs the redis package (pip install redis)")
+        self.client = _redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=max(1, int(ttl)))
+
+    def read_generations(self, names):
+        values = self.client.mget([self.prefix + 'gen:' + n for n in names])
+        return {n: int(v) for n, v in zip(names, values) if v is not None}
+
+    def bump_generations(self, names):
+        pipe = self.client.pipeline()
+        for name in names:
+            pipe.incr(self.prefix + 'gen:' + name)
+        pipe.execute()
+
+
+class DatabaseGenerations:
+    """Generation counters in the cache_generation table, for the in-process backend."""
+
+    def read_generations(self, names):
+        rows = db.session.query(CacheGeneration.name, CacheGeneration.value).filter(CacheGeneration.name.in_(names))
+        return dict(rows)
+
+    def bump_generations(self, names):
+        for name in names:
+            for _ in range(2):
+                try:
+                    updated = CacheGeneration.query.filter_by(name=name).update(
+                        {CacheGeneration.value: CacheGeneration.value + 1}, synchronize_session=False)
+                    if not updated:
+                        db.session.add(CacheGeneration(name=name, value=1))
+                    db.session.commit()
+                    break
+                except IntegrityError:
+                    # Another worker inserted the row first; update it instead
+                    db.session.rollback()
+
+
+class FragmentCache:
+    def __init__(self, backend, generations, ttl=300, enabled=True):
+        self.backend = backend
+        self.generations = generations
+        self.ttl = ttl
+        self.enabled = enabled
+
+    def _generation_pair(self, group, user_id):
+        names = [_gen_name(group, GLOBAL_SCOPE), _gen_name(group, user_id)]
+        memo = g.setdefault('flik_cache_generations', {}) if has_request_context() else {}
+        if any(n not in memo for n in names):
+            # Load every group for this user at once: one lookup per request
+            wanted = [_gen_name(grp, scope) for grp in GROUPS for scope in (GLOBAL_SCOPE, user_id)]
+            wanted = list(dict.fromkeys(wanted + names))
+            loaded = self.generations.read_generations(wanted)
+            memo.update({n: loaded.get(n, 0) for n in wanted})
+        return memo[names[0]], memo[names[1]]
+
+    def get_or_set(self, group, user_id, key, producer, ttl=None):
+        """Return the cached value for (group, user, key), building it with producer() on a miss."""
+        if not self.enabled:
+            return producer()
+        try:
+            global_gen, user_gen = self._generation_pair(group, user_id)
+            cache_key = f"{group}:{key}:u{user_id}:{global_gen}.{user_gen}"
+            value = self.backend.get(cache_key)
+        except Exception:
+            logger.warning("Cache lookup failed for %s; bypassing", group, exc_info=True)
+            return producer()
+        if value is not _MISSING:
+            CACHE_REQUESTS.labels(group=group, result='hit').inc()
+            return value
+        CACHE_REQUESTS.labels(group=group, result='miss').inc()
+        value = producer()
+        try:
+            self.backend.set(cache_key, value, ttl or self.ttl)
+        except Exception:
+            logger.warning("Cache store failed for %s", group, exc_info=True)
+        return value
+
+    def invalidate(self, groups, user_id=None):
+        """Make groups stale for one user, or for everyone when user_id is None."""
+        scope = GLOBAL_SCOPE if user_id is None else user_id
+        names = [_gen_name(group, scope) for group in groups]
+        self.generations.bump_generations(names)
+        if has_request_context() and 'flik_cache_generations' in g:
+            for name in names:
+                g.flik_cache_generations.pop(name, None)
+        for group in groups:
+            CACHE_INVALIDATIONS.labels(group=group).inc()
+
+
+def _receiver(groups):
+    def receive(app, user_id=None, **kwargs):
+        cache = app.extensions.get('flik_cache')
+        if cache is not None and cache.enabled:
+            cache.invalidate(groups, user_id)
+    return receive
+
+
+_connected = False
+
+
+def create_cache(config):
+    url = config.get('CACHE_URL') or ''
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        backend = RedisBackend(url)
+        generations = backend
+    else:
+        backend = LocalBackend(int(config.get('CACHE_MAX_ENTRIES') or 5000))
+        generations = DatabaseGenerations()
+    return FragmentCache(backend, generations, ttl=float(config.get('CACHE_TTL') or 300),
+                         enabled=bool(config.get('CACHE_ENABLED', True)))
+
+
+def init_cache(app):
+    global _connected
+    app.extensions['flik_cache'] = create_cache(app.config)
+    if not _connected:
+        for signal, groups in EVENT_GROUPS.items():
+            signal.connect(_receiver(groups), weak=False)
+        _connected = True
+    return app.extensions['flik_cache']
+
+
+def get_cache():
+    return current_app.extensions['flik_cache']
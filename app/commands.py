@@ -0,0 +1,396 @@
+"""Flask CLI commands (run with `flask --app run <group> <command>`)."""
+import click
+from flask.cli import AppGroup
+from sqlalchemy.orm import load_only
+
+from app.models import Document, db
+
+dedup_cli = AppGroup('dedup', help='Near-duplicate detection.')
+
+
+@dedup_cli.command('backfill')
+@click.option('--batch-size', default=200, show_default=True)
+def dedup_backfill(batch_size):
+    """Compute MinHash signatures and LSH bands for documents that lack them."""
+    from app.dedup import compute_signature, index_document
+
+    indexed = skipped = 0
+    last_id = 0
+    while True:
+        batch = (
+            Document.query
+            .filter(Document.minhash.is_(None), Document.id > last_id)
+            .order_by(Document.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        for document in batch:
+            last_id = document.id
+            signature = compute_signature(document.extracted_text or '')
+            if signature is None:
+                skipped += 1
+                continue
+            index_document(document, signature)
+            indexed += 1
+        db.session.commit()
+    click.echo(f"Indexed {indexed} documents, skipped {skipped} with too little text")
+
+
+@dedup_cli.command('scan')
+@click.option('--threshold', type=float, default=None, help='Similarity threshold (default DEDUP_THRESHOLD or 0.85).')
+@click.option('--link', is_flag=True, help='Link every cluster member to the oldest document in its cluster.')
+def dedup_scan(threshold, link):
+    """Find near-duplicate clusters within each user's documents."""
+    from app.dedup import find_clusters
+
+    clusters = []
+    # Documents are only duplicates of the same owner's documents
+    owners = [uid for (uid,) in db.session.query(Document.user_id).distinct()]
+    for user_id in owners:
+        documents = Document.query.filter(
+            Document.user_id.is_(None) if user_id is None else Document.user_id == user_id,
+            Document.minhash.isnot(None)
+        ).options(load_only(Document.id, Document.minhash)).yield_per(1000)
+        clusters.extend(find_clusters(documents, threshold))
+    for cluster in clusters:
+        members = Document.query.filter(Document.id.in_(cluster)).order_by(Document.upload_date, Document.id).all()
+        click.echo(" | ".join(f"#{d.id} {d.original_filename}" for d in members))
+        if link:
+            original = members[0]
+            for document in members[1:]:
+                if document.duplicate_of_id is None:
+                    document.duplicate_of_id = original.id
+    if link:
+        db.session.commit()
+    click.echo(f"{len(clusters)} duplicate cluster(s) found")
+
+
+entities_cli = AppGroup('entities', help='Extracted entities for faceted filtering.')
+
+
+@entities_cli.command('backfill')
+@click.option('--batch-size', default=200, show_default=True)
+@click.option('--redo', is_flag=True, help='Re-extract documents that already have entities.')
+def entities_backfill(batch_size, redo):
+    """Extract entities with the local extractor for documents that have none.
+
+    Gemini is not called again; documents uploaded from now on get Gemini's
+    entities when it is configured.
+    """
+    from app.ai_processor import EntityExtractor
+    from app.entities import store
+    from app.models import DocumentEntity
+
+    extractor = EntityExtractor()
+    processed = found = 0
+    last_id = 0
+    while True:
+        query = Document.query.filter(Document.id > last_id)
+        if not redo:
+            query = query.filter(~db.session.query(DocumentEntity.id).filter(
+                DocumentEntity.document_id == Document.id).exists())
+        batch = query.order_by(Document.id).limit(batch_size).all()
+        if not batch:
+            break
+        for document in batch:
+            last_id = document.id
+            if redo:
+                DocumentEntity.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+            found += len(store(document, extractor.extract(document.extracted_text or '')))
+            processed += 1
+        db.session.commit()
+    if processed:
+        from app.cache import get_cache
+        get_cache().invalidate(['entities'])
+    click.echo(f"Extracted {found} entities from {processed} documents")
+
+
+storage_cli = AppGroup('storage', help='File storage maintenance.')
+
+
+@storage_cli.command('migrate')
+@click.option('--source', default=None, help='Directory holding legacy files (default UPLOAD_FOLDER).')
+@click.option('--delete-source', is_flag=True, help='Remove each source file once it is stored.')
+@click.option('--dry-run', is_flag=True)
+def storage_migrate(source, delete_source, dry_run):
+    """Move files into the configured backend and rewrite file_path to storage keys.
+
+    Handles rows holding absolute local paths (written before storage keys) and
+    keys present in a local upload directory but missing from the backend, e.g.
+    when switching from local disk to GCS.
+    """
+    import os
+    from flask import current_app
+    from app.storage import LocalStorage, get_storage
+
+    storage = get_storage()
+    source_root = source or current_app.config['UPLOAD_FOLDER']
+    local_source = LocalStorage(source_root)
+    migrated = missing = 0
+    for document in Document.query.order_by(Document.id).yield_per(200):
+        key = document.file_path
+        if os.path.isabs(key):
+            src_path, key = key, document.filename
+        elif not storage.exists(key):
+            src_path = local_source.filesystem_path(key) or os.path.join(source_root, key)
+        else:
+            continue
+        if not os.path.exists(src_path):
+            click.echo(f"#{document.id}: source missing ({src_path})", err=True)
+            missing += 1
+            continue
+        click.echo(f"#{document.id}: {src_path} -> {storage.name}:{key}")
+        if dry_run:
+            continue
+        with open(src_path, 'rb') as f:
+            storage.save(key, f)
+        document.file_path = key
+        db.session.commit()
+        if delete_source and os.path.abspath(src_path) != storage.filesystem_path(key):
+            os.remove(src_path)
+        migrated += 1
+    click.echo(f"Migrated {migrated} file(s); {missing} missing")
+
+
+@storage_cli.command('gc')
+def storage_gc():
+    """Delete every queued storage object that is due."""
+    from app.garbage import create_collector, queue_depth
+    from flask import current_app
+
+    counts = create_collector(current_app).run_once()
+    click.echo(f"Deleted {counts['deleted']}, kept {counts['kept']} still referenced, "
+               f"{counts['failed']} failed; {queue_depth()} queued")
+
+
+@storage_cli.command('sweep')
+@click.option('--grace', type=float, default=None,
+              help='Seconds before an unreferenced object may go (default GC_SWEEP_GRACE_SECONDS).')
+@click.option('--missing', 'check_missing', is_flag=True, help='Also list documents whose file is missing.')
+@click.option('--dry-run', is_flag=True)
+def storage_sweep(grace, check_missing, dry_run):
+    """Queue storage objects that no document references, and drop stale upload spools."""
+    from app.garbage import sweep
+
+    report = sweep(grace_seconds=grace, check_missing=check_missing, dry_run=dry_run)
+    click.echo(f"Scanned {report['scanned']} object(s): {report['orphans']} orphaned"
+               f"{' (not queued: dry run)' if dry_run else ' and queued'}, {report['already_queued']} already queued; "
+               f"{report['stale_spools']} stale upload spool(s) {'found' if dry_run else 'removed'}")
+    for document_id in report['missing']:
+        click.echo(f"#{document_id}: file missing from storage", err=True)
+
+
+assets_cli = AppGroup('assets', help='Static asset pipeline.')
+
+
+@assets_cli.command('build')
+def assets_build():
+    """Write fingerprinted, gzip/brotli-compressed copies of app/static to app/static/dist."""
+    from flask import current_app
+    from app.assets import _HAS_BROTLI, build_assets
+
+    manifest = build_assets(current_app.static_folder)
+    click.echo(f"Built {len(manifest)} asset(s){'' if _HAS_BROTLI else ' (install brotli for .br variants)'}")
+
+
+owners_cli = AppGroup('owners', help='Document and todo ownership.')
+
+
+@owners_cli.command('assign')
+@click.option('--email', default=None, help='Owner for unowned rows (default: the only registered user).')
+def owners_assign(email):
+    """Give documents and todos created before per-user data an owner."""
+    from app.models import DocumentEntity, Todo, User
+    from app.reminders import reschedule_all
+    from app.scoping import unowned_counts
+
+    counts = unowned_counts()
+    if not any(counts.values()):
+        click.echo("Nothing to assign")
+        return
+    user, todo_ids = None, []
+    if counts['documents'] or counts['todos']:
+        if email:
+            user = User.query.filter_by(email=email.strip().lower()).first()
+            if user is None:
+                raise click.ClickException(f"No user with email {email}")
+        else:
+            users = User.query.limit(2).all()
+            if len(users) != 1:
+                raise click.ClickException("Several users (or none) exist; pass --email")
+            user = users[0]
+        todo_ids = [todo_id for todo_id, in db.session.query(Todo.id).filter(Todo.user_id.is_(None))]
+        Document.query.filter(Document.user_id.is_(None)).update({Document.user_id: user.id}, synchronize_session=False)
+        # Todos follow their document's owner; free-standing ones go to the chosen user
+        owner = db.session.query(Document.user_id).filter(Document.id == Todo.document_id).scalar_subquery()
+        Todo.query.filter(Todo.user_id.is_(None), Todo.document_id.isnot(None)).update(
+            {Todo.user_id: owner}, synchronize_session=False)
+        Todo.query.filter(Todo.user_id.is_(None)).update({Todo.user_id: user.id}, synchronize_session=False)
+    # Entity rows carry a copy of their document's owner for the facet index (backfills of unowned
+    # documents wrote them without one)
+    entity_owner = db.session.query(Document.user_id).filter(Document.id == DocumentEntity.document_id).scalar_subquery()
+    DocumentEntity.query.filter(DocumentEntity.user_id.is_(None)).update(
+        {DocumentEntity.user_id: entity_owner}, synchronize_session=False)
+    # The bulk updates skip the schedule listener (and loaded objects), and unowned todos had no reminders
+    db.session.expire_all()
+    for start in range(0, len(todo_ids), 500):
+        reschedule_all(todo_ids=todo_ids[start:start + 500])
+    db.session.commit()
+    if counts['entities']:
+        from app.cache import get_cache
+        get_cache().invalidate(['entities'])
+    if user is not None:
+        click.echo(f"Assigned {counts['documents']} document(s) and {counts['todos']} todo(s) to {user.email}")
+    if counts['entities']:
+        click.echo(f"Gave {counts['entities']} entity row(s) their document's owner")
+
+
+admins_cli = AppGroup('admins', help='Admin rights (profiles, /metrics).')
+
+
+def _set_admin(email, value):
+    from app.models import User
+
+    user = User.query.filter_by(email=email.strip().lower()).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    user.is_admin = value
+    db.session.commit()
+    return user
+
+
+@admins_cli.command('grant')
+@click.argument('email')
+def admins_grant(email):
+    """Make an existing account an admin."""
+    user = _set_admin(email, True)
+    click.echo(f"{user.email} is now an admin")
+
+
+@admins_cli.command('revoke')
+@click.argument('email')
+def admins_revoke(email):
+    """Take admin rights away (web workers notice within IDENTITY_CACHE_TTL)."""
+    user = _set_admin(email, False)
+    click.echo(f"{user.email} is no longer an admin")
+
+
+@admins_cli.command('list')
+def admins_list():
+    """List admin accounts."""
+    from app.models import User
+
+    admins = User.query.filter(User.is_admin.is_(True)).order_by(User.email).all()
+    for user in admins:
+        click.echo(user.email)
+    if not admins:
+        click.echo("No admins; run `flask --app run admins grant EMAIL`")
+
+
+reminders_cli = AppGroup('reminders', help='Due-date reminders.')
+
+
+@reminders_cli.command('run')
+def reminders_run():
+    """Run the reminder scheduler in the foreground (safe to run on several nodes)."""
+    from flask import current_app
+    from app.reminders import create_scheduler
+
+    scheduler = create_scheduler(current_app._get_current_object())
+    click.echo(f"Reminder scheduler {scheduler.node_id} sending via {scheduler.notifier.name}")
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+@reminders_cli.command('send-due')
+def reminders_send_due():
+    """Send the reminders that are due now, once (for cron)."""
+    from flask import current_app
+    from app.reminders import create_scheduler
+
+    sent = create_scheduler(current_app._get_current_object()).run_once()
+    click.echo(f"Sent {sent} reminder(s)")
+
+
+@reminders_cli.command('reschedule')
+def reminders_reschedule():
+    """Recompute reminder times for all open todos (after upgrading or changing REMINDER_LEAD_MINUTES)."""
+    from app.reminders import reschedule_all
+
+    click.echo(f"Rescheduled {reschedule_all()} todo(s)")
+
+
+library_cli = AppGroup('library', help='Library export and import.')
+
+
+@library_cli.command('export')
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('--email', 'emails', multiple=True, help='Only these users (repeatable; default: everyone).')
+@click.option('--format', 'fmt', type=click.Choice(['zip', 'tar', 'tar.gz']), default=None,
+              help='Archive format (default: from the output file name).')
+@click.option('--since', default=None, help='Only documents and todos changed since this ISO timestamp.')
+@click.option('--after', type=int, default=None, help='Resume after this document id.')
+def library_export(output, emails, fmt, since, after):
+    """Write an export archive of document files, text, categories and todos."""
+    from datetime import datetime
+    from app.export import iter_export
+    from app.models import User
+
+    if fmt is None:
+        fmt = 'tar.gz' if output.endswith(('.tar.gz', '.tgz')) else 'tar' if output.endswith('.tar') else 'zip'
+    user_ids = None
+    if emails:
+        users = User.query.filter(User.email.in_([e.strip().lower() for e in emails])).all()
+        if len(users) != len(set(emails)):
+            raise click.ClickException("Unknown user email")
+        user_ids = [u.id for u in users]
+    size = 0
+    with open(output, 'wb') as out:
+        for chunk in iter_export(user_ids, fmt, since=datetime.fromisoformat(since) if since else None, after=after):
+            out.write(chunk)
+            size += len(chunk)
+    click.echo(f"Wrote {output} ({size} bytes)")
+
+
+@library_cli.command('import')
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False))
+@click.option('--email', default=None, help='Import everything for this user (default: the owners recorded in the archive).')
+@click.option('--batch-size', default=200, show_default=True)
+def library_import(archive, email, batch_size):
+    """Restore an export archive in bulk; documents already present are updated."""
+    from app.export import ExportError, import_archive
+    from app.models import User
+
+    user = None
+    if email:
+        user = User.query.filter_by(email=email.strip().lower()).first()
+        if user is None:
+            raise click.ClickException(f"No user with email {email}")
+    try:
+        counts = import_archive(archive, user, batch_size)
+    except ExportError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(
+        f"Imported {counts['documents']} document(s), updated {counts['updated']}, "
+        f"{counts['todos']} todo(s); skipped {counts['skipped']} without an owner or file"
+    )
+    if counts['incomplete'] or not counts['complete']:
+        click.echo(f"Archive is incomplete ({counts['incomplete']} file(s) without metadata); "
+                   f"resume the export with --after {counts['last_document_id'] or 0}")
+    if counts['documents']:
+        click.echo("Run `flask dedup backfill` to index the new documents for near-duplicate detection")
+
+
+def register_commands(app):
+    app.cli.add_command(dedup_cli)
+    app.cli.add_command(entities_cli)
+    app.cli.add_command(storage_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(owners_cli)
+    app.cli.add_command(admins_cli)
+    app.cli.add_command(reminders_cli)
+    app.cli.add_command(library_cli)
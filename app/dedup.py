@@ -0,0 +1,237 @@
+"""Near-duplicate detection with MinHash signatures and an LSH band index.
+
+Each document's extracted text is reduced to word shingles and summarized by a
+MinHash signature (NUM_PERM 32-bit minimums). The signature is cut into
+LSH_BANDS bands; every band is hashed to a bucket that is stored in the indexed
+DocumentLSHBand table, so looking up candidates for a new upload is a handful
+of index probes instead of a scan over the corpus. Candidates are then verified
+by their estimated Jaccard similarity against DEDUP_THRESHOLD.
+"""
+import hashlib
+import os
+import re
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
+
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5
+MIN_SHINGLES = 8
+SIGNATURE_BLOCK = 4096  # shingles hashed per numpy step, so memory stays flat for long texts
+
+_MASK64 = (1 << 64) - 1
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def _threshold() -> float:
+    try:
+        return float(os.getenv('DEDUP_THRESHOLD', '0.85'))
+    except ValueError:
+        return 0.85
+
+
+def _permutations() -> List[Tuple[int, int]]:
+    """Deterministic (odd a, b) pairs for multiply-shift hashing; stable across processes."""
+    perms = []
+    for i in range(NUM_PERM):
+        digest = hashlib.blake2b(f"flik-minhash-{i}".encode(), digest_size=16).digest()
+        a, b = struct.unpack('<QQ', digest)
+        perms.append((a | 1, b))
+    return perms
+
+
+_PERMS = _permutations()
+if _HAS_NUMPY:
+    _PERM_A = np.array([a for a, _ in _PERMS], dtype=np.uint64)
+    _PERM_B = np.array([b for _, b in _PERMS], dtype=np.uint64)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Normalized word n-grams of text, hashed to 32-bit integers."""
+    words = _WORD_RE.findall((text or '').lower())
+    if len(words) < size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = (" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return {
+        int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), 'little')
+        for g in grams
+    }
+
+
+def compute_signature(text: str) -> Optional[List[int]]:
+    """MinHash signature of text, or None when the text is too short to compare."""
+    hashed = shingles(text)
+    if len(hashed) < MIN_SHINGLES:
+        return None
+    if _HAS_NUMPY:
+        values = np.fromiter(hashed, dtype=np.uint64, count=len(hashed))
+        minimums = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(values), SIGNATURE_BLOCK):
+            block = values[start:start + SIGNATURE_BLOCK]
+            # (a*x + b) mod 2**64, keep the high 32 bits; uint64 arithmetic wraps as intended
+            with np.errstate(over='ignore'):
+                mixed = (block[None, :] * _PERM_A[:, None] + _PERM_B[:, None]) >> np.uint64(32)
+            np.minimum(minimums, mixed.min(axis=1), out=minimums)
+        return [int(v) for v in minimums]
+    return [
+        min((((a * x + b) & _MASK64) >> 32) for x in hashed)
+        for a, b in _PERMS
+    ]
+
+
+def pack_signature(signature: List[int]) -> bytes:
+    return struct.pack(f'<{NUM_PERM}I', *signature)
+
+
+def unpack_signature(blob: Optional[bytes]) -> Optional[List[int]]:
+    if not blob or len(blob) != NUM_PERM * 4:
+        return None
+    return list(struct.unpack(f'<{NUM_PERM}I', blob))
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """Estimated Jaccard similarity: the fraction of matching MinHash slots."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / float(NUM_PERM)
+
+
+def band_buckets(signature: List[int]) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs; the bucket hash includes the band so one index covers all bands."""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<I{LSH_ROWS}I', band, *rows), digest_size=8).digest()
+        # Signed so the value fits a SQL BIGINT column
+        buckets.append((band, struct.unpack('<q', digest)[0]))
+    return buckets
+
+
+def index_document(document, signature: List[int]) -> None:
+    """Store the signature on the document and add its LSH bands to the session."""
+    from app.models import DocumentLSHBand, db
+
+    document.minhash = pack_signature(signature)
+    DocumentLSHBand.query.filter_by(document_id=document.id).delete()
+    for band, bucket in band_buckets(signature):
+        db.session.add(DocumentLSHBand(document_id=document.id, band=band, bucket=bucket))
+
+
+def find_near_duplicates(signature: List[int], exclude_id: Optional[int] = None,
+                         threshold: Optional[float] = None, scope=None) -> List[Tuple[object, float]]:
+    """Documents whose estimated similarity to signature is at least threshold, best first.
+
+    `scope` optionally narrows the Document query (e.g. to one owner's documents).
+    """
+    from app.models import Document, DocumentLSHBand, db
+
+    threshold = _threshold() if threshold is None else threshold
+    buckets = [bucket for _, bucket in band_buckets(signature)]
+    candidate_ids = {
+        row[0] for row in
+        db.session.query(DocumentLSHBand.document_id).filter(DocumentLSHBand.bucket.in_(buckets)).distinct()
+    }
+    candidate_ids.discard(exclude_id)
+    if not candidate_ids:
+        return []
+    query = Document.query.filter(Document.id.in_(candidate_ids))
+    if scope is not None:
+        query = scope(query)
+    matches = []
+    for candidate in query:
+        other = unpack_signature(candidate.minhash)
+        if other is None:
+            continue
+        score = estimate_similarity(signature, other)
+        if score >= threshold:
+            matches.append((candidate, score))
+    matches.sort(key=lambda m: (-m[1], m[0].upload_date or 0, m[0].id))
+    return matches
+
+
+def canonical(document):
+    """Follow duplicate_of links to the original upload."""
+    seen = set()
+    while document.duplicate_of is not None and document.id not in seen:
+        seen.add(document.id)
+        document = document.duplicate_of
+    return document
+
+
+def _todo_keys(title: str, description: str, due_date) -> set:
+    norm = lambda v: re.sub(r'[^a-z0-9]+', ' ', (v or '').lower()).strip()
+    due = due_date.date() if due_date else None
+    keys = set()
+    if norm(description):
+        keys.add(('d', due, norm(description)))
+    if norm(title):
+        keys.add(('t', due, norm(title)))
+    return keys
+
+
+def filter_duplicate_todos(items: List[Dict], original) -> List[Dict]:
+    """Drop extracted todos that the original document already produced."""
+    existing = set()
+    for todo in original.todos:
+        existing |= _todo_keys(todo.title, todo.description, todo.due_date)
+    kept = []
+    for item in items:
+        keys = _todo_keys(item.get('title'), item.get('description'), item.get('due_date'))
+        # Title alone is too generic ("Medical Task"); require the description to match too when present
+        desc_keys = {k for k in keys if k[0] == 'd'}
+        if (desc_keys and desc_keys & existing) or (not desc_keys and keys & existing):
+            continue
+        kept.append(item)
+    return kept
+
+
+def find_clusters(documents: Iterable, threshold: Optional[float] = None) -> List[List[int]]:
+    """Group documents into near-duplicate clusters using the LSH index and union-find.
+
+    Only pairs that share an LSH bucket are compared, so the cost grows with the
+    number of candidate pairs rather than the square of the corpus size.
+    """
+    from app.models import DocumentLSHBand, db
+
+    threshold = _threshold() if threshold is None else threshold
+    signatures = {}
+    for document in documents:
+        signature = unpack_signature(document.minhash)
+        if signature is not None:
+            signatures[document.id] = signature
+
+    parent = {doc_id: doc_id for doc_id in signatures}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    buckets: Dict[int, List[int]] = {}
+    rows = db.session.query(DocumentLSHBand.bucket, DocumentLSHBand.document_id).order_by(DocumentLSHBand.bucket)
+    for bucket, doc_id in rows.yield_per(5000):
+        if doc_id in signatures:
+            buckets.setdefault(bucket, []).append(doc_id)
+
+    compared = set()
+    for members in buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pair = (a, b) if a < b else (b, a)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                if find(a) != find(b) and estimate_similarity(signatures[a], signatures[b]) >= threshold:
+                    parent[find(b)] = find(a)
+
+    clusters: Dict[int, List[int]] = {}
+    for doc_id in signatures:
+        clusters.setdefault(find(doc_id), []).append(doc_id)
+    return sorted((sorted(c) for c in clusters.values() if len(c) > 1), key=lambda c: c[0])
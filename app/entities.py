@@ -0,0 +1,164 @@
+"""Entities extracted from documents, stored for faceted filtering.
+
+Each analysis returns an `entities` object. It comes from Gemini, or from
+ai_processor.EntityExtractor when Gemini is off. normalize() maps its loose
+keys and values onto four kinds (doctor, hospital, medicine,
+insurance_number), and store() writes one DocumentEntity row per distinct
+(kind, normalized value). Spelling variants therefore share a facet: "Dr. Jane
+Smith, MD" and "dr jane smith" both count under "jane smith".
+
+Facet counts and entity filters are answered from the
+ix_document_entity_facet index (user_id, kind, normalized, document_id), not
+by scanning extracted text. The dashboard's unfiltered counts are cached in the
+'entities' fragment-cache group, which uploads and deletes invalidate.
+`flask --app run entities backfill` fills in documents analyzed before
+entities were stored.
+"""
+import re
+
+from app.models import Document, DocumentEntity, db
+
+KINDS = ('doctor', 'hospital', 'medicine', 'insurance_number')
+KIND_LABELS = {
+    'doctor': 'Doctors',
+    'hospital': 'Hospitals & clinics',
+    'medicine': 'Medicines',
+    'insurance_number': 'Insurance numbers',
+}
+
+# Singular, for a single document's details
+ENTITY_LABELS = {
+    'doctor': 'Doctor',
+    'hospital': 'Hospital / clinic',
+    'medicine': 'Medicine',
+    'insurance_number': 'Insurance number',
+}
+
+# Keys Gemini uses for each kind, after lowercasing and replacing non-letters with '_'
+ALIASES = {
+    'doctor': 'doctor', 'doctors': 'doctor', 'physician': 'doctor', 'physicians': 'doctor',
+    'dentist': 'doctor', 'dentists': 'doctor', 'doctor_name': 'doctor',
+    'hospital': 'hospital', 'hospitals': 'hospital', 'clinic': 'hospital', 'clinics': 'hospital',
+    'facility': 'hospital', 'facilities': 'hospital', 'pharmacy': 'hospital', 'hospital_name': 'hospital',
+    'medicine': 'medicine', 'medicines': 'medicine', 'medication': 'medicine', 'medications': 'medicine',
+    'drug': 'medicine', 'drugs': 'medicine', 'prescription': 'medicine', 'prescriptions': 'medicine',
+    'insurance_number': 'insurance_number', 'insurance_numbers': 'insurance_number',
+    'policy_number': 'insurance_number', 'policy_numbers': 'insurance_number', 'member_id': 'insurance_number',
+    'insurance_id': 'insurance_number', 'group_number': 'insurance_number', 'subscriber_id': 'insurance_number',
+    'claim_number': 'insurance_number',
+}
+# Keys holding the value when Gemini returns an object instead of a string
+VALUE_KEYS = ('name', 'value', 'number', 'id')
+
+MAX_PER_DOCUMENT = 50
+MAX_LENGTH = 255
+FACET_LIMIT = 10
+
+_DOCTOR_TITLE = re.compile(r'^(?:dr|doctor)\b\.?\s*', re.IGNORECASE)
+_DOCTOR_SUFFIX = re.compile(r',?\s+(?:m\.?d|d\.?d\.?s|d\.?m\.?d|d\.?o|n\.?p|p\.?a)\.?$', re.IGNORECASE)
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def _key(name):
+    return ALIASES.get(_NON_WORD.sub('_', str(name).lower()).strip('_'))
+
+
+def _flatten(kind, value):
+    """Yield (kind, text) from a string, a list, or a nested object."""
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _flatten(kind, item)
+    elif isinstance(value, dict):
+        for key in VALUE_KEYS:
+            if kind and isinstance(value.get(key), (str, int)):
+                yield kind, str(value[key])
+                return
+        # e.g. {"insurance": {"provider": "...", "policy_number": "..."}}
+        for key, item in value.items():
+            nested = _key(key)
+            if nested or isinstance(item, dict):
+                yield from _flatten(nested, item)
+    elif kind and isinstance(value, (str, int)) and not isinstance(value, bool):
+        yield kind, str(value)
+
+
+def normalize_value(kind, value):
+    """The form a facet is keyed on; '' when nothing usable is left."""
+    value = ' '.join(value.split())
+    if kind == 'doctor':
+        value = _DOCTOR_SUFFIX.sub('', _DOCTOR_TITLE.sub('', value))
+    elif kind == 'medicine':
+        # Facet on the drug, not the strength: "Lisinopril 10 mg" -> "lisinopril"
+        value = re.split(r'\s+\d', value, maxsplit=1)[0]
+    elif kind == 'insurance_number':
+        return re.sub(r'[^0-9A-Z]', '', value.upper())[:MAX_LENGTH]
+    return _NON_WORD.sub(' ', value.lower()).strip()[:MAX_LENGTH]
+
+
+def normalize(raw):
+    """[(kind, value, normalized), ...] from an analysis `entities` object; unknown keys are dropped."""
+    if not isinstance(raw, dict):
+        return []
+    found = {}
+    for kind, value in _flatten(None, raw):
+        value = ' '.join(value.split()).strip(' .,;:')[:MAX_LENGTH]
+        normalized = normalize_value(kind, value)
+        if len(normalized) < 2 or (kind, normalized) in found:
+            continue
+        found[(kind, normalized)] = value
+        if len(found) >= MAX_PER_DOCUMENT:
+            break
+    return [(kind, value, normalized) for (kind, normalized), value in found.items()]
+
+
+def store(document, raw):
+    """Add the document's entity rows to the session; the caller commits."""
+    rows = [DocumentEntity(document_id=document.id, user_id=document.user_id, kind=kind, value=value,
+                           normalized=normalized)
+            for kind, value, normalized in normalize(raw)]
+    db.session.add_all(rows)
+    return rows
+
+
+def parse_selection(values):
+    """[(kind, normalized), ...] from `entity=kind:normalized` request arguments; malformed ones are ignored."""
+    selected = []
+    for raw in values:
+        kind, _, normalized = raw.partition(':')
+        if kind in KINDS and normalized and (kind, normalized) not in selected:
+            selected.append((kind, normalized))
+    return selected
+
+
+def filter_documents(query, selected, user_id):
+    """Limit a Document query to documents having every selected entity (index lookups, no text scan)."""
+    for kind, normalized in selected:
+        query = query.filter(Document.id.in_(
+            db.session.query(DocumentEntity.document_id).filter(
+                DocumentEntity.user_id == user_id,
+                DocumentEntity.kind == kind,
+                DocumentEntity.normalized == normalized,
+            )
+        ))
+    return query
+
+
+def facet_counts(user_id, document_ids=None, limit=FACET_LIMIT):
+    """{kind: [(normalized, value, documents), ...]}, most frequent first.
+
+    `document_ids` (a subquery) narrows the counts to the documents currently
+    listed; without it they cover all of the user's documents.
+    """
+    query = db.session.query(
+        DocumentEntity.kind, DocumentEntity.normalized,
+        db.func.min(DocumentEntity.value), db.func.count(DocumentEntity.document_id),
+    ).filter(DocumentEntity.user_id == user_id)
+    if document_ids is not None:
+        query = query.filter(DocumentEntity.document_id.in_(document_ids))
+    facets = {}
+    for kind, normalized, value, count in query.group_by(DocumentEntity.kind, DocumentEntity.normalized):
+        facets.setdefault(kind, []).append((normalized, value, count))
+    return {
+        kind: sorted(facets[kind], key=lambda f: (-f[2], f[0]))[:limit]
+        for kind in KINDS if kind in facets
+    }
@@ -0,0 +1,26 @@
+"""Application events, fired after a write has been committed.
+
+Receivers get the Flask app as sender and keyword arguments describing the
+change. `user_id` is the owner whose views changed; None means the change can
+be visible to every user.
+
+    from app import events
+    events.document_uploaded.send(current_app._get_current_object(), user_id=None, document=document)
+"""
+from blinker import Namespace
+
+_signals = Namespace()
+
+document_uploaded = _signals.signal('document-uploaded')
+document_deleted = _signals.signal('document-deleted')
+document_recategorized = _signals.signal('document-recategorized')
+todo_added = _signals.signal('todo-added')
+todo_toggled = _signals.signal('todo-toggled')
+todo_updated = _signals.signal('todo-updated')
+todo_deleted = _signals.signal('todo-deleted')
+
+
+def fire(signal, user_id=None, **kwargs):
+    """Send `signal` from the current app."""
+    from flask import current_app
+    signal.send(current_app._get_current_object(), user_id=user_id, **kwargs)
@@ -0,0 +1,664 @@
+"""Streaming export and bulk import of document libraries.
+
+iter_export() yields a ZIP, tar or tar.gz archive chunk by chunk: original
+files are copied from storage in CHUNK_SIZE pieces and database rows are read
+in keyset batches, so memory use does not grow with the library. Layout:
+
+    documents/<id>/<original filename>   the stored file
+    documents/<id>/document.json         row, pages, todos and entities (written after the file)
+    todos/<n>.jsonl                      todos not attached to a document
+    manifest.json                        counts, missing files and resume/incremental markers
+
+Documents are written in id order, and each one's document.json comes after
+its file. The highest id with a complete document.json in a cut-off archive is
+therefore the `after` value that resumes the export. `since` restricts it to
+documents and todos changed since a timestamp. The manifest's `next_since`
+feeds the next incremental run. Deletions are not carried by incremental
+archives.
+
+import_archive() reads such an archive in a single pass. It inserts in batches
+and matches documents already present (same owner and content hash), so
+re-importing an overlapping incremental archive updates rather than duplicates.
+A cut-off ZIP has no central directory, so it is read by walking the local
+file headers; every member that arrived whole is kept, as with tar.
+"""
+import json
+import logging
+import os
+import struct
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from werkzeug.utils import secure_filename
+
+from app.entities import KINDS
+from app.models import Document, DocumentEntity, DocumentPage, Todo, User, db
+from app.serving import file_sha256
+from app.storage import CHUNK_SIZE, get_storage
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+FORMATS = {
+    'zip': ('application/zip', 'zip'),
+    'tar': ('application/x-tar', 'tar'),
+    'tar.gz': ('application/gzip', 'tar.gz'),
+}
+# Already-compressed originals are stored rather than deflated again
+STORED_TYPES = {'pdf', 'png', 'jpg', 'jpeg', 'docx'}
+TODO_CHUNK = 500
+
+
+class ExportError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# archive writers
+
+class _Sink:
+    """Write-only, non-seekable file object drained by the generator after each write."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipWriter:
+    """Streaming ZIP: entries use data descriptors, so nothing is seeked back over."""
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', allowZip64=True)
+
+    def member(self, name, chunks, size, mtime, compress=True):
+        info = zipfile.ZipInfo(name, date_time=time.gmtime(max(mtime, 315532800))[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.file_size = size
+        with self._zip.open(info, 'w') as out:
+            for chunk in chunks:
+                out.write(chunk)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def finish(self):
+        self._zip.close()
+        yield self._sink.drain()
+
+
+class TarWriter:
+    """Streaming tar (optionally gzipped); headers are built up front from the known size."""
+
+    def __init__(self, gzip=False):
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def _out(self, data):
+        return self._gzip.compress(data) if self._gzip else data
+
+    def member(self, name, chunks, size, mtime, compress=True):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o644
+        yield self._out(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            if written > size:
+                raise ExportError(f"{name} grew while being exported")
+            yield self._out(chunk)
+        if written != size:
+            raise ExportError(f"{name}: expected {size} bytes, read {written}")
+        if size % tarfile.BLOCKSIZE:
+            yield self._out(tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE))
+
+    def finish(self):
+        data = self._out(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+        if self._gzip:
+            data += self._gzip.flush()
+        yield data
+
+
+def _writer(fmt):
+    if fmt == 'zip':
+        return ZipWriter()
+    if fmt in ('tar', 'tar.gz'):
+        return TarWriter(gzip=fmt == 'tar.gz')
+    raise ExportError(f"unknown export format {fmt!r}")
+
+
+def _json_member(writer, name, payload, mtime):
+    data = json.dumps(payload, ensure_ascii=False, indent=1).encode('utf-8')
+    return writer.member(name, [data], len(data), mtime)
+
+
+# ---------------------------------------------------------------------------
+# export
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _parse_iso(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _changed_since(query, model, created_column, since):
+    return query.filter(db.or_(
+        model.updated_at >= since,
+        db.and_(model.updated_at.is_(None), created_column >= since),
+    ))
+
+
+def _document_record(document, pages, entities, owner_email, file_member):
+    return {
+        'id': document.id,
+        'owner_email': owner_email,
+        'filename': document.filename,
+        'original_filename': document.original_filename,
+        'file': file_member,
+        'file_size': document.file_size,
+        'file_type': document.file_type,
+        'content_hash': document.content_hash,
+        'category': document.category,
+        'upload_date': _iso(document.upload_date),
+        'updated_at': _iso(document.updated_at),
+        'duplicate_of_id': document.duplicate_of_id,
+        'duplicate_score': document.duplicate_score,
+        'extracted_text': document.extracted_text,
+        'pages': [{
+            'page_number': p.page_number,
+            'text': p.text,
+            'extraction_method': p.extraction_method,
+            'extraction_ms': p.extraction_ms,
+        } for p in pages],
+        'todos': [_todo_record(t) for t in document.todos],
+        'entities': [e.to_dict() for e in entities],
+    }
+
+
+def _todo_record(todo):
+    return {
+        'title': todo.title,
+        'description': todo.description,
+        'due_date': _iso(todo.due_date),
+        'category': todo.category,
+        'is_completed': bool(todo.is_completed),
+        'created_date': _iso(todo.created_date),
+        'updated_at': _iso(todo.updated_at),
+    }
+
+
+def iter_export(user_ids=None, fmt='zip', since=None, after=None, batch_size=100):
+    """Yield an export archive of the given users' libraries (all users when None)."""
+    writer = _writer(fmt)
+    storage = get_storage()
+    generated_at = datetime.utcnow()
+    now = int(time.time())
+
+    users = User.query.filter(User.id.in_(user_ids)) if user_ids is not None else User.query
+    emails = dict(users.with_entities(User.id, User.email))
+
+    documents = Document.query.options(selectinload(Document.todos))
+    loose_todos = Todo.query.filter(Todo.document_id.is_(None))
+    if user_ids is not None:
+        documents = documents.filter(Document.user_id.in_(user_ids))
+        loose_todos = loose_todos.filter(Todo.user_id.in_(user_ids))
+    if since is not None:
+        todo_changed = db.exists().where(
+            Todo.document_id == Document.id,
+            db.or_(Todo.updated_at >= since, db.and_(Todo.updated_at.is_(None), Todo.created_date >= since)))
+        documents = documents.filter(db.or_(
+            Document.updated_at >= since,
+            db.and_(Document.updated_at.is_(None), Document.upload_date >= since),
+            todo_changed,
+        ))
+        loose_todos = _changed_since(loose_todos, Todo, Todo.created_date, since)
+
+    counts = {'documents': 0, 'files': 0, 'todos': 0}
+    missing_files = []
+    last_id = after or 0
+    while True:
+        batch = documents.filter(Document.id > last_id).order_by(Document.id).limit(batch_size).all()
+        if not batch:
+            break
+        pages_by_document = {}
+        for page in (DocumentPage.query.filter(DocumentPage.document_id.in_([d.id for d in batch]))
+                     .order_by(DocumentPage.document_id, DocumentPage.page_number)):
+            pages_by_document.setdefault(page.document_id, []).append(page)
+        entities_by_document = {}
+        for entity in (DocumentEntity.query.filter(DocumentEntity.document_id.in_([d.id for d in batch]))
+                       .order_by(DocumentEntity.document_id, DocumentEntity.kind, DocumentEntity.normalized)):
+            entities_by_document.setdefault(entity.document_id, []).append(entity)
+
+        for document in batch:
+            last_id = document.id
+            mtime = int((document.updated_at or document.upload_date or generated_at).timestamp())
+            base = f"documents/{document.id}/"
+            file_member = base + (secure_filename(document.original_filename) or document.filename)
+            if storage.exists(document.file_path):
+                yield from writer.member(
+                    file_member, storage.iter_range(document.file_path, chunk_size=CHUNK_SIZE),
+                    storage.size(document.file_path), mtime,
+                    compress=document.file_type not in STORED_TYPES)
+                counts['files'] += 1
+            else:
+                missing_files.append(document.id)
+                file_member = None
+            record = _document_record(document, pages_by_document.get(document.id, ()),
+                                      entities_by_document.get(document.id, ()), emails.get(document.user_id),
+                                      file_member)
+            counts['todos'] += len(record['todos'])
+            yield from _json_member(writer, base + 'document.json', record, mtime)
+            counts['documents'] += 1
+
+    chunk_number, last_todo_id = 0, 0
+    while True:
+        todos = loose_todos.filter(Todo.id > last_todo_id).order_by(Todo.id).limit(TODO_CHUNK).all()
+        if not todos:
+            break
+        last_todo_id = todos[-1].id
+        chunk_number += 1
+        lines = b''.join(
+            json.dumps(dict(_todo_record(t), owner_email=emails.get(t.user_id)), ensure_ascii=False).encode('utf-8') + b'\n'
+            for t in todos)
+        yield from writer.member(f"todos/{chunk_number:05d}.jsonl", [lines], len(lines), now)
+        counts['todos'] += len(todos)
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'generated_at': _iso(generated_at),
+        'since': _iso(since),
+        'after': after,
+        'users': sorted(emails.values()),
+        'counts': counts,
+        'missing_files': missing_files,
+        'last_document_id': last_id if counts['documents'] else after,
+        'next_since': _iso(generated_at),
+    }
+    yield from _json_member(writer, 'manifest.json', manifest, now)
+    yield from writer.finish()
+
+
+# ---------------------------------------------------------------------------
+# import
+
+_ZIP_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_ZIP_LOCAL_SIGNATURE = b'PK\x03\x04'
+_ZIP_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+_ZIP_UTF8_FLAG = 0x800
+
+
+def _zip64_sizes(extra):
+    """(uncompressed, compressed) from a local header's zip64 extra field, or None."""
+    while len(extra) >= 4:
+        tag, length = struct.unpack_from('<HH', extra)
+        if tag == 1 and length >= 16:
+            return struct.unpack_from('<QQ', extra, 4)
+        extra = extra[4 + length:]
+    return None
+
+
+def _copy_deflated(f, out):
+    """Inflate one member into `out`; the deflate stream marks its own end."""
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    while not inflater.eof:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            raise EOFError('ZIP member cut off')
+        out.write(inflater.decompress(chunk))
+    # Step back over what belongs to the next header
+    f.seek(-len(inflater.unused_data), os.SEEK_CUR)
+
+
+def _copy_stored(f, out, size_format):
+    """Copy a stored member written with a data descriptor, whose size is only known from that descriptor.
+
+    The descriptor is the first signature followed by a CRC and size matching
+    the bytes before it, so file content that happens to contain the signature
+    is not mistaken for the end.
+    """
+    descriptor = struct.Struct('<4sI' + size_format * 2)
+    buffered, written, crc = b'', 0, 0
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        buffered += chunk
+        start = buffered.find(_ZIP_DESCRIPTOR_SIGNATURE)
+        while 0 <= start and start + descriptor.size <= len(buffered):
+            _, expected_crc, size, _ = descriptor.unpack_from(buffered, start)
+            if size == written + start and expected_crc == zlib.crc32(buffered[:start], crc):
+                out.write(buffered[:start])
+                f.seek(start - len(buffered), os.SEEK_CUR)
+                return
+            start = buffered.find(_ZIP_DESCRIPTOR_SIGNATURE, start + 1)
+        if not chunk:
+            raise EOFError('ZIP member cut off')
+        # Keep enough for a descriptor straddling the next read
+        keep = min(len(buffered), descriptor.size - 1 if start < 0 else len(buffered) - start)
+        flushed = buffered[:len(buffered) - keep]
+        out.write(flushed)
+        crc = zlib.crc32(flushed, crc)
+        written += len(flushed)
+        buffered = buffered[len(flushed):]
+
+
+def _walk_zip(f):
+    """Yield (name, file object) by walking local file headers, for a ZIP cut off before its central directory."""
+    while True:
+        header = f.read(_ZIP_LOCAL_HEADER.size)
+        if not header or (len(header) >= 4 and header[:4] != _ZIP_LOCAL_SIGNATURE):
+            return  # the central directory, or a cut right after a member
+        if len(header) < _ZIP_LOCAL_HEADER.size:
+            raise EOFError('ZIP header cut off')
+        _, _, flags, method, _, _, crc, compressed_size, _, name_length, extra_length = _ZIP_LOCAL_HEADER.unpack(header)
+        name = f.read(name_length).decode('utf-8' if flags & _ZIP_UTF8_FLAG else 'cp437')
+        extra = f.read(extra_length)
+        if len(extra) < extra_length:
+            raise EOFError('ZIP header cut off')
+        zip64 = _zip64_sizes(extra)
+        if zip64 is not None and compressed_size == 0xffffffff:
+            compressed_size = zip64[1]
+        out = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16)
+        if method == zipfile.ZIP_DEFLATED:
+            _copy_deflated(f, out)
+        elif method != zipfile.ZIP_STORED:
+            raise ExportError(f"Unsupported ZIP compression method {method} for {name}")
+        elif flags & _ZIP_DATA_DESCRIPTOR_FLAG:
+            _copy_stored(f, out, 'Q' if zip64 is not None else 'I')
+        else:
+            data = f.read(compressed_size)
+            if len(data) < compressed_size:
+                raise EOFError('ZIP member cut off')
+            out.write(data)
+        if flags & _ZIP_DATA_DESCRIPTOR_FLAG:
+            size_length = 8 if zip64 is not None else 4
+            descriptor = f.read(4)
+            if descriptor == _ZIP_DESCRIPTOR_SIGNATURE:
+                descriptor = f.read(4)
+            crc = struct.unpack('<I', descriptor)[0] if len(descriptor) == 4 else None
+            if crc is None or len(f.read(2 * size_length)) < 2 * size_length:
+                raise EOFError('ZIP data descriptor cut off')
+        out.seek(0)
+        actual = 0
+        for chunk in iter(lambda: out.read(CHUNK_SIZE), b''):
+            actual = zlib.crc32(chunk, actual)
+        if actual != crc:
+            raise EOFError(f'ZIP member {name} is damaged')
+        out.seek(0)
+        if not name.endswith('/'):
+            yield name, out
+        out.close()
+
+
+def _archive_members(path):
+    """Yield (name, binary file object) in archive order; each object is only valid until the next.
+
+    A ZIP without its central directory (a cut-off download) is read by
+    walking its local headers instead. Anything that is neither ZIP nor tar
+    raises ExportError.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as f:
+                        yield info.filename, f
+        return
+    with open(path, 'rb') as f:
+        if f.read(4) == _ZIP_LOCAL_SIGNATURE:
+            f.seek(0)
+            yield from _walk_zip(f)
+            return
+    try:
+        archive = tarfile.open(path, 'r|*')
+    except tarfile.ReadError as exc:
+        raise ExportError(f"{path} is not a ZIP or tar archive") from exc
+    with archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, archive.extractfile(member)
+
+
+class _Importer:
+    def __init__(self, user=None, batch_size=200):
+        self.user = user
+        self.batch_size = batch_size
+        self.storage = get_storage()
+        self.owners = {}
+        self.pending = []
+        self.spooled = {}
+        self.id_map = {}
+        self.duplicate_links = []
+        self.touched_users = set()
+        self.counts = {'documents': 0, 'updated': 0, 'todos': 0, 'skipped': 0, 'last_document_id': None}
+
+    def owner_id(self, email):
+        if self.user is not None:
+            return self.user.id
+        if not email:
+            return None
+        if email not in self.owners:
+            user = User.query.filter_by(email=email).first()
+            self.owners[email] = user.id if user else None
+        return self.owners[email]
+
+    def spool(self, name, stream):
+        fd, tmp = tempfile.mkstemp(prefix='.import-', dir=current_app.config['UPLOAD_FOLDER'])
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+        except Exception:
+            os.remove(tmp)
+            raise
+        self.spooled[name] = tmp
+
+    def add_document(self, record):
+        self.counts['last_document_id'] = record.get('id')
+        self.pending.append((record, self.spooled.pop(record.get('file'), None)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _unique_key(self, filename):
+        base, ext = os.path.splitext(secure_filename(filename) or 'document')
+        key, counter = base + ext, 1
+        while self.storage.exists(key):
+            key = f"{base}_{counter}{ext}"
+            counter += 1
+        return key
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            for record, tmp in batch:
+                if tmp and not record.get('content_hash'):
+                    record['content_hash'] = file_sha256(tmp)
+            owner_ids = {self.owner_id(r.get('owner_email')) for r, _ in batch} - {None}
+            hashes = [r['content_hash'] for r, _ in batch if r.get('content_hash')]
+            existing = {}
+            if owner_ids and hashes:
+                for document in Document.query.filter(Document.user_id.in_(owner_ids), Document.content_hash.in_(hashes)):
+                    existing[(document.user_id, document.content_hash)] = document
+
+            created, updated, updated_entities = [], [], []
+            for record, tmp in batch:
+                owner = self.owner_id(record.get('owner_email'))
+                document = existing.get((owner, record.get('content_hash')))
+                if owner is None or (document is None and tmp is None):
+                    self.counts['skipped'] += 1
+                    continue
+                self.touched_users.add(owner)
+                if document is not None:
+                    document.category = record.get('category') or 'Other'
+                    document.extracted_text = record.get('extracted_text')
+                    Todo.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+                    # Pages go with extracted_text (an archive without pages falls back to it as page 1)
+                    DocumentPage.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+                    updated.append((document, record))
+                    if 'entities' in record:
+                        DocumentEntity.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+                        updated_entities.append((document, record))
+                    self.counts['updated'] += 1
+                else:
+                    key = self._unique_key(record.get('filename') or record.get('original_filename'))
+                    file_size = self.storage.save_file(key, tmp)
+                    document = Document(
+                        user_id=owner,
+                        filename=key,
+                        original_filename=record.get('original_filename') or key,
+                        file_path=key,
+                        file_size=file_size,
+                        file_type=record.get('file_type') or key.rsplit('.', 1)[-1].lower(),
+                        content_hash=record.get('content_hash'),
+                        extracted_text=record.get('extracted_text'),
+                        category=record.get('category') or 'Other',
+                        upload_date=_parse_iso(record.get('upload_date')) or datetime.utcnow(),
+                        duplicate_score=record.get('duplicate_score'),
+                    )
+                    db.session.add(document)
+                    created.append((document, record))
+                    self.counts['documents'] += 1
+                existing[(owner, record.get('content_hash'))] = document
+                for item in record.get('todos') or ():
+                    db.session.add(self._todo(item, owner, document))
+                    self.counts['todos'] += 1
+            db.session.flush()  # assigns ids to the new documents
+
+            for document, record in created:
+                self.id_map[record['id']] = document.id
+                if record.get('duplicate_of_id'):
+                    self.duplicate_links.append((document.id, record['duplicate_of_id']))
+            pages = [{
+                'document_id': document.id,
+                'page_number': p['page_number'],
+                'text': p.get('text'),
+                'extraction_method': p.get('extraction_method') or 'unknown',
+                'extraction_ms': p.get('extraction_ms'),
+                'char_count': len(p.get('text') or ''),
+            } for document, record in created + updated for p in record.get('pages') or ()]
+            if pages:
+                db.session.execute(DocumentPage.__table__.insert(), pages)
+            entity_rows = [{
+                'document_id': document.id,
+                'user_id': document.user_id,
+                'kind': e['kind'],
+                'value': e.get('value') or e['normalized'],
+                'normalized': e['normalized'],
+            } for document, record in created + updated_entities for e in record.get('entities') or ()
+                if isinstance(e, dict) and e.get('kind') in KINDS and e.get('normalized')]
+            if entity_rows:
+                db.session.execute(DocumentEntity.__table__.insert(), entity_rows)
+            db.session.commit()
+        finally:
+            for _, tmp in batch:
+                if tmp and os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def _todo(self, item, owner, document=None):
+        # ORM inserts (batched by SQLAlchemy) so the reminder schedule listener runs
+        return Todo(
+            user_id=owner,
+            document=document,
+            title=item.get('title') or 'Untitled',
+            description=item.get('description'),
+            due_date=_parse_iso(item.get('due_date')),
+            category=item.get('category') or 'Other',
+            is_completed=bool(item.get('is_completed')),
+            created_date=_parse_iso(item.get('created_date')) or datetime.utcnow(),
+        )
+
+    def add_loose_todos(self, stream):
+        items = [json.loads(line) for line in stream.read().decode('utf-8').splitlines() if line.strip()]
+        by_owner = {}
+        for item in items:
+            owner = self.owner_id(item.get('owner_email'))
+            if owner is None:
+                self.counts['skipped'] += 1
+            else:
+                by_owner.setdefault(owner, []).append(item)
+        for owner, owner_items in by_owner.items():
+            present = set(db.session.query(Todo.title, Todo.due_date).filter(
+                Todo.user_id == owner, Todo.document_id.is_(None),
+                Todo.title.in_({i.get('title') for i in owner_items})))
+            for item in owner_items:
+                if (item.get('title'), _parse_iso(item.get('due_date'))) in present:
+                    continue
+                db.session.add(self._todo(item, owner))
+                self.counts['todos'] += 1
+            self.touched_users.add(owner)
+        db.session.commit()
+
+    def finish(self):
+        self.flush()
+        links = [{'id': new_id, 'duplicate_of_id': self.id_map[old]}
+                 for new_id, old in self.duplicate_links if old in self.id_map]
+        if links:
+            db.session.execute(db.update(Document), links)
+            db.session.commit()
+        for tmp in self.spooled.values():
+            os.remove(tmp)
+        # Files without their document.json are from a cut-off archive
+        self.counts['incomplete'] = len(self.spooled)
+        self.spooled.clear()
+        from app.cache import GROUPS, get_cache
+        for user_id in self.touched_users:
+            get_cache().invalidate(GROUPS, user_id)
+        return self.counts
+
+
+def import_archive(path, user=None, batch_size=200):
+    """Restore an export archive; documents go to `user`, or to the owner recorded in the archive."""
+    importer = _Importer(user, batch_size)
+    manifest = None
+    try:
+        try:
+            for name, stream in _archive_members(path):
+                if name == 'manifest.json':
+                    manifest = json.load(stream)
+                elif name.startswith('documents/') and name.endswith('/document.json'):
+                    importer.add_document(json.load(stream))
+                elif name.startswith('documents/'):
+                    importer.spool(name, stream)
+                elif name.startswith('todos/') and name.endswith('.jsonl'):
+                    importer.add_loose_todos(stream)
+        except (tarfile.ReadError, EOFError, zlib.error) as exc:
+            # A cut-off download: keep every document that arrived whole
+            logger.warning("Archive %s ends early: %s", path, exc)
+        counts = importer.finish()
+    except Exception:
+        db.session.rollback()
+        for tmp in list(importer.spooled.values()) + [t for _, t in importer.pending if t]:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    counts['complete'] = manifest is not None
+    return counts
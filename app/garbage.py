@@ -0,0 +1,272 @@
+"""Deferred removal of storage objects.
+
+Deleting a document does not touch storage. The same transaction that drops
+the row adds the file's key and its rendition keys to the PendingDeletion
+queue, so a crash can delay a removal but cannot leave a file without a row
+(or a row without a file). A Collector removes queued objects after commit:
+
+- it claims rows by pushing not_before forward, so several processes can share
+  the queue
+- it re-checks Document.file_path before deleting anything
+- it retries failed deletes with exponential backoff
+
+sweep() reconciles storage against Document.file_path. It queues
+unreferenced objects with a grace period, because an upload stores its file a
+few seconds before its row is committed. It also removes stale upload spool
+files and can report documents whose file is missing.
+
+With GC_WORKER set (the default), each process runs a Collector thread. The
+thread starts on the first delete and is woken by events.document_deleted.
+`flask --app run storage gc` and `storage sweep` do the same from cron.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import events, metrics
+from app.ingest import SPOOL_PREFIX
+from app.models import Document, PendingDeletion, db
+from app.renditions import RENDITIONS, can_render, rendition_key
+from app.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+GC_OBJECTS = metrics.counter('flik_storage_gc_total', 'Queued storage deletions by outcome', ('outcome',))
+GC_QUEUE = metrics.gauge('flik_storage_gc_queue', 'Storage objects waiting for deletion')
+
+LOOKUP_CHUNK = 500
+
+
+def document_keys(file_path, file_type):
+    """Every storage key owned by a document: the original and its renditions."""
+    keys = [file_path]
+    if can_render(file_type):
+        keys.extend(rendition_key(file_path, kind) for kind in RENDITIONS)
+    return keys
+
+
+def rendition_source(key):
+    """The original's key when `key` is named like a rendition, else None."""
+    for kind in RENDITIONS:
+        suffix = rendition_key('', kind)
+        if key.endswith(suffix) and len(key) > len(suffix):
+            return key[:-len(suffix)]
+    return None
+
+
+def enqueue(keys, reason='deleted', delay=0.0):
+    """Queue keys for removal in the current transaction; the caller commits."""
+    not_before = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.add_all(PendingDeletion(key=key, reason=reason, not_before=not_before) for key in keys)
+
+
+def referenced(keys):
+    """The subset of keys still in use by a document (directly or as one of its renditions)."""
+    keys = list(keys)
+    candidates = set(keys) | {source for source in map(rendition_source, keys) if source}
+    in_use = set()
+    candidates = list(candidates)
+    for start in range(0, len(candidates), LOOKUP_CHUNK):
+        chunk = candidates[start:start + LOOKUP_CHUNK]
+        in_use.update(path for (path,) in db.session.query(Document.file_path).filter(Document.file_path.in_(chunk)))
+    return {key for key in keys if key in in_use or rendition_source(key) in in_use}
+
+
+def queue_depth():
+    return db.session.query(db.func.count(PendingDeletion.id)).scalar() or 0
+
+
+class Collector:
+    """Removes queued storage objects; one per process when GC_WORKER is on."""
+
+    def __init__(self, app, batch_size=200, lease_seconds=300.0, retry_seconds=60.0, max_sleep=60.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.retry_seconds = retry_seconds
+        self.max_sleep = max_sleep
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def due(self, now):
+        return (
+            db.session.query(PendingDeletion.id, PendingDeletion.key, PendingDeletion.attempts)
+            .filter(PendingDeletion.not_before <= now)
+            .order_by(PendingDeletion.id)
+            .limit(self.batch_size)
+            .all()
+        )
+
+    def claim(self, row_id, now):
+        """Lease one row; False if another collector took it first."""
+        claimed = PendingDeletion.query.filter(
+            PendingDeletion.id == row_id, PendingDeletion.not_before <= now
+        ).update({PendingDeletion.not_before: now + self.lease,
+                  PendingDeletion.attempts: PendingDeletion.attempts + 1}, synchronize_session=False)
+        db.session.commit()
+        return bool(claimed)
+
+    def run_once(self, now=None, storage=None):
+        """Process everything due at `now`; returns {'deleted': n, 'kept': n, 'failed': n}."""
+        now = now or datetime.utcnow()
+        storage = storage or get_storage()
+        counts = {'deleted': 0, 'kept': 0, 'failed': 0}
+        while True:
+            batch = self.due(now)
+            claimed = [(row_id, key, attempts) for row_id, key, attempts in batch if self.claim(row_id, now)]
+            if not claimed:
+                break
+            in_use = referenced(key for _, key, _ in claimed)
+            done = []
+            for row_id, key, attempts in claimed:
+                if key in in_use:
+                    # Still (or again) referenced: drop the entry, keep the object
+                    done.append(row_id)
+                    counts['kept'] += 1
+                    continue
+                try:
+                    storage.delete(key)
+                except Exception as exc:
+                    logger.warning("Could not delete %s (attempt %d): %s", key, attempts + 1, exc)
+                    backoff = min(self.retry_seconds * 2 ** attempts, 86400.0)
+                    PendingDeletion.query.filter(PendingDeletion.id == row_id).update({
+                        PendingDeletion.not_before: now + timedelta(seconds=backoff),
+                        PendingDeletion.last_error: str(exc)[:255],
+                    }, synchronize_session=False)
+                    counts['failed'] += 1
+                    continue
+                done.append(row_id)
+                counts['deleted'] += 1
+            if done:
+                PendingDeletion.query.filter(PendingDeletion.id.in_(done)).delete(synchronize_session=False)
+            db.session.commit()
+            if len(batch) < self.batch_size:
+                break
+        for outcome, n in counts.items():
+            if n:
+                GC_OBJECTS.labels(outcome=outcome).inc(n)
+        GC_QUEUE.set(queue_depth())
+        return counts
+
+    def seconds_until_next(self, now=None):
+        now = now or datetime.utcnow()
+        next_at = db.session.query(db.func.min(PendingDeletion.not_before)).scalar()
+        if next_at is None:
+            return self.max_sleep
+        return min(max((next_at - now).total_seconds(), 0.0), self.max_sleep)
+
+    def wake(self):
+        if self._thread is None:
+            self.start()
+        self._wake.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.run_once()
+                    timeout = self.seconds_until_next()
+                except Exception:
+                    logger.exception("Storage GC pass failed")
+                    db.session.rollback()
+                    timeout = self.max_sleep
+                finally:
+                    db.session.remove()
+            self._wake.wait(timeout)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='flik-storage-gc', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def create_collector(app):
+    config = app.config
+    return Collector(
+        app,
+        batch_size=int(config.get('GC_BATCH_SIZE') or 200),
+        lease_seconds=float(config.get('GC_LEASE_SECONDS') or 300),
+        retry_seconds=float(config.get('GC_RETRY_SECONDS') or 60),
+        max_sleep=float(config.get('GC_MAX_SLEEP') or 60),
+    )
+
+
+def sweep(storage=None, grace_seconds=None, check_missing=False, dry_run=False):
+    """Reconcile storage with Document.file_path; returns a dict of counts (and missing document ids)."""
+    storage = storage or get_storage()
+    if grace_seconds is None:
+        grace_seconds = float(current_app.config.get('GC_SWEEP_GRACE_SECONDS') or 3600)
+    report = {'scanned': 0, 'orphans': 0, 'already_queued': 0, 'stale_spools': 0, 'missing': []}
+
+    def reconcile(keys):
+        in_use = referenced(keys)
+        queued = {key for (key,) in db.session.query(PendingDeletion.key).filter(PendingDeletion.key.in_(keys))}
+        orphans = [key for key in keys if key not in in_use and key not in queued]
+        report['already_queued'] += len(queued)
+        report['orphans'] += len(orphans)
+        if orphans and not dry_run:
+            enqueue(orphans, reason='orphan', delay=grace_seconds)
+            db.session.commit()
+
+    chunk = []
+    for key in storage.iter_keys():
+        report['scanned'] += 1
+        chunk.append(key)
+        if len(chunk) >= LOOKUP_CHUNK:
+            reconcile(chunk)
+            chunk = []
+    if chunk:
+        reconcile(chunk)
+
+    # Spool files left behind by uploads that crashed mid-request
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    cutoff = time.time() - grace_seconds
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(SPOOL_PREFIX) and entry.is_file() and entry.stat().st_mtime < cutoff:
+                report['stale_spools'] += 1
+                if not dry_run:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    if check_missing:
+        rows = db.session.query(Document.id, Document.file_path).order_by(Document.id).yield_per(1000)
+        report['missing'] = [document_id for document_id, key in rows if not storage.exists(key)]
+    return report
+
+
+def _wake_receiver(app, **kwargs):
+    collector = app.extensions.get('flik_garbage')
+    if collector is not None:
+        collector.wake()
+
+
+_connected = False
+
+
+def init_garbage(app):
+    """Register the per-process collector (started lazily on the first delete) when GC_WORKER is set."""
+    global _connected
+    if not _connected:
+        events.document_deleted.connect(_wake_receiver, weak=False)
+        _connected = True
+    if app.config.get('GC_WORKER'):
+        app.extensions['flik_garbage'] = create_collector(app)
+
+
+def get_collector():
+    return current_app.extensions.get('flik_garbage')
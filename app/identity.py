@@ -0,0 +1,126 @@
+"""Per-process cache of signed-in user identities.
+
+Flask-Login calls load_user on every authenticated request, including small
+AJAX calls like toggle_todo. Instead of loading the User row each time,
+load_user returns a CachedUser snapshot. The snapshot holds the fields that
+templates and permission checks read (id, email, names, created_at, the
+admin flag) and is kept for IDENTITY_CACHE_TTL seconds.
+
+The cache lives in app.extensions, one per app and process. Login, signup
+and edit_profile replace the entry in their own process. Other processes pick up the
+change when the TTL expires, so keep the TTL short. Code that changes a user
+must load the real row (db.session.get(User, current_user.id)), because a
+CachedUser is not attached to a session.
+
+flik_identity_cache_total{result} counts hits and misses. Each hit is one
+query saved, which instrumentation also reports per request as
+flik_db_queries_saved_per_request.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from flask_login import UserMixin
+
+from app import metrics
+from app.instrumentation import note_queries_saved
+from app.models import User, db
+
+IDENTITY_LOOKUPS = metrics.counter(
+    'flik_identity_cache_total', 'Identity cache lookups in load_user by result', ('result',))
+
+
+class CachedUser(UserMixin):
+    """Read-only snapshot of a User with the same template-facing surface."""
+
+    FIELDS = ('id', 'email', 'first_name', 'last_name', 'name', 'created_at', 'is_admin')
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{field: getattr(user, field, None) for field in cls.FIELDS})
+
+    get_full_name = User.get_full_name
+    get_initials = User.get_initials
+
+    def __repr__(self):
+        return f'<CachedUser {self.email}>'
+
+
+class IdentityCache:
+    """Bounded LRU of CachedUser snapshots with a TTL; thread-safe."""
+
+    def __init__(self, ttl=60.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def put(self, user):
+        snapshot = CachedUser.from_user(user)
+        with self._lock:
+            self._entries[snapshot.id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id=None):
+        """Drop one user (or everyone when user_id is None)."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_identity_cache():
+    return current_app.extensions.get('flik_identity')
+
+
+def load_identity(user_id):
+    """load_user body: a cached snapshot, or the row on a miss (None if there is no such user)."""
+    cache = get_identity_cache()
+    if cache is None:
+        return db.session.get(User, user_id)
+    snapshot = cache.get(user_id)
+    if snapshot is not None:
+        IDENTITY_LOOKUPS.labels(result='hit').inc()
+        note_queries_saved(1)
+        return snapshot
+    IDENTITY_LOOKUPS.labels(result='miss').inc()
+    user = db.session.get(User, user_id)
+    return cache.put(user) if user is not None else None
+
+
+def remember(user):
+    """Refresh the snapshot after a login or a change to the user."""
+    cache = get_identity_cache()
+    if cache is not None:
+        cache.put(user)
+
+
+def init_identity(app):
+    """Install the cache unless IDENTITY_CACHE_TTL is 0."""
+    ttl = float(app.config.get('IDENTITY_CACHE_TTL') or 0)
+    if ttl > 0:
+        app.extensions['flik_identity'] = IdentityCache(ttl, int(app.config.get('IDENTITY_CACHE_MAX_ENTRIES') or 10000))
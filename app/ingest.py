@@ -0,0 +1,212 @@
+"""The upload pipeline shared by the HTML upload form and the JSON API.
+
+ingest_upload() runs the stages for one uploaded file, in order:
+1. spool to a temp file
+2. hash
+3. extract text per page
+4. save to storage
+5. AI analysis (category, todos, entities)
+6. near-duplicate lookup
+7. database write
+
+It then fires events.document_uploaded and schedules renditions. Each stage
+is timed in flik_upload_stage_seconds. The stages are separate functions over a
+PendingUpload, so app.asgi can run the same pipeline with each stage on an
+executor.
+"""
+import os
+import tempfile
+from collections import namedtuple
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from app import entities, events, metrics
+from app.dedup import canonical, compute_signature, filter_duplicate_todos, find_near_duplicates, index_document
+from app.models import Document, DocumentPage, Todo, db
+from app.scoping import dedup_scope
+from app.renditions import schedule_renditions
+from app.serving import file_sha256
+from app.storage import get_storage
+from app.utils import extract_pages_from_file, get_file_size, pages_to_text, process_document_with_ai
+
+ALLOWED_EXTENSIONS = {"pdf", "png", "jpg", "jpeg", "docx", "txt"}
+
+UPLOAD_STAGE_SECONDS = metrics.histogram(
+    'flik_upload_stage_seconds', 'Time spent in each upload pipeline stage', ('stage', 'file_type'))
+UPLOADS = metrics.counter('flik_uploads_total', 'Uploads by file type and outcome', ('file_type', 'outcome'))
+
+SPOOL_PREFIX = ".upload-"
+
+IngestResult = namedtuple('IngestResult', 'document original duplicate_score')
+
+
+def allowed_file(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+class PendingUpload:
+    """An upload moving through the pipeline; stages fill in the attributes."""
+
+    def __init__(self, original_filename, mimetype, user_id):
+        self.original_filename = original_filename
+        self.mimetype = mimetype
+        self.user_id = user_id
+        self.filename = secure_filename(original_filename)
+        self.file_type = self.filename.rsplit(".", 1)[1].lower()
+        self.tmp_path = None
+        self.file_size = None
+        self.content_hash = None
+        self.pages = []
+        self.extracted_text = ''
+        self.category = None
+        self.todos = []
+        self.entities = {}
+
+
+def stage(upload, name):
+    return metrics.timer(UPLOAD_STAGE_SECONDS, stage=name, file_type=upload.file_type)
+
+
+def begin(original_filename, mimetype, user_id):
+    """Pick a free storage key and a temp file to spool the upload into."""
+    upload = PendingUpload(original_filename, mimetype, user_id)
+    storage = get_storage()
+    # avoid clobbering: if exists, append counter
+    base, ext = os.path.splitext(upload.filename)
+    counter = 1
+    while storage.exists(upload.filename):
+        upload.filename = f"{base}_{counter}{ext}"
+        counter += 1
+
+    # Spool to a local temp file (same filesystem as local storage, so the
+    # final save is a rename), extract from it, then hand it to storage
+    fd, upload.tmp_path = tempfile.mkstemp(suffix=ext, prefix=SPOOL_PREFIX, dir=current_app.config["UPLOAD_FOLDER"])
+    os.close(fd)
+    return upload
+
+
+def hash_file(upload):
+    with stage(upload, "hash"):
+        upload.file_size = get_file_size(upload.tmp_path)
+        upload.content_hash = file_sha256(upload.tmp_path)
+
+
+def set_pages(upload, pages):
+    upload.pages = pages
+    upload.extracted_text = pages_to_text(pages)
+
+
+def extract(upload):
+    """Extract text page by page."""
+    with stage(upload, "extract"):
+        set_pages(upload, extract_pages_from_file(upload.tmp_path, upload.file_type))
+
+
+def store(upload):
+    with stage(upload, "store"):
+        get_storage().save_file(upload.filename, upload.tmp_path, content_type=upload.mimetype)
+
+
+def discard(upload):
+    if upload.tmp_path and os.path.exists(upload.tmp_path):
+        os.remove(upload.tmp_path)
+
+
+def failed(upload):
+    UPLOADS.labels(file_type=upload.file_type, outcome="error").inc()
+
+
+def analyze(upload):
+    """Process with AI for categorization and appointment extraction."""
+    with stage(upload, "analyze"):
+        upload.category, upload.todos, upload.entities = process_document_with_ai(
+            upload.extracted_text, upload.original_filename)
+
+
+def finish(upload):
+    """Near-duplicate lookup, database write, events and renditions; returns an IngestResult."""
+    user_id = upload.user_id
+    appointments_todos = upload.todos
+
+    # Near-duplicate lookup: link to the original and drop todos it already produced
+    with stage(upload, "dedup"):
+        signature = compute_signature(upload.extracted_text)
+        original, duplicate_score = None, None
+        if signature:
+            matches = find_near_duplicates(signature, scope=dedup_scope(user_id))
+            if matches:
+                original, duplicate_score = matches[0]
+                original = canonical(original)
+                appointments_todos = filter_duplicate_todos(appointments_todos, original)
+
+    # Save to database
+    with stage(upload, "db"):
+        document = Document(
+            user_id=user_id,
+            filename=upload.filename,
+            original_filename=upload.original_filename,
+            file_path=upload.filename,  # storage key
+            file_size=upload.file_size,
+            file_type=upload.file_type,
+            content_hash=upload.content_hash,
+            extracted_text=upload.extracted_text,
+            category=upload.category,
+            duplicate_of_id=original.id if original else None,
+            duplicate_score=duplicate_score
+        )
+
+        db.session.add(document)
+        db.session.flush()  # Get the document ID
+        if signature:
+            index_document(document, signature)
+
+        for page in upload.pages:
+            db.session.add(DocumentPage(
+                document_id=document.id,
+                page_number=page['page_number'],
+                text=page['text'],
+                extraction_method=page['method'],
+                extraction_ms=page['duration_ms'],
+                char_count=len(page['text'])
+            ))
+
+        # Create todos/appointments from AI extraction
+        for item in appointments_todos:
+            db.session.add(Todo(
+                title=item['title'],
+                description=item['description'],
+                due_date=item['due_date'],
+                category=item['category'],
+                user_id=user_id,
+                document_id=document.id
+            ))
+        entities.store(document, upload.entities)
+
+        db.session.commit()
+    events.fire(events.document_uploaded, user_id=user_id, document=document)
+    schedule_renditions(get_storage(), upload.filename, upload.file_type)
+    UPLOADS.labels(file_type=upload.file_type, outcome="duplicate" if original else "ok").inc()
+    return IngestResult(document, original, duplicate_score)
+
+
+def ingest_upload(file, user_id):
+    """Store, extract, analyze and record an uploaded werkzeug FileStorage for user_id.
+
+    The caller checks allowed_file() first. Returns an IngestResult whose
+    `original` is the canonical document this one near-duplicates, or None.
+    """
+    upload = begin(file.filename, file.mimetype, user_id)
+    try:
+        with stage(upload, "save"):
+            file.save(upload.tmp_path)
+        hash_file(upload)
+        extract(upload)
+        store(upload)
+    except Exception:
+        failed(upload)
+        raise
+    finally:
+        discard(upload)
+    analyze(upload)
+    return finish(upload)
@@ -0,0 +1,106 @@
+"""Per-request metrics: route latency and status, plus SQL query counts and time.
+
+Queries are timed with SQLAlchemy cursor events and summed on flask.g, so each
+request reports how many statements it ran and how long they took in total.
+Queries outside a request (CLI commands, background threads) only feed the
+per-statement histogram. Caches that answer without the database call
+note_queries_saved(), reported per request next to the query count. When the
+profiler puts a list at g.flik_sql_log, statements are also appended there.
+"""
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import metrics
+
+HTTP_REQUESTS = metrics.counter(
+    'flik_http_requests_total', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    'flik_http_request_seconds', 'HTTP request latency', ('endpoint', 'method'))
+DB_QUERY_SECONDS = metrics.histogram(
+    'flik_db_query_seconds', 'SQL statement latency by statement type', ('operation',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+DB_QUERIES_PER_REQUEST = metrics.histogram(
+    'flik_db_queries_per_request', 'SQL statements executed per request', ('endpoint',),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+DB_SECONDS_PER_REQUEST = metrics.histogram(
+    'flik_db_seconds_per_request', 'Total SQL time per request', ('endpoint',))
+DB_QUERIES_SAVED_PER_REQUEST = metrics.histogram(
+    'flik_db_queries_saved_per_request', 'SQL statements avoided by in-process caches per request', ('endpoint',),
+    buckets=(0, 1, 2, 5, 10, 20, 50))
+
+SQL_LOG_LIMIT = 1000
+
+_installed = False
+
+
+def _operation(statement):
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else 'UNKNOWN'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('flik_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('flik_query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    DB_QUERY_SECONDS.labels(operation=_operation(statement)).observe(elapsed)
+    if has_app_context() and 'flik_request_started' in g:
+        g.flik_query_count += 1
+        g.flik_query_seconds += elapsed
+        log = g.get('flik_sql_log')
+        if log is not None and len(log) < SQL_LOG_LIMIT:
+            log.append((statement, elapsed))
+
+
+def note_queries_saved(n=1):
+    """Record that a cache hit avoided n SQL statements in the current request."""
+    if has_app_context() and 'flik_queries_saved' in g:
+        g.flik_queries_saved += n
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _start_request():
+    g.flik_request_started = time.perf_counter()
+    g.flik_query_count = 0
+    g.flik_query_seconds = 0.0
+    g.flik_queries_saved = 0
+
+
+def _finish_request(response):
+    started = g.pop('flik_request_started', None)
+    if started is None:
+        return response
+    endpoint = _endpoint()
+    HTTP_REQUESTS.labels(endpoint=endpoint, method=request.method, status=str(response.status_code)).inc()
+    HTTP_REQUEST_SECONDS.labels(endpoint=endpoint, method=request.method).observe(time.perf_counter() - started)
+    DB_QUERIES_PER_REQUEST.labels(endpoint=endpoint).observe(g.flik_query_count)
+    DB_SECONDS_PER_REQUEST.labels(endpoint=endpoint).observe(g.flik_query_seconds)
+    DB_QUERIES_SAVED_PER_REQUEST.labels(endpoint=endpoint).observe(g.flik_queries_saved)
+    return response
+
+
+def _teardown_request(exc):
+    # after_request is skipped for unhandled exceptions; count those as 500s
+    if exc is not None and g.pop('flik_request_started', None) is not None:
+        HTTP_REQUESTS.labels(endpoint=_endpoint(), method=request.method, status='500').inc()
+
+
+def init_instrumentation(app):
+    global _installed
+    if not _installed:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _installed = True
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
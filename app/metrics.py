@@ -0,0 +1,175 @@
+"""Application metrics.
+
+Metrics are declared through counter(), gauge() and histogram(), which return
+prometheus_client objects when that package is installed and a small
+in-process equivalent otherwise, so instrumented code never has to care.
+render() produces the Prometheus text exposition format.
+
+Under gunicorn each worker has its own memory, so a scrape would only see the
+worker that answered it. With prometheus_client installed and
+PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py does this), workers write their
+samples to files in that directory and render() aggregates all of them. The
+in-process fallback is per-process only.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import prometheus_client as _prom
+    _HAS_PROMETHEUS = True
+except Exception:
+    _HAS_PROMETHEUS = False
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class _Child:
+    def __init__(self, kind, buckets):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        if kind == 'histogram':
+            self.buckets = buckets
+            self.counts = [0] * (len(buckets) + 1)
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def observe(self, amount):
+        with self._lock:
+            self.value += amount
+            self.counts[bisect_left(self.buckets, amount)] += 1
+
+
+class _LocalMetric:
+    """Minimal stand-in for a prometheus_client metric with the same call surface."""
+
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = _Child(kind, self.buckets)
+
+    def labels(self, *values, **kwargs):
+        key = tuple(str(kwargs[n]) for n in self.labelnames) if kwargs else tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = _Child(self.kind, self.buckets)
+            return child
+
+    def inc(self, amount=1.0):
+        self._children[()].inc(amount)
+
+    def dec(self, amount=1.0):
+        self._children[()].dec(amount)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def observe(self, amount):
+        self._children[()].observe(amount)
+
+    def _fmt_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (v.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        kind = 'counter' if self.kind == 'counter' else self.kind
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {kind}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            if self.kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{self.name}_bucket{self._fmt_labels(key, [("le", le)])} {cumulative}')
+                lines.append(f'{self.name}_sum{self._fmt_labels(key)} {child.value}')
+                lines.append(f'{self.name}_count{self._fmt_labels(key)} {cumulative}')
+            else:
+                suffix = '_total' if self.kind == 'counter' and not self.name.endswith('_total') else ''
+                lines.append(f'{self.name}{suffix}{self._fmt_labels(key)} {child.value}')
+        return '\n'.join(lines)
+
+
+def _get_or_create(kind, name, documentation, labelnames, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            if _HAS_PROMETHEUS:
+                factory = {'counter': _prom.Counter, 'gauge': _prom.Gauge, 'histogram': _prom.Histogram}[kind]
+                metric = factory(name, documentation, labelnames, **kwargs)
+            else:
+                metric = _LocalMetric(kind, name, documentation, labelnames, **kwargs)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _get_or_create('counter', name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=(), multiprocess_mode='livemax'):
+    """multiprocess_mode says how worker values combine (see prometheus_client.Gauge)."""
+    if _HAS_PROMETHEUS:
+        return _get_or_create('gauge', name, documentation, labelnames, multiprocess_mode=multiprocess_mode)
+    return _get_or_create('gauge', name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _get_or_create('histogram', name, documentation, labelnames, buckets=buckets)
+
+
+@contextmanager
+def timer(metric, **labels):
+    """Observe the duration of the with-block (in seconds) on a histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        target = metric.labels(**labels) if labels else metric
+        target.observe(time.perf_counter() - started)
+
+
+def multiprocess_enabled():
+    return _HAS_PROMETHEUS and bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def render():
+    """Return (body, content_type) in the Prometheus text format."""
+    if multiprocess_enabled():
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return _prom.generate_latest(registry), _prom.CONTENT_TYPE_LATEST
+    if _HAS_PROMETHEUS:
+        return _prom.generate_latest(), _prom.CONTENT_TYPE_LATEST
+    with _registry_lock:
+        metrics = list(_registry.values())
+    body = '\n'.join(m.render() for m in sorted(metrics, key=lambda m: m.name)) + '\n'
+    return body.encode('utf-8'), CONTENT_TYPE
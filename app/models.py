@@ -5,14 +5,30 @@ from flask_login import UserMixin
 
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # NULL only for pre-ownership rows
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
     file_type = db.Column(db.String(50), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of the original, used as ETag
     extracted_text = db.Column(db.Text, nullable=True)
     category = db.Column(db.String(50), nullable=False, default='Other')
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    minhash = db.Column(db.LargeBinary, nullable=True)
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True, index=True)
+    duplicate_score = db.Column(db.Float, nullable=True)
+
+    duplicate_of = db.relationship('Document', remote_side=[id], backref=db.backref('duplicates', lazy='dynamic'))
+    # Computed in SQL so listings can defer extracted_text and still report it
+    has_text = db.column_property(db.and_(extracted_text.isnot(None), extracted_text != ''))
+
+    # Every user-facing query filters on user_id first (see app.scoping)
+    __table_args__ = (
+        db.Index('ix_document_user_upload_date', 'user_id', 'upload_date'),
+        db.Index('ix_document_user_category', 'user_id', 'category'),
+    )
     
     def __repr__(self):
         return f'<Document {self.filename}>'
@@ -26,18 +42,128 @@ class Document(db.Model):
             'file_type': self.file_type,
             'category': self.category,
             'upload_date': self.upload_date.isoformat(),
-            'has_text': bool(self.extracted_text)
+            'has_text': bool(self.has_text),
+            'duplicate_of_id': self.duplicate_of_id
         }
 
+class DocumentPage(db.Model):
+    """Text of a single page, as produced by the extraction pipeline."""
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    page_number = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=True)
+    extraction_method = db.Column(db.String(50), nullable=False, default='unknown')
+    extraction_ms = db.Column(db.Float, nullable=True)
+    char_count = db.Column(db.Integer, nullable=False, default=0)
+
+    document = db.relationship(
+        'Document',
+        backref=db.backref('pages', lazy='dynamic', cascade='all, delete-orphan', order_by='DocumentPage.page_number')
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'page_number', name='uq_document_page_number'),
+    )
+
+    def __repr__(self):
+        return f'<DocumentPage {self.document_id}:{self.page_number}>'
+
+    def to_dict(self):
+        return {
+            'page_number': self.page_number,
+            'text': self.text or '',
+            'extraction_method': self.extraction_method,
+            'extraction_ms': self.extraction_ms,
+            'char_count': self.char_count
+        }
+
+class DocumentLSHBand(db.Model):
+    """One LSH band bucket of a document's MinHash signature (see app.dedup)."""
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+    band = db.Column(db.SmallInteger, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False, index=True)
+
+    document = db.relationship(
+        'Document',
+        backref=db.backref('lsh_bands', lazy='dynamic', cascade='all, delete-orphan')
+    )
+
+    def __repr__(self):
+        return f'<DocumentLSHBand {self.document_id}:{self.band}>'
+
+class DocumentEntity(db.Model):
+    """A normalized entity (doctor, hospital, medicine, insurance number) found in a document (see app.entities)."""
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # copied from the document for facet queries
+    kind = db.Column(db.String(32), nullable=False)
+    value = db.Column(db.String(255), nullable=False)  # as first seen, for display
+    normalized = db.Column(db.String(255), nullable=False)
+
+    document = db.relationship(
+        'Document',
+        backref=db.backref('entities', lazy='dynamic', cascade='all, delete-orphan', order_by='DocumentEntity.kind')
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'kind', 'normalized', name='uq_document_entity'),
+        # Facet counts group by (kind, normalized) and filters look up document_id, all within one user
+        db.Index('ix_document_entity_facet', 'user_id', 'kind', 'normalized', 'document_id'),
+    )
+
+    def __repr__(self):
+        return f'<DocumentEntity {self.kind}:{self.normalized}>'
+
+    def to_dict(self):
+        return {'kind': self.kind, 'value': self.value, 'normalized': self.normalized}
+
+class CacheGeneration(db.Model):
+    """Invalidation counter for one cache group and scope (see app.cache)."""
+    name = db.Column(db.String(120), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CacheGeneration {self.name}={self.value}>'
+
+class PendingDeletion(db.Model):
+    """A storage object queued for removal (see app.garbage).
+
+    Rows are written in the same transaction that drops the last reference, so
+    a crash can delay a file's removal but never orphan it.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(500), nullable=False, index=True)
+    reason = db.Column(db.String(20), nullable=False, default='deleted')  # deleted | orphan
+    enqueued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    not_before = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+
+    def __repr__(self):
+        return f'<PendingDeletion {self.key}>'
+
 class Todo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # NULL only for pre-ownership rows
     title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text, nullable=True)
     due_date = db.Column(db.DateTime, nullable=True)
     category = db.Column(db.String(50), nullable=False, default='Other')
     is_completed = db.Column(db.Boolean, default=False)
-    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True, index=True)
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Reminder schedule, maintained by app.reminders (NULL = nothing to send)
+    next_reminder_at = db.Column(db.DateTime, nullable=True, index=True)
+    last_reminded_at = db.Column(db.DateTime, nullable=True)
+    reminder_lease_owner = db.Column(db.String(64), nullable=True)
+    reminder_lease_until = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_todo_user_due_date', 'user_id', 'due_date'),
+        db.Index('ix_todo_user_completed_due_date', 'user_id', 'is_completed', 'due_date'),
+    )
     
     document = db.relationship('Document', backref=db.backref('todos', lazy=True))
     
@@ -64,6 +190,8 @@ class User(db.Model, UserMixin):
     name = db.Column(db.String(255), nullable=True)  # Keep for backward compatibility
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Granted only with `flask admins grant`; never derived from the (user-editable) email
+    is_admin = db.Column(db.Boolean, nullable=False, default=False)
 
     def set_password(self, password: str):
         self.password_hash = generate_password_hash(password)
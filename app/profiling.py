@@ -0,0 +1,272 @@
+"""On-demand request profiling and slow-request capture.
+
+A request is profiled with cProfile when it carries the X-Flik-Profile header
+(set to PROFILE_TOKEN, or to any value by a signed-in admin) or when it is
+picked by PROFILE_SAMPLE_RATE. With PROFILE_SLOW_MS set, every request is also
+watched by a low-frequency stack sampler, and requests slower than the
+threshold are kept along with their sampled stacks. Each capture includes the
+SQL statements the request ran (statement text and time, no parameters).
+
+Captures are JSON files in PROFILE_DIR (cProfile runs also get a .prof file
+for snakeviz/pstats). Only the newest PROFILE_KEEP are kept. They are listed
+under /admin/profiles. With all three triggers off, the cost per request is
+one header lookup.
+"""
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Flik-Profile'
+STATS_LINES = 80
+MAX_STACKS = 300
+# Serving profiles (or static files) should never produce more profiles
+EXCLUDED_ENDPOINTS = {'static', 'serve_asset', 'main.metrics_endpoint',
+                      'admin.profiles', 'admin.profile_detail', 'admin.profile_download'}
+
+_ID_RE = re.compile(r'^[0-9]+-[0-9a-f]+$')
+
+CAPTURES = metrics.counter('flik_profiles_captured_total', 'Stored request profiles by trigger', ('reason',))
+
+
+class ProfileStore:
+    """Profiles as JSON files in one directory, pruned to the newest `keep`."""
+
+    def __init__(self, directory, keep=200):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id, suffix='.json'):
+        if not _ID_RE.match(profile_id or ''):
+            return None
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def save(self, record, profiler=None):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{int(time.time() * 1000)}-{secrets.token_hex(4)}"
+        record['id'] = profile_id
+        if profiler is not None:
+            profiler.dump_stats(self._path(profile_id, '.prof'))
+            record['has_raw'] = True
+        tmp = self._path(profile_id) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp, self._path(profile_id))
+        self._rotate()
+        return profile_id
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((n[:-5] for n in names if n.endswith('.json') and _ID_RE.match(n[:-5])), reverse=True)
+
+    def _rotate(self):
+        with self._lock:
+            for profile_id in self._ids()[self.keep:]:
+                for suffix in ('.json', '.prof'):
+                    try:
+                        os.remove(self._path(profile_id, suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self, limit=200):
+        """Newest first, without the bulky profile and SQL bodies."""
+        items = []
+        for profile_id in self._ids()[:limit]:
+            record = self.load(profile_id)
+            if record:
+                record.pop('profile', None)
+                record.pop('sql', None)
+                items.append(record)
+        return items
+
+    def load(self, profile_id):
+        path = self._path(profile_id)
+        if not path:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def raw_path(self, profile_id):
+        path = self._path(profile_id, '.prof')
+        return path if path and os.path.exists(path) else None
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class StackSampler:
+    """One daemon thread that samples the stacks of threads currently serving a request."""
+
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, ident):
+        with self._lock:
+            self._active[ident] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='flik-stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, ident):
+        with self._lock:
+            return self._active.pop(ident, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                targets = list(self._active.items())
+            frames = sys._current_frames()
+            for ident, counts in targets:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    counts[';'.join(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    def __init__(self, app):
+        self.token = app.config.get('PROFILE_TOKEN') or ''
+        self.sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE') or 0)
+        self.slow_seconds = float(app.config.get('PROFILE_SLOW_MS') or 0) / 1000.0
+        self.store = ProfileStore(app.config['PROFILE_DIR'], int(app.config.get('PROFILE_KEEP') or 200))
+        interval = float(app.config.get('PROFILE_SAMPLE_INTERVAL_MS') or 10) / 1000.0
+        self.sampler = StackSampler(interval) if self.slow_seconds else None
+
+    def _authorized(self, value):
+        if self.token and hmac.compare_digest(value.encode(), self.token.encode()):
+            return True
+        from app.admin import is_admin
+        return is_admin()
+
+    def before_request(self):
+        if request.endpoint in EXCLUDED_ENDPOINTS:
+            return
+        header = request.headers.get(PROFILE_HEADER)
+        reason = None
+        if header and self._authorized(header):
+            reason = 'header'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            reason = 'sampled'
+        if reason is None and not self.slow_seconds:
+            return
+
+        state = {'started': time.perf_counter(), 'reason': reason, 'profiler': None, 'sampled_thread': None}
+        g.flik_sql_log = []
+        if reason:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                state['profiler'] = profiler
+            except ValueError:
+                # Another profiler (e.g. a debugger) owns the hook; keep SQL and timing only
+                logger.warning("cProfile unavailable for %s", request.path)
+        else:
+            state['sampled_thread'] = threading.get_ident()
+            self.sampler.start(state['sampled_thread'])
+        g.flik_profile = state
+
+    def after_request(self, response):
+        profile_id = self._finish(response.status_code)
+        if profile_id and response is not None and request.headers.get(PROFILE_HEADER):
+            response.headers['X-Flik-Profile-Id'] = profile_id
+        return response
+
+    def teardown_request(self, exc):
+        # Unhandled exceptions skip after_request
+        if 'flik_profile' in g:
+            self._finish(500)
+
+    def _finish(self, status):
+        state = g.pop('flik_profile', None)
+        if state is None:
+            return None
+        sql = g.pop('flik_sql_log', None) or []
+        duration = time.perf_counter() - state['started']
+        profiler = state['profiler']
+        if profiler is not None:
+            profiler.disable()
+        samples = self.sampler.stop(state['sampled_thread']) if state['sampled_thread'] else None
+
+        reason = state['reason'] or ('slow' if duration >= self.slow_seconds else None)
+        if reason is None:
+            return None
+
+        record = {
+            'reason': reason,
+            'created': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': status,
+            'duration_ms': round(duration * 1000.0, 2),
+            'sql_count': len(sql),
+            'sql_ms': round(sum(elapsed for _, elapsed in sql) * 1000.0, 2),
+            'sql': [{'statement': s, 'ms': round(elapsed * 1000.0, 3)} for s, elapsed in sql],
+        }
+        if profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(STATS_LINES)
+            record['profile'] = {'type': 'cprofile', 'text': out.getvalue()}
+        elif samples:
+            record['profile'] = {
+                'type': 'sampling',
+                'interval_ms': self.sampler.interval * 1000.0,
+                'samples': sum(samples.values()),
+                'stacks': samples.most_common(MAX_STACKS),
+            }
+        try:
+            profile_id = self.store.save(record, profiler)
+        except OSError:
+            logger.exception("Could not store request profile")
+            return None
+        CAPTURES.labels(reason=reason).inc()
+        return profile_id
+
+
+def get_profiler():
+    return current_app.extensions['flik_profiler']
+
+
+def init_profiling(app):
+    profiler = RequestProfiler(app)
+    app.extensions['flik_profiler'] = profiler
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.teardown_request(profiler.teardown_request)
+    return profiler
@@ -0,0 +1,426 @@
+"""Due-date reminders for todos and appointments.
+
+Every open todo with a future due date carries `next_reminder_at`, which is kept
+up to date by a mapper listener on each insert or update. Edits, completion and
+rescheduling are picked up no matter which code path wrote the row, and a
+deleted todo takes its schedule with it. REMINDER_LEAD_MINUTES sets how long
+before the due date reminders go out (default 1440,60: a day and an hour
+before).
+
+The scheduler never scans the todo table. The index on next_reminder_at is its
+priority queue: it reads the due batch with a range scan, sends it, then sleeps
+until MIN(next_reminder_at) (capped at REMINDER_MAX_SLEEP so that rows written
+by other processes are noticed). Local todo events wake it early.
+
+Several schedulers can run at once, across workers or nodes. A node claims a
+row with a compare-and-set lease (owner plus expiry) before sending, so only
+one node sends each reminder. If a node dies mid-send, the lease expires and
+another node retries. Delivery is therefore at-least-once only across crashes.
+
+Notifiers are chosen with REMINDER_NOTIFIERS (comma-separated): log (default),
+fake (records in memory, for tests), sendgrid and fcm.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm.attributes import flag_modified
+
+from app import events, metrics
+from app.models import Todo, User, db
+
+try:
+    from sendgrid import SendGridAPIClient
+    from sendgrid.helpers.mail import Mail
+    _HAS_SENDGRID = True
+except Exception:
+    _HAS_SENDGRID = False
+
+try:
+    import firebase_admin
+    from firebase_admin import credentials as firebase_credentials, messaging as firebase_messaging
+    _HAS_FIREBASE = True
+except Exception:
+    _HAS_FIREBASE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEAD_MINUTES = (1440, 60)
+
+REMINDERS_SENT = metrics.counter('flik_reminders_total', 'Reminder deliveries by outcome', ('outcome',))
+REMINDER_LAG_SECONDS = metrics.histogram(
+    'flik_reminder_lag_seconds', 'Delay between a reminder falling due and being sent',
+    buckets=(0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0))
+REMINDER_CLAIM_CONFLICTS = metrics.counter(
+    'flik_reminder_claim_conflicts_total', 'Due reminders already claimed by another scheduler')
+
+Reminder = namedtuple('Reminder', 'todo_id user_id email name title description due_date fire_at')
+
+
+def parse_leads(value):
+    """'1440,60' -> (timedelta(minutes=1440), timedelta(minutes=60))."""
+    if isinstance(value, (list, tuple)):
+        minutes = value
+    else:
+        minutes = [m for m in str(value or '').replace(' ', '').split(',') if m]
+    return tuple(timedelta(minutes=float(m)) for m in minutes) or tuple(
+        timedelta(minutes=m) for m in DEFAULT_LEAD_MINUTES)
+
+
+def next_reminder_time(due_date, leads, after=None, now=None):
+    """When the next reminder for something due at due_date should fire.
+
+    Returns the latest lead time that has already passed without being sent
+    (stale earlier reminders are skipped), otherwise the earliest future one.
+    Returns None once the due date has passed.
+    """
+    now = now or datetime.utcnow()
+    if due_date is None or due_date <= now:
+        return None
+    pending = sorted(t for t in (due_date - lead for lead in leads) if after is None or t > after)
+    if not pending:
+        return None
+    reached = [t for t in pending if t <= now]
+    return reached[-1] if reached else pending[0]
+
+
+def _configured_leads():
+    if has_app_context():
+        return current_app.config.get('REMINDER_LEADS') or parse_leads(DEFAULT_LEAD_MINUTES)
+    return parse_leads(DEFAULT_LEAD_MINUTES)
+
+
+def schedule(todo, now=None):
+    """Recompute todo.next_reminder_at from its current state."""
+    if todo.is_completed or todo.user_id is None:
+        todo.next_reminder_at = None
+    else:
+        todo.next_reminder_at = next_reminder_time(todo.due_date, _configured_leads(), todo.last_reminded_at, now)
+
+
+def _keep_updated_at(todo):
+    """Write updated_at back unchanged, so scheduler bookkeeping does not look like an edit (exports use it)."""
+    flag_modified(todo, 'updated_at')
+
+
+def _before_insert(mapper, connection, todo):
+    schedule(todo)
+
+
+def _before_update(mapper, connection, todo):
+    if inspect(todo).attrs.due_date.history.has_changes():
+        # A new due date restarts the reminder sequence
+        todo.last_reminded_at = None
+    schedule(todo)
+
+
+# ---------------------------------------------------------------------------
+# notifiers
+
+class LogNotifier:
+    name = 'log'
+
+    def send(self, reminder):
+        logger.info("Reminder for user %s: %s (due %s)", reminder.user_id, reminder.title, reminder.due_date)
+
+
+class FakeNotifier:
+    """Keeps sent reminders in memory; optionally fails, for tests."""
+    name = 'fake'
+
+    def __init__(self):
+        self.sent = []
+        self.fail = False
+
+    def send(self, reminder):
+        if self.fail:
+            raise RuntimeError('fake notifier failure')
+        self.sent.append(reminder)
+
+
+def _message(reminder):
+    when = reminder.due_date.strftime('%a %d %b %Y %H:%M')
+    subject = f"Reminder: {reminder.title}"
+    body = f"{reminder.title} is due {when}."
+    if reminder.description:
+        body += f"\n\n{reminder.description}"
+    return subject, body
+
+
+class SendGridNotifier:
+    name = 'sendgrid'
+
+    def __init__(self, api_key, from_email):
+        if not _HAS_SENDGRID:
+            raise RuntimeError("The sendgrid notifier needs the sendgrid package (pip install sendgrid)")
+        if not api_key or not from_email:
+            raise RuntimeError("The sendgrid notifier needs SENDGRID_API_KEY and DEFAULT_FROM_EMAIL")
+        self.client = SendGridAPIClient(api_key)
+        self.from_email = from_email
+
+    def send(self, reminder):
+        subject, body = _message(reminder)
+        self.client.send(Mail(from_email=self.from_email, to_emails=reminder.email,
+                              subject=subject, plain_text_content=body))
+
+
+class FirebaseNotifier:
+    """Push notification to the FCM topic `<prefix><user_id>` the user's devices subscribe to."""
+    name = 'fcm'
+
+    def __init__(self, credentials_path, topic_prefix='flik-user-'):
+        if not _HAS_FIREBASE:
+            raise RuntimeError("The fcm notifier needs the firebase-admin package (pip install firebase-admin)")
+        cred = firebase_credentials.Certificate(credentials_path) if credentials_path else None
+        try:
+            self.app = firebase_admin.get_app('flik-reminders')
+        except ValueError:
+            self.app = firebase_admin.initialize_app(cred, name='flik-reminders')
+        self.topic_prefix = topic_prefix
+
+    def send(self, reminder):
+        subject, body = _message(reminder)
+        firebase_messaging.send(firebase_messaging.Message(
+            notification=firebase_messaging.Notification(title=subject, body=body),
+            data={'todo_id': str(reminder.todo_id)},
+            topic=f"{self.topic_prefix}{reminder.user_id}",
+        ), app=self.app)
+
+
+class MultiNotifier:
+    """Sends through every backend; a reminder counts as delivered if any of them succeeds."""
+
+    def __init__(self, notifiers):
+        self.notifiers = notifiers
+        self.name = ','.join(n.name for n in notifiers)
+
+    def send(self, reminder):
+        errors = []
+        for notifier in self.notifiers:
+            try:
+                notifier.send(reminder)
+            except Exception as exc:
+                logger.warning("%s notifier failed for todo %s", notifier.name, reminder.todo_id, exc_info=True)
+                errors.append(exc)
+        if len(errors) == len(self.notifiers):
+            raise errors[0]
+
+
+def create_notifier(config):
+    names = [n.strip() for n in (config.get('REMINDER_NOTIFIERS') or 'log').split(',') if n.strip()]
+    notifiers = []
+    for name in names:
+        if name == 'log':
+            notifiers.append(LogNotifier())
+        elif name == 'fake':
+            notifiers.append(FakeNotifier())
+        elif name == 'sendgrid':
+            notifiers.append(SendGridNotifier(config.get('SENDGRID_API_KEY'), config.get('DEFAULT_FROM_EMAIL')))
+        elif name == 'fcm':
+            notifiers.append(FirebaseNotifier(config.get('FIREBASE_CREDENTIALS')))
+        else:
+            raise ValueError(f"Unknown reminder notifier {name!r}")
+    return notifiers[0] if len(notifiers) == 1 else MultiNotifier(notifiers)
+
+
+# ---------------------------------------------------------------------------
+# scheduler
+
+class ReminderScheduler:
+    def __init__(self, app, notifier, batch_size=100, lease_seconds=300, max_sleep=30, retry_seconds=300, node_id=None):
+        self.app = app
+        self.notifier = notifier
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_sleep = max_sleep
+        self.retry = timedelta(seconds=retry_seconds)
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _unleased(self, now):
+        return db.or_(Todo.reminder_lease_until.is_(None), Todo.reminder_lease_until < now)
+
+    def due(self, now):
+        """(id, next_reminder_at) of the next batch of unclaimed due reminders, oldest first."""
+        return (
+            db.session.query(Todo.id, Todo.next_reminder_at)
+            .filter(Todo.next_reminder_at <= now, self._unleased(now))
+            .order_by(Todo.next_reminder_at)
+            .limit(self.batch_size)
+            .all()
+        )
+
+    def next_fire_at(self, now):
+        return db.session.query(db.func.min(Todo.next_reminder_at)).filter(self._unleased(now)).scalar()
+
+    def claim(self, todo_id, fire_at, now):
+        """Take the lease on one due reminder; False if another scheduler got there first."""
+        claimed = Todo.query.filter(
+            Todo.id == todo_id, Todo.next_reminder_at == fire_at, self._unleased(now)
+        ).update({Todo.reminder_lease_owner: self.node_id, Todo.reminder_lease_until: now + self.lease,
+                  Todo.updated_at: Todo.updated_at}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            REMINDER_CLAIM_CONFLICTS.inc()
+        return bool(claimed)
+
+    def _release(self, todo_id, next_reminder_at):
+        """Drop our lease, setting next_reminder_at directly (bypasses the schedule listener)."""
+        Todo.query.filter(Todo.id == todo_id, Todo.reminder_lease_owner == self.node_id).update({
+            Todo.next_reminder_at: next_reminder_at,
+            Todo.reminder_lease_owner: None,
+            Todo.reminder_lease_until: None,
+            Todo.updated_at: Todo.updated_at,
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def run_once(self, now=None):
+        """Send every reminder due at `now`; returns how many were delivered."""
+        now = now or datetime.utcnow()
+        sent = 0
+        while True:
+            batch = self.due(now)
+            claimed = {todo_id: fire_at for todo_id, fire_at in batch if self.claim(todo_id, fire_at, now)}
+            if not claimed:
+                return sent
+            rows = (
+                db.session.query(Todo, User)
+                .join(User, User.id == Todo.user_id)
+                .filter(Todo.id.in_(list(claimed)))
+                .all()
+            )
+            for todo, user in rows:
+                sent += self._deliver(todo, user, claimed[todo.id], now)
+            orphans = set(claimed) - {todo.id for todo, _ in rows}
+            for todo_id in orphans:
+                self._release(todo_id, None)
+            if len(batch) < self.batch_size:
+                return sent
+
+    def _deliver(self, todo, user, fire_at, now):
+        reminder = Reminder(todo.id, user.id, user.email, user.name or user.first_name,
+                            todo.title, todo.description, todo.due_date, fire_at)
+        try:
+            self.notifier.send(reminder)
+        except Exception:
+            logger.warning("Reminder for todo %s failed; retrying in %.0fs", todo.id, self.retry.total_seconds(), exc_info=True)
+            REMINDERS_SENT.labels(outcome='error').inc()
+            retry_at = now + self.retry
+            self._release(todo.id, retry_at if todo.due_date and retry_at < todo.due_date else None)
+            return 0
+        REMINDERS_SENT.labels(outcome='sent').inc()
+        REMINDER_LAG_SECONDS.observe(max((datetime.utcnow() - fire_at).total_seconds(), 0.0))
+        todo = db.session.get(Todo, todo.id, populate_existing=True)
+        if todo is not None and todo.reminder_lease_owner == self.node_id:
+            if todo.next_reminder_at == fire_at:
+                # Unchanged since the claim: mark this one sent; the listener schedules the next
+                todo.last_reminded_at = fire_at
+            todo.reminder_lease_owner = None
+            todo.reminder_lease_until = None
+            _keep_updated_at(todo)
+            db.session.commit()
+        return 1
+
+    def seconds_until_next(self, now=None):
+        now = now or datetime.utcnow()
+        next_at = self.next_fire_at(now)
+        if next_at is None:
+            return self.max_sleep
+        return min(max((next_at - now).total_seconds(), 0.0), self.max_sleep)
+
+    def wake(self):
+        self._wake.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.run_once()
+                    timeout = self.seconds_until_next()
+                except Exception:
+                    logger.exception("Reminder pass failed")
+                    db.session.rollback()
+                    timeout = self.max_sleep
+                finally:
+                    db.session.remove()
+            self._wake.wait(timeout)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name='flik-reminders', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def create_scheduler(app):
+    config = app.config
+    return ReminderScheduler(
+        app,
+        create_notifier(config),
+        batch_size=int(config.get('REMINDER_BATCH_SIZE') or 100),
+        lease_seconds=float(config.get('REMINDER_LEASE_SECONDS') or 300),
+        max_sleep=float(config.get('REMINDER_MAX_SLEEP') or 30),
+        retry_seconds=float(config.get('REMINDER_RETRY_SECONDS') or 300),
+    )
+
+
+def reschedule_all(batch_size=500, todo_ids=None):
+    """Recompute next_reminder_at for every open todo, or only `todo_ids` (after upgrading, changing lead
+    times or bulk updates that bypass the listener)."""
+    updated, last_id = 0, 0
+    while True:
+        query = Todo.query.filter(Todo.id > last_id, Todo.is_completed == False, Todo.due_date.isnot(None))
+        if todo_ids is not None:
+            query = query.filter(Todo.id.in_(todo_ids))
+        batch = query.order_by(Todo.id).limit(batch_size).all()
+        if not batch:
+            return updated
+        for todo in batch:
+            last_id = todo.id
+            before = todo.next_reminder_at
+            schedule(todo)
+            if todo.next_reminder_at != before:
+                _keep_updated_at(todo)
+                updated += 1
+        db.session.commit()
+
+
+def _wake_receiver(app, **kwargs):
+    scheduler = app.extensions.get('flik_reminders')
+    if scheduler is not None and scheduler._thread is not None:
+        scheduler.wake()
+
+
+_connected = False
+
+
+def init_reminders(app):
+    """Install the schedule listeners; start the in-process scheduler when REMINDER_WORKER is set."""
+    global _connected
+    app.config['REMINDER_LEADS'] = parse_leads(app.config.get('REMINDER_LEAD_MINUTES'))
+    if not _connected:
+        event.listen(Todo, 'before_insert', _before_insert)
+        event.listen(Todo, 'before_update', _before_update)
+        for signal in (events.document_uploaded, events.todo_added, events.todo_toggled, events.todo_updated):
+            signal.connect(_wake_receiver, weak=False)
+        _connected = True
+    if app.config.get('REMINDER_WORKER'):
+        scheduler = create_scheduler(app)
+        app.extensions['flik_reminders'] = scheduler
+        scheduler.start()
+
+
+def get_scheduler():
+    return current_app.extensions.get('flik_reminders')
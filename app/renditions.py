@@ -0,0 +1,119 @@
+"""Thumbnail and preview renditions for file_detail and listings.
+
+Renditions are small JPEGs rendered from the first page of a PDF or from an
+image. They are stored next to the original in the storage backend under
+"<original key>.<kind>.jpg", generated in the background after upload, and
+built on demand (with single-flight locking, so concurrent requests for the
+same missing rendition render it once) if they are missing.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumb': 320,     # longest edge in pixels
+    'preview': 1600,
+}
+JPEG_QUALITY = 80
+RENDERABLE_TYPES = {'pdf', 'png', 'jpg', 'jpeg'}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='flik-rendition')
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def rendition_key(file_key: str, kind: str) -> str:
+    return f"{file_key}.{kind}.jpg"
+
+
+def rendition_version(document) -> str:
+    """Cache-busting token for rendition URLs; document ids can be reused after a delete, contents cannot."""
+    if document.content_hash:
+        return document.content_hash[:12]
+    return document.upload_date.strftime('%Y%m%d%H%M%S%f') if document.upload_date else ''
+
+
+def can_render(file_type: str) -> bool:
+    return (file_type or '').lower() in RENDERABLE_TYPES
+
+
+def _load_image(path: str, file_type: str, max_edge: int) -> Image.Image:
+    if file_type == 'pdf':
+        import pdfplumber
+        with pdfplumber.open(path) as pdf:
+            page = pdf.pages[0]
+            # Render at the target width directly instead of rasterizing at full resolution
+            width = max_edge if page.width >= page.height else int(max_edge * page.width / page.height)
+            return page.to_image(width=max(width, 1)).original.copy()
+    image = Image.open(path)
+    # JPEG can decode at a reduced scale, avoiding a full 12 MP decode for a thumbnail
+    image.draft('RGB', (max_edge, max_edge))
+    return ImageOps.exif_transpose(image)
+
+
+def render(path: str, file_type: str, kind: str) -> bytes:
+    """Render one rendition of the file at path and return JPEG bytes."""
+    max_edge = RENDITIONS[kind]
+    image = _load_image(path, file_type.lower(), max_edge)
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.convert('RGBA').split()[-1])
+        image = background
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _build(storage, file_key: str, file_type: str, kinds) -> None:
+    with storage.local_path(file_key) as path:
+        for kind in kinds:
+            data = render(path, file_type, kind)
+            storage.save(rendition_key(file_key, kind), io.BytesIO(data), content_type='image/jpeg')
+
+
+def ensure_rendition(storage, file_key: str, file_type: str, kind: str) -> Optional[str]:
+    """Return the storage key of the rendition, building it first if it is missing.
+
+    Concurrent callers for the same file wait for a single build. Returns None
+    when the file type cannot be rendered or rendering fails.
+    """
+    if kind not in RENDITIONS or not can_render(file_type):
+        return None
+    key = rendition_key(file_key, kind)
+    if storage.exists(key):
+        return key
+
+    with _inflight_lock:
+        event = _inflight.get(file_key)
+        leader = event is None
+        if leader:
+            event = _inflight[file_key] = threading.Event()
+    if not leader:
+        event.wait()
+        return key if storage.exists(key) else None
+
+    try:
+        # Build every missing rendition in one pass so the original is read once
+        missing = [k for k in RENDITIONS if not storage.exists(rendition_key(file_key, k))]
+        _build(storage, file_key, file_type, missing)
+        return key
+    except Exception:
+        logger.exception("Rendition build failed for %s", file_key)
+        return None
+    finally:
+        with _inflight_lock:
+            _inflight.pop(file_key, None)
+        event.set()
+
+
+def schedule_renditions(storage, file_key: str, file_type: str) -> None:
+    """Build renditions in the background after an upload."""
+    if can_render(file_type):
+        _executor.submit(ensure_rendition, storage, file_key, file_type, 'thumb')
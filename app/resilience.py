@@ -0,0 +1,192 @@
+"""Deadlines and circuit breakers for calls to external services.
+
+`get_breaker(name).call(func, timeout=...)` runs func on a bounded worker pool
+and gives up waiting after `timeout` seconds. Failures, timeouts and calls
+slower than the breaker's slow-call threshold count against the breaker; after
+`failure_threshold` consecutive bad calls it opens and rejects calls with
+CircuitOpenError for `reset_timeout` seconds, then lets one trial call through
+(half-open) to decide whether to close again. Callers treat CircuitOpenError
+like any other failure and switch to their local fallback.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = metrics.gauge(
+    'flik_circuit_breaker_state', 'Circuit breaker state (0=closed, 1=half-open, 2=open).', ['service'])
+EXTERNAL_CALLS = metrics.counter(
+    'flik_external_calls_total', 'Calls to external services by outcome.', ['service', 'outcome'])
+EXTERNAL_CALL_SECONDS = metrics.histogram(
+    'flik_external_call_seconds', 'Latency of calls to external services.', ['service'])
+FALLBACKS = metrics.counter(
+    'flik_fallbacks_total', 'Times a local fallback was used instead of an external service.', ['service'])
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call does not finish within its timeout."""
+
+
+class Deadline:
+    """Absolute time budget shared by several calls (e.g. all chunks of one document)."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def clamp(self, timeout: float) -> float:
+        return min(timeout, self.remaining())
+
+
+# Calls run here so a hung upstream ties up a pool thread, not the request thread
+_call_pool = ThreadPoolExecutor(
+    max_workers=int(env_float('EXTERNAL_CALL_WORKERS', 16)), thread_name_prefix='flik-external')
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 slow_call_seconds: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.labels(service=name).set(0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            logger.warning("Circuit breaker %s: %s -> %s", self.name, self._state, state)
+        self._state = state
+        BREAKER_STATE.labels(service=self.name).set(_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now; in half-open state only one trial call is let through."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def call(self, func, *args, timeout: Optional[float] = None, **kwargs):
+        """Run func under this breaker with an optional timeout in seconds."""
+        if not self.allow():
+            EXTERNAL_CALLS.labels(service=self.name, outcome='rejected').inc()
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if timeout is not None and timeout <= 0:
+            self.record_failure()
+            EXTERNAL_CALLS.labels(service=self.name, outcome='timeout').inc()
+            raise DeadlineExceeded(f"{self.name}: deadline already passed")
+
+        started = time.monotonic()
+        future = _call_pool.submit(func, *args, **kwargs)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            self.record_failure()
+            EXTERNAL_CALLS.labels(service=self.name, outcome='timeout').inc()
+            raise DeadlineExceeded(f"{self.name} call exceeded {timeout:.1f}s")
+        except Exception:
+            self.record_failure()
+            EXTERNAL_CALLS.labels(service=self.name, outcome='failure').inc()
+            raise
+        finally:
+            EXTERNAL_CALL_SECONDS.labels(service=self.name).observe(time.monotonic() - started)
+
+        elapsed = time.monotonic() - started
+        if self.slow_call_seconds is not None and elapsed > self.slow_call_seconds:
+            # The answer is still used, but a run of slow calls trips the breaker
+            self.record_failure()
+            EXTERNAL_CALLS.labels(service=self.name, outcome='slow').inc()
+        else:
+            self.record_success()
+            EXTERNAL_CALLS.labels(service=self.name, outcome='success').inc()
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'name': self.name, 'state': self._current_state(), 'consecutive_failures': self._failures}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for a service, configured from <NAME>_* settings.
+
+    e.g. GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_SECONDS, GEMINI_SLOW_CALL_SECONDS.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            prefix = name.upper()
+            slow = env_float(f'{prefix}_SLOW_CALL_SECONDS', 0)
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(env_float(f'{prefix}_BREAKER_FAILURES', 5)),
+                reset_timeout=env_float(f'{prefix}_BREAKER_RESET_SECONDS', 30.0),
+                slow_call_seconds=slow or None,
+            )
+        return breaker
+
+
+def record_fallback(service: str):
+    FALLBACKS.labels(service=service).inc()
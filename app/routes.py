@@ -1,17 +1,126 @@
+import hmac
 import os
-from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, send_from_directory, jsonify
-from flask_login import current_user
-from werkzeug.utils import secure_filename
-from app.models import Document, Todo, db
-from app.utils import extract_text_from_file, get_file_size, format_file_size, process_document_with_ai
+import mimetypes
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, Response
+from flask_login import current_user, login_required
+from sqlalchemy.orm import defer
+from app.models import Document, DocumentPage, Todo, db
+from app import bulk, entities, events, metrics, scoping
+from app.cache import get_cache
+from app.ingest import allowed_file, ingest_upload
+from app.serving import send_stored_file, stored_sha256
+from app.renditions import RENDITIONS, can_render, ensure_rendition, rendition_version
+from app.storage import get_storage
+from app.suggest import suggest
+from app.utils import format_file_size
 from datetime import datetime, timedelta
 
 bp = Blueprint("main", __name__, template_folder="templates", static_folder="static")
 
-ALLOWED_EXTENSIONS = {"pdf", "png", "jpg", "jpeg", "docx", "txt"}
+PAGES_PER_FETCH = 5
+BULK_LIMIT = 500
+MAX_PAGE_HITS = 500
 
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+def _snippet(text, query, radius=80):
+    """Return a short excerpt of text around the first occurrence of query."""
+    if not text:
+        return ""
+    pos = text.lower().find(query.lower())
+    if pos == -1:
+        return text[:radius * 2]
+    start = max(0, pos - radius)
+    end = min(len(text), pos + len(query) + radius)
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+def search_page_hits(query, document_ids=None, limit=MAX_PAGE_HITS):
+    """Find the pages containing query; returns {document_id: [page_number, ...]}.
+
+    document_ids must already be scoped to the user; without it the search
+    covers all of the signed-in user's documents.
+    """
+    q = (
+        db.session.query(DocumentPage.document_id, DocumentPage.page_number)
+        .filter(DocumentPage.text.contains(query))
+    )
+    if document_ids is not None:
+        if not document_ids:
+            return {}
+        q = q.filter(DocumentPage.document_id.in_(document_ids))
+    else:
+        q = scoping.owned(q.join(Document, Document.id == DocumentPage.document_id), Document)
+    hits = {}
+    for document_id, page_number in q.order_by(DocumentPage.document_id, DocumentPage.page_number).limit(limit):
+        hits.setdefault(document_id, []).append(page_number)
+    return hits
+
+def _category_counts():
+    raw_counts = scoping.owned(
+        db.session.query(Document.category, db.func.count(Document.id)), Document
+    ).group_by(Document.category).all()
+    return {k or 'Other': v for k, v in raw_counts}
+
+def _render_recent_documents():
+    recent_docs = scoping.documents().order_by(Document.upload_date.desc()).limit(5).all()
+    return render_template("_recent_documents.html", recent_docs=recent_docs)
+
+def _render_upcoming_appointments():
+    upcoming_appointments = (
+        scoping.todos()
+        .filter(Todo.due_date.isnot(None))
+        .order_by(Todo.due_date.asc())
+        .limit(5)
+        .all()
+    )
+    return render_template("_upcoming_appointments.html", upcoming_appointments=upcoming_appointments)
+
+def _render_pending_todos():
+    pending_todos = (
+        scoping.todos()
+        .filter((Todo.is_completed == False))
+        .order_by(Todo.due_date.is_(None), Todo.due_date.asc())
+        .limit(5)
+        .all()
+    )
+    return {'html': render_template("_pending_todos.html", pending_todos=pending_todos), 'count': len(pending_todos)}
+
+def _count_if(condition):
+    return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+
+def _dashboard_stats():
+    # One pass over the user's (user_id, upload_date) index range for all document counts
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    total_documents, docs_this_week, ai_processed = scoping.owned(db.session.query(
+        db.func.count(Document.id),
+        _count_if(Document.upload_date >= week_ago),
+        _count_if(db.and_(Document.extracted_text.isnot(None), Document.extracted_text != '')),
+    ), Document).one()
+    total_pending_tasks = scoping.owned(
+        db.session.query(db.func.count(Todo.id)).filter(Todo.is_completed == False), Todo
+    ).scalar() or 0
+    return {
+        'total_documents': total_documents,
+        'total_pending_tasks': total_pending_tasks,
+        'docs_this_week': docs_this_week,
+        'ai_processed': ai_processed,
+    }
+
+def _facet_links(facets, selected, **args):
+    """Facet values with counts and a URL that toggles each one in the current filter."""
+    args = {k: v for k, v in args.items() if v}
+    links = []
+    for kind, values in facets.items():
+        items = []
+        for normalized, value, count in values:
+            key = (kind, normalized)
+            chosen = [s for s in selected if s != key] if key in selected else selected + [key]
+            items.append({
+                'value': value,
+                'count': count,
+                'active': key in selected,
+                'url': url_for('main.index', entity=[f"{k}:{n}" for k, n in chosen], **args),
+            })
+        links.append({'kind': kind, 'label': entities.KIND_LABELS[kind], 'values': items})
+    return links
 
 @bp.route("/")
 def index():
@@ -21,9 +130,10 @@ def index():
 
     search_query = request.args.get('search', '')
     category_filter = request.args.get('category', '')
+    selected_entities = entities.parse_selection(request.args.getlist('entity'))
 
     # Base documents query (for list and counts)
-    documents_q = Document.query
+    documents_q = scoping.documents()
 
     if search_query:
         documents_q = documents_q.filter(
@@ -35,6 +145,10 @@ def index():
     if category_filter:
         documents_q = documents_q.filter(Document.category == category_filter)
 
+    if selected_entities:
+        documents_q = entities.filter_documents(documents_q, selected_entities, current_user.id)
+    filtered_ids = documents_q.with_entities(Document.id)
+
     # Sorting controls
     sort = request.args.get('sort', 'date_desc')
     if sort == 'date_asc':
@@ -51,54 +165,46 @@ def index():
         documents_q = documents_q.order_by(Document.upload_date.desc())
 
     documents = documents_q.all()
+    page_hits = search_page_hits(search_query, [d.id for d in documents]) if search_query else {}
 
-    # Sidebar categories and counts
-    raw_counts = db.session.query(Document.category, db.func.count(Document.id)).group_by(Document.category).all()
-    category_counts = {k or 'Other': v for k, v in raw_counts}
+    # Sidebar and widgets are cached per user until a write event invalidates them
+    cache = get_cache()
+    user_id = current_user.id
+    category_counts = cache.get_or_set('categories', user_id, 'counts', _category_counts)
     categories = list(category_counts.keys())
-
-    # Dashboard widgets
-    recent_docs = Document.query.order_by(Document.upload_date.desc()).limit(5).all()
-    upcoming_appointments = (
-        Todo.query
-        .filter(Todo.due_date.isnot(None))
-        .order_by(Todo.due_date.asc())
-        .limit(5)
-        .all()
-    )
-    pending_todos = (
-        Todo.query
-        .filter((Todo.is_completed == False))
-        .order_by(Todo.due_date.is_(None), Todo.due_date.asc())
-        .limit(5)
-        .all()
-    )
-
-    # Footer metrics
-    total_documents = db.session.query(db.func.count(Document.id)).scalar() or 0
-    total_pending_tasks = db.session.query(db.func.count(Todo.id)).filter(Todo.is_completed == False).scalar() or 0
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    docs_this_week = db.session.query(db.func.count(Document.id)).filter(Document.upload_date >= week_ago).scalar() or 0
-    ai_processed = db.session.query(db.func.count(Document.id)).filter(Document.extracted_text.isnot(None), Document.extracted_text != '').scalar() or 0
+    recent_documents_html = cache.get_or_set('documents', user_id, 'recent', _render_recent_documents)
+    upcoming_appointments_html = cache.get_or_set('todos', user_id, 'upcoming', _render_upcoming_appointments)
+    pending = cache.get_or_set('todos', user_id, 'pending', _render_pending_todos)
+    # "This week" moves with the clock, so footer stats also expire quickly
+    stats = cache.get_or_set('stats', user_id, 'footer', _dashboard_stats, ttl=60)
+    if search_query or category_filter or selected_entities:
+        # Counts within the current filter; still index lookups, so not cached
+        facets = entities.facet_counts(user_id, filtered_ids)
+    else:
+        facets = cache.get_or_set('entities', user_id, f'facets:{entities.FACET_LIMIT}',
+                                  lambda: entities.facet_counts(user_id))
 
     return render_template(
         "index.html",
         documents=documents,
+        page_hits=page_hits,
         search_query=search_query,
         categories=categories,
         selected_category=category_filter,
         category_counts=category_counts,
-        recent_docs=recent_docs,
-        upcoming_appointments=upcoming_appointments,
-        pending_todos=pending_todos,
-        total_documents=total_documents,
-        total_pending_tasks=total_pending_tasks,
-        docs_this_week=docs_this_week,
-        ai_processed=ai_processed,
+        selected_entities=[f"{kind}:{normalized}" for kind, normalized in selected_entities],
+        entity_facets=_facet_links(facets, selected_entities, search=search_query, category=category_filter,
+                                  sort=request.args.get('sort')),
+        recent_documents_html=recent_documents_html,
+        upcoming_appointments_html=upcoming_appointments_html,
+        pending_todos_html=pending['html'],
+        pending_preview_count=pending['count'],
+        **stats,
         sort=sort,
     )
 
 @bp.route("/upload", methods=["GET", "POST"])
+@login_required
 def upload_file():
     if request.method == "POST":
         if "file" not in request.files:
@@ -109,139 +215,274 @@ def upload_file():
             flash("No selected file", "error")
             return redirect(request.url)
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-            
-            # avoid clobbering: if exists, append counter
-            base, ext = os.path.splitext(filename)
-            counter = 1
-            while os.path.exists(save_path):
-                filename = f"{base}_{counter}{ext}"
-                save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-                counter += 1
-            
-            file.save(save_path)
-            
-            # Get file info
-            file_size = get_file_size(save_path)
-            file_type = filename.rsplit(".", 1)[1].lower()
-            
-            # Extract text
-            extracted_text = extract_text_from_file(save_path, file_type)
+            document, original, _ = ingest_upload(file, current_user.id)
+            filename = document.filename
             
-            # Process with AI for categorization and appointment extraction
-            category, appointments_todos = process_document_with_ai(extracted_text, file.filename)
-            
-            # Save to database
-            document = Document(
-                filename=filename,
-                original_filename=file.filename,
-                file_path=save_path,
-                file_size=file_size,
-                file_type=file_type,
-                extracted_text=extracted_text,
-                category=category
-            )
-            
-            db.session.add(document)
-            db.session.flush()  # Get the document ID
-            
-            # Create todos/appointments from AI extraction
-            for item in appointments_todos:
-                todo = Todo(
-                    title=item['title'],
-                    description=item['description'],
-                    due_date=item['due_date'],
-                    category=item['category'],
-                    document_id=document.id
-                )
-                db.session.add(todo)
-            
-            db.session.commit()
-            
-            flash(f"Uploaded: {filename}", "success")
+            if original:
+                flash(f"Uploaded: {filename} (near-duplicate of {original.original_filename})", "success")
+            else:
+                flash(f"Uploaded: {filename}", "success")
             return redirect(url_for("main.index"))
         else:
             flash("File type not allowed", "error")
             return redirect(request.url)
     return render_template("upload.html")
 
+def _without_text():
+    return scoping.documents().options(defer(Document.extracted_text), defer(Document.minhash))
+
 @bp.route("/file/<int:file_id>")
+@login_required
 def file_detail(file_id):
-    document = Document.query.get_or_404(file_id)
-    return render_template("file_detail.html", document=document)
+    # Text is fetched a window of pages at a time by file_pages; has_text is computed in SQL
+    document = scoping.document_or_404(file_id, query=_without_text())
+    page_count = document.pages.count() or (1 if document.has_text else 0)
+    start_page = min(max(request.args.get('page', 1, type=int), 1), max(page_count, 1))
+    return render_template("file_detail.html", document=document, page_count=page_count, start_page=start_page,
+                           has_preview=can_render(document.file_type), rendition_version=rendition_version(document),
+                           entity_labels=entities.ENTITY_LABELS)
+
+@bp.route("/file/<int:file_id>/rendition/<kind>")
+@login_required
+def file_rendition(file_id, kind):
+    """Serve a thumbnail/preview, building it on first request if needed."""
+    if kind not in RENDITIONS:
+        return jsonify({'error': 'unknown rendition'}), 404
+    document = scoping.document_or_404(file_id)
+    storage = get_storage()
+    key = ensure_rendition(storage, document.file_path, document.file_type, kind)
+    if key is None:
+        return jsonify({'error': 'no rendition available'}), 404
+
+    url = storage.url(key)
+    if url:
+        # Signed URLs expire (an hour by default), so a cached redirect would outlive its target
+        response = redirect(url)
+        response.headers["Cache-Control"] = "private, no-store"
+        return response
+    # A URL carrying the current version (see rendition_version) always names the same image, so it can be
+    # cached for a year; unversioned or stale URLs are revalidated, since ids are reused after deletes
+    if request.args.get('v') == rendition_version(document):
+        cache_control = "private, max-age=31536000, immutable"
+    else:
+        cache_control = "private, no-cache"
+    return send_stored_file(storage, key, "image/jpeg", etag=f"{rendition_version(document) or document.id}-{kind}",
+                            cache_control=cache_control)
+
+@bp.route("/file/<int:file_id>/pages")
+@login_required
+def file_pages(file_id):
+    """Return a window of extracted pages for lazy rendering in file_detail."""
+    document = scoping.document_or_404(file_id, query=_without_text())
+    start = max(request.args.get('start', 1, type=int), 1)
+    limit = min(max(request.args.get('limit', PAGES_PER_FETCH, type=int), 1), 50)
+
+    # Range scan on the (document_id, page_number) unique index
+    pages = (
+        document.pages
+        .filter(DocumentPage.page_number >= start)
+        .limit(limit + 1)
+        .all()
+    )
+    if not pages and start == 1 and document.has_text:
+        # Documents extracted before per-page storage: serve the flat text as page 1 (loaded only here)
+        payload = [{'page_number': 1, 'text': document.extracted_text, 'extraction_method': 'legacy',
+                    'extraction_ms': None, 'char_count': len(document.extracted_text)}]
+        return jsonify({'pages': payload, 'next': None})
+
+    next_start = pages[limit].page_number if len(pages) > limit else None
+    return jsonify({'pages': [p.to_dict() for p in pages[:limit]], 'next': next_start})
 
 @bp.route("/uploads/<path:filename>")
+@login_required
 def uploaded_file(filename):
-    return send_from_directory(current_app.config["UPLOAD_FOLDER"], filename, as_attachment=False)
+    document = scoping.documents().filter_by(filename=filename).first_or_404()
+    storage = get_storage()
+
+    # Object stores hand out direct/signed URLs so large downloads skip this worker
+    url = storage.url(document.file_path, download_name=document.original_filename)
+    if url:
+        return redirect(url)
+
+    if not document.content_hash:
+        # Rows from before content hashing: compute once, then it is a strong validator
+        document.content_hash = stored_sha256(storage, document.file_path)
+        db.session.commit()
+
+    mimetype = mimetypes.guess_type(document.filename)[0] or "application/octet-stream"
+    return send_stored_file(storage, document.file_path, mimetype, etag=document.content_hash)
 
 @bp.route("/delete/<int:file_id>", methods=["POST"])
+@login_required
 def delete_file(file_id):
-    document = Document.query.get_or_404(file_id)
-    
-    # Delete physical file
-    if os.path.exists(document.file_path):
-        os.remove(document.file_path)
-    
-    # Delete from database
-    db.session.delete(document)
-    db.session.commit()
+    document = scoping.document_or_404(file_id)
+    filename = document.filename
+
+    # The file and its renditions are queued for removal in the same transaction
+    bulk.delete_documents(scoping.documents(), [file_id])
+    events.fire(events.document_deleted, user_id=current_user.id, document_id=file_id)
     
-    flash(f"Deleted: {document.filename}", "success")
+    flash(f"Deleted: {filename}", "success")
     return redirect(url_for("main.index"))
 
+def _bulk_ids():
+    ids = request.form.getlist('ids', type=int)
+    if len(ids) > BULK_LIMIT:
+        flash(f"Select at most {BULK_LIMIT} items at a time", "error")
+        return None
+    return ids
+
+@bp.route("/documents/bulk", methods=["POST"])
+@login_required
+def bulk_documents():
+    """Delete or recategorize the selected documents (form fields: action, ids, category)."""
+    action = request.form.get('action')
+    ids = _bulk_ids()
+    if ids:
+        if action == 'delete':
+            deleted, _ = bulk.delete_documents(scoping.documents(), ids)
+            if deleted:
+                events.fire(events.document_deleted, user_id=current_user.id, document_ids=deleted)
+            flash(f"Deleted {len(deleted)} document{'s' if len(deleted) != 1 else ''}", "success")
+        elif action == 'recategorize':
+            category = request.form.get('category', '').strip() or 'Other'
+            updated, _ = bulk.recategorize_documents(scoping.documents(), ids, category)
+            if updated:
+                events.fire(events.document_recategorized, user_id=current_user.id, document_ids=updated)
+            flash(f"Moved {len(updated)} document{'s' if len(updated) != 1 else ''} to {category}", "success")
+        else:
+            flash("Unknown action", "error")
+    elif ids is not None:
+        flash("No documents selected", "error")
+    return redirect(request.referrer or url_for("main.index"))
+
 @bp.route("/search")
+@login_required
 def search():
     query = request.args.get('q', '')
     if not query:
         return redirect(url_for('main.index'))
     
-    documents = Document.query.filter(
+    documents = scoping.documents().filter(
         (Document.filename.contains(query)) |
         (Document.original_filename.contains(query)) |
         (Document.extracted_text.contains(query))
     ).order_by(Document.upload_date.desc()).all()
+    page_hits = search_page_hits(query, [d.id for d in documents])
     
-    return render_template("index.html", documents=documents, search_query=query)
+    return render_template("index.html", documents=documents, page_hits=page_hits, search_query=query)
+
+@bp.route("/search/suggest")
+@login_required
+def search_suggest():
+    """Completions for the search box: filenames, categories and frequent terms starting with ?q=."""
+    query = request.args.get('q', '').strip()[:100]
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 20)
+    suggestions = suggest(current_user.id, query, limit) if query else []
+    for item in suggestions:
+        if item['kind'] == 'category':
+            item['url'] = url_for('main.index', category=item['text'])
+        else:
+            item['url'] = url_for('main.index', search=item['text'])
+    return jsonify({'query': query, 'suggestions': suggestions})
+
+@bp.route("/search/pages")
+@login_required
+def search_pages():
+    """Page-level search hits as JSON: one entry per matching page with a snippet."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'query': query, 'hits': []})
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_HITS)
+    rows = (
+        scoping.owned(
+            db.session.query(DocumentPage, Document.original_filename)
+            .join(Document, Document.id == DocumentPage.document_id),
+            Document
+        )
+        .filter(DocumentPage.text.contains(query))
+        .order_by(Document.upload_date.desc(), DocumentPage.page_number.asc())
+        .limit(limit)
+        .all()
+    )
+    hits = [{
+        'document_id': page.document_id,
+        'filename': filename,
+        'page_number': page.page_number,
+        'snippet': _snippet(page.text, query),
+        'url': url_for('main.file_detail', file_id=page.document_id, page=page.page_number)
+    } for page, filename in rows]
+    return jsonify({'query': query, 'hits': hits})
 
 @bp.route("/todos")
+@login_required
 def todos():
     """Display todos and appointments page"""
-    todos = Todo.query.order_by(Todo.due_date.asc()).all()
+    todos = scoping.todos().order_by(Todo.due_date.asc()).all()
     return render_template("todos.html", todos=todos)
 
 @bp.route("/update_category/<int:file_id>", methods=["POST"])
+@login_required
 def update_category(file_id):
     """Update document category"""
-    document = Document.query.get_or_404(file_id)
+    document = scoping.document_or_404(file_id)
     new_category = request.form.get('category', 'Other')
     
     document.category = new_category
     db.session.commit()
+    events.fire(events.document_recategorized, user_id=current_user.id, document=document)
     
     flash(f"Category updated to {new_category}", "success")
     return redirect(url_for("main.file_detail", file_id=file_id))
 
 @bp.route("/toggle_todo/<int:todo_id>", methods=["POST"])
+@login_required
 def toggle_todo(todo_id):
     """Toggle todo completion status"""
-    todo = Todo.query.get_or_404(todo_id)
+    todo = scoping.todo_or_404(todo_id)
     todo.is_completed = not todo.is_completed
     db.session.commit()
+    events.fire(events.todo_toggled, user_id=current_user.id, todo=todo)
     
     return jsonify({'success': True, 'is_completed': todo.is_completed})
 
 @bp.route("/delete_todo/<int:todo_id>", methods=["POST"])
+@login_required
 def delete_todo(todo_id):
     """Delete a todo"""
-    todo = Todo.query.get_or_404(todo_id)
+    todo = scoping.todo_or_404(todo_id)
     db.session.delete(todo)
     db.session.commit()
+    events.fire(events.todo_deleted, user_id=current_user.id, todo_id=todo_id)
     
     flash("Todo deleted successfully", "success")
     return redirect(url_for("main.todos"))
 
+@bp.route("/todos/bulk", methods=["POST"])
+@login_required
+def bulk_todos():
+    """Complete, reopen or delete the selected todos (form fields: action, ids)."""
+    action = request.form.get('action')
+    ids = _bulk_ids()
+    if ids:
+        if action in ('complete', 'reopen'):
+            updated, _ = bulk.set_todos_completed(scoping.todos(), ids, action == 'complete')
+            if updated:
+                events.fire(events.todo_updated, user_id=current_user.id, todo_ids=updated)
+            flash(f"Updated {len(updated)} todo{'s' if len(updated) != 1 else ''}", "success")
+        elif action == 'delete':
+            deleted, _ = bulk.delete_todos(scoping.todos(), ids)
+            if deleted:
+                events.fire(events.todo_deleted, user_id=current_user.id, todo_ids=deleted)
+            flash(f"Deleted {len(deleted)} todo{'s' if len(deleted) != 1 else ''}", "success")
+        else:
+            flash("Unknown action", "error")
+    elif ids is not None:
+        flash("No todos selected", "error")
+    return redirect(url_for("main.todos"))
+
 @bp.route("/add_task", methods=["POST"])
+@login_required
 def add_task():
     """Add a new task via AJAX"""
     try:
@@ -258,9 +499,10 @@ def add_task():
             except ValueError:
                 return jsonify({'success': False, 'error': 'Invalid date format'})
         
-        todo = Todo(title=title, due_date=due_date)
+        todo = Todo(title=title, due_date=due_date, user_id=current_user.id)
         db.session.add(todo)
         db.session.commit()
+        events.fire(events.todo_added, user_id=current_user.id, todo=todo)
         
         return jsonify({'success': True, 'message': 'Task added successfully'})
         
@@ -269,10 +511,11 @@ def add_task():
         return jsonify({'success': False, 'error': str(e)})
 
 @bp.route("/calendar")
+@login_required
 def calendar():
     """Calendar page with appointments and tasks"""
     # Get all appointments and tasks with due dates
-    appointments_query = Todo.query.filter(Todo.due_date.isnot(None)).order_by(Todo.due_date.asc()).all()
+    appointments_query = scoping.todos().filter(Todo.due_date.isnot(None)).order_by(Todo.due_date.asc()).all()
     
     # Convert to dictionaries for JSON serialization
     appointments = []
@@ -308,39 +551,45 @@ def calendar():
                          current_date=current_date)
 
 @bp.route("/insights")
+@login_required
 def insights():
     """Analytics and insights page"""
     # Document analytics
-    total_docs = Document.query.count()
-    docs_by_type_query = db.session.query(Document.file_type, db.func.count(Document.id)).group_by(Document.file_type).all()
-    docs_by_category_query = db.session.query(Document.category, db.func.count(Document.id)).group_by(Document.category).all()
+    docs_by_type_query = scoping.owned(
+        db.session.query(Document.file_type, db.func.count(Document.id)), Document
+    ).group_by(Document.file_type).all()
+    docs_by_category_query = scoping.owned(
+        db.session.query(Document.category, db.func.count(Document.id)), Document
+    ).group_by(Document.category).all()
     
     # Convert Row objects to lists of tuples
     docs_by_type = [(row[0], row[1]) for row in docs_by_type_query]
     docs_by_category = [(row[0], row[1]) for row in docs_by_category_query]
     
-    # Recent activity (last 30 days)
+    # Recent activity (last 30 days) and monthly upload trends (last 6 months),
+    # counted together in one pass over the user's upload_date index
     thirty_days_ago = datetime.now() - timedelta(days=30)
-    recent_uploads = Document.query.filter(Document.upload_date >= thirty_days_ago).count()
+    months = []
+    for i in range(6):
+        month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
+        months.append((month_start, month_start + timedelta(days=30)))
+    doc_counts = scoping.owned(db.session.query(
+        db.func.count(Document.id),
+        _count_if(Document.upload_date >= thirty_days_ago),
+        *[_count_if(db.and_(Document.upload_date >= start, Document.upload_date < end)) for start, end in months]
+    ), Document).one()
+    total_docs, recent_uploads = doc_counts[0], doc_counts[1]
     
     # Task analytics
-    total_tasks = Todo.query.count()
-    completed_tasks = Todo.query.filter(Todo.is_completed == True).count()
+    total_tasks, completed_tasks = scoping.owned(
+        db.session.query(db.func.count(Todo.id), _count_if(Todo.is_completed == True)), Todo
+    ).one()
     pending_tasks = total_tasks - completed_tasks
     
-    # Monthly upload trends
-    monthly_uploads = []
-    for i in range(6):  # Last 6 months
-        month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        count = Document.query.filter(
-            Document.upload_date >= month_start,
-            Document.upload_date < month_end
-        ).count()
-        monthly_uploads.append({
-            'month': month_start.strftime('%b %Y'),
-            'count': count
-        })
+    monthly_uploads = [
+        {'month': start.strftime('%b %Y'), 'count': count}
+        for (start, _), count in zip(months, doc_counts[2:])
+    ]
     monthly_uploads.reverse()
     
     return render_template("insights.html",
@@ -351,4 +600,47 @@ def insights():
                          total_tasks=total_tasks,
                          completed_tasks=completed_tasks,
                          pending_tasks=pending_tasks,
-                         monthly_uploads=monthly_uploads)
\ No newline at end of file
+                         monthly_uploads=monthly_uploads)
+
+def _metrics_authorized():
+    """A scraper sending `Authorization: Bearer $METRICS_TOKEN`, or a signed-in admin."""
+    token = current_app.config.get('METRICS_TOKEN') or ''
+    scheme, _, value = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(value.strip().encode(), token.encode()):
+        return True
+    from app.admin import is_admin
+    return is_admin()
+
+@bp.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint (METRICS_TOKEN bearer token or an admin session)."""
+    if not _metrics_authorized():
+        return Response('metrics require a bearer token\n', status=401, content_type='text/plain',
+                        headers={'WWW-Authenticate': 'Bearer realm="metrics"'})
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@bp.route("/export")
+@login_required
+def export_library():
+    """Stream the user's library as an archive (?format=zip|tar|tar.gz&since=<iso>&after=<id>)."""
+    from flask import abort, stream_with_context
+    from app.export import FORMATS, iter_export
+
+    fmt = request.args.get('format', 'zip')
+    if fmt not in FORMATS:
+        abort(400)
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        abort(400)
+    after = request.args.get('after', type=int)
+
+    mimetype, extension = FORMATS[fmt]
+    name = f"flik-export-{datetime.utcnow():%Y%m%d-%H%M%S}.{extension}"
+    chunks = iter_export([current_user.id], fmt, since=since, after=after)
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{name}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    })
@@ -0,0 +1,220 @@
+"""Resource-isolated extraction workers.
+
+Local extraction (pdfplumber, OCR, TXT, DOCX) parses untrusted files, and a
+malformed PDF can balloon memory or spin forever. With EXTRACT_SANDBOX on
+(the default) it runs in a small pool of child processes instead of the web
+worker. Each one is a fresh `python -m app.sandbox_worker`, which imports
+only the extraction code and never the parent's main script:
+
+- address space is capped at EXTRACT_MEMORY_MB (RLIMIT_AS), so a runaway
+  allocation fails inside the child
+- each job gets EXTRACT_CPU_SECONDS of CPU time (RLIMIT_CPU); past that the
+  kernel stops the child with SIGXCPU
+- the parent waits at most EXTRACT_TIMEOUT_SECONDS of wall-clock time, then
+  kills the child's whole process group (tesseract included)
+- a child is replaced after EXTRACT_MAX_JOBS_PER_WORKER jobs, and after any
+  job that ran out of memory, so fragmented heaps are given back
+
+A job that fails in any of these ways yields no pages, like any other
+extraction error. Each one is logged as a single key=value line and counted
+in flik_extraction_sandbox_jobs_total{outcome}. Failures and truncations
+inside a child are sent back with its result, so their logs and metrics
+appear in the parent. Workers start on first use, one per concurrent job up
+to EXTRACT_WORKERS; a job waits for a free worker for at most the timeout.
+Resource limits need the POSIX `resource` module; elsewhere only the timeout
+and recycling apply.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+from app import metrics
+from app import utils
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_JOBS = metrics.counter(
+    'flik_extraction_sandbox_jobs_total',
+    'Sandboxed extraction jobs by outcome (ok, memory, cpu_limit, timeout, killed, crashed, busy)', ('outcome',))
+SANDBOX_RECYCLES = metrics.counter(
+    'flik_extraction_sandbox_recycles_total', 'Sandbox workers retired and replaced, by reason', ('reason',))
+SANDBOX_WORKERS = metrics.gauge(
+    'flik_extraction_sandbox_workers', 'Live sandbox worker processes', multiprocess_mode='livesum')
+
+SIGXCPU = getattr(signal, 'SIGXCPU', None)
+
+
+def _package_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Worker:
+    """One `python -m app.sandbox_worker` child and the parent's end of its pipe."""
+
+    def __init__(self, memory_mb, cpu_seconds):
+        self.conn, child_conn = multiprocessing.Pipe()
+        handle = child_conn.fileno()
+        env = dict(os.environ)
+        # The child imports the app package by name, whatever the parent's working directory
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, (_package_root(), env.get('PYTHONPATH'))))
+        args = [sys.executable, '-m', 'app.sandbox_worker', str(handle), str(memory_mb or 0), str(cpu_seconds or 0)]
+        if os.name == 'nt':
+            os.set_handle_inheritable(handle, True)
+            options = {'startupinfo': subprocess.STARTUPINFO(lpAttributeList={'handle_list': [handle]})}
+        else:
+            # Own session and process group, so a kill also takes down tesseract and other grandchildren
+            options = {'pass_fds': (handle,), 'start_new_session': True}
+        try:
+            self.process = subprocess.Popen(args, stdin=subprocess.DEVNULL, env=env, **options)
+        except Exception:
+            self.conn.close()
+            raise
+        finally:
+            child_conn.close()
+        self.jobs = 0
+        SANDBOX_WORKERS.inc()
+
+    @property
+    def exitcode(self):
+        return self.process.poll()
+
+    def _wait(self, timeout):
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def stop(self, kill=False):
+        """Close the pipe (the child exits on EOF), or kill its process group outright."""
+        self.conn.close()
+        if kill and self.exitcode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                self.process.kill()
+        self._wait(1 if kill else 5)
+        if self.exitcode is None:
+            self.process.kill()
+            self._wait(1)
+        SANDBOX_WORKERS.dec()
+
+
+class ExtractionSandbox:
+    """A pool of resource-limited extraction processes with a blocking, thread-safe extract()."""
+
+    def __init__(self, workers=2, memory_mb=1024, cpu_seconds=60, timeout=120.0, max_jobs=50):
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _checkout(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Inherited through a fork (e.g. gunicorn --preload): those children belong to the parent
+                self._idle, self._pid = [], os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return _Worker(self.memory_mb, self.cpu_seconds)
+
+    def _checkin(self, worker, outcome):
+        worker.jobs += 1
+        if outcome == 'memory' or (self.max_jobs and worker.jobs >= self.max_jobs):
+            SANDBOX_RECYCLES.labels(reason='memory' if outcome == 'memory' else 'max_jobs').inc()
+            worker.stop()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def extract(self, file_path, file_type):
+        """extract_pages_locally in a worker; [] when the job is killed, times out or cannot be scheduled."""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._report('busy', file_path, file_type, started)
+            return []
+        try:
+            return self._run(file_path, file_type, started)
+        finally:
+            self._slots.release()
+
+    def _run(self, file_path, file_type, started):
+        worker = self._checkout()
+        remaining = max(0.0, self.timeout - (time.monotonic() - started))
+        try:
+            worker.conn.send((file_path, file_type))
+            if not worker.conn.poll(remaining):
+                worker.stop(kill=True)
+                SANDBOX_RECYCLES.labels(reason='timeout').inc()
+                self._report('timeout', file_path, file_type, started, worker)
+                return []
+            pages, events = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.stop(kill=True)
+            exitcode = worker.exitcode
+            outcome = 'cpu_limit' if SIGXCPU and exitcode == -SIGXCPU else (
+                'killed' if exitcode is not None and exitcode < 0 else 'crashed')
+            SANDBOX_RECYCLES.labels(reason=outcome).inc()
+            self._report(outcome, file_path, file_type, started, worker)
+            return []
+        utils.replay_worker_events(events)
+        outcome = 'memory' if any(error == 'MemoryError' for *_, error in events) else 'ok'
+        if outcome == 'memory':
+            self._report(outcome, file_path, file_type, started, worker)
+        else:
+            SANDBOX_JOBS.labels(outcome=outcome).inc()
+        self._checkin(worker, outcome)
+        return pages
+
+    def _report(self, outcome, file_path, file_type, started, worker=None):
+        SANDBOX_JOBS.labels(outcome=outcome).inc()
+        if outcome != 'memory':  # already counted by the replayed failure
+            utils.EXTRACTION_ERRORS.labels(extractor='sandbox').inc()
+        process = worker.process if worker is not None else None
+        logger.warning(
+            "extraction sandbox: outcome=%s file=%s file_type=%s elapsed=%.2fs pid=%s exitcode=%s jobs=%s "
+            "memory_mb=%s cpu_seconds=%s timeout=%s",
+            outcome, os.path.basename(file_path), file_type, time.monotonic() - started,
+            process.pid if process else None, worker.exitcode if process else None,
+            worker.jobs + 1 if worker else None, self.memory_mb, self.cpu_seconds, self.timeout,
+        )
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+def get_sandbox():
+    return current_app.extensions.get('flik_sandbox') if has_app_context() else None
+
+
+def extract_pages(file_path, file_type):
+    """Local extraction, in the sandbox when it is on (and in this process otherwise)."""
+    sandbox = get_sandbox()
+    if sandbox is None:
+        return utils.extract_pages_locally(file_path, file_type)
+    return sandbox.extract(file_path, file_type)
+
+
+def init_sandbox(app):
+    """Install the extraction sandbox unless EXTRACT_SANDBOX is off; workers start on first use."""
+    if app.config.get('EXTRACT_SANDBOX'):
+        app.extensions['flik_sandbox'] = ExtractionSandbox(
+            workers=int(app.config.get('EXTRACT_WORKERS') or 2),
+            memory_mb=int(app.config.get('EXTRACT_MEMORY_MB') or 0),
+            cpu_seconds=int(app.config.get('EXTRACT_CPU_SECONDS') or 0),
+            timeout=float(app.config.get('EXTRACT_TIMEOUT_SECONDS') or 120),
+            max_jobs=int(app.config.get('EXTRACT_MAX_JOBS_PER_WORKER') or 0),
+        )
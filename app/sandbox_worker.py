@@ -0,0 +1,74 @@
+"""Entry point of an extraction sandbox process (see app/sandbox.py).
+
+Started as `python -m app.sandbox_worker FD MEMORY_MB CPU_SECONDS`, so the
+child imports only what extraction needs and never re-runs the parent's
+main script (run.py, a CLI, a benchmark). FD is the child's end of a
+multiprocessing Pipe; jobs arrive as (file_path, file_type) and each one is
+answered with (pages, events) until the pipe closes.
+"""
+import os
+import sys
+
+from app import utils
+
+try:
+    import resource
+    _HAS_RESOURCE = True
+except ImportError:
+    _HAS_RESOURCE = False
+
+
+def _limit(kind, soft):
+    """Lower the soft limit (never above the hard one); returns False when the platform refuses."""
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    try:
+        resource.setrlimit(kind, (soft, hard))
+        return True
+    except (ValueError, OSError):
+        return False
+
+
+def _cpu_used():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _connection(handle):
+    if os.name == 'nt':
+        from multiprocessing.connection import PipeConnection
+        return PipeConnection(handle)
+    from multiprocessing.connection import Connection
+    return Connection(handle)
+
+
+def serve(conn, memory_mb, cpu_seconds):
+    """Apply the memory limit, then extract one job at a time until the pipe closes."""
+    if _HAS_RESOURCE and memory_mb:
+        _limit(resource.RLIMIT_AS, int(memory_mb) * 1024 * 1024)
+    while True:
+        try:
+            file_path, file_type = conn.recv()
+        except (EOFError, OSError):
+            return
+        if _HAS_RESOURCE and cpu_seconds:
+            # RLIMIT_CPU counts the whole process lifetime, so each job's budget starts from what is used
+            _limit(resource.RLIMIT_CPU, int(_cpu_used()) + int(cpu_seconds) + 1)
+        utils._worker_events = []
+        try:
+            pages = utils.extract_pages_locally(file_path, file_type)
+        except MemoryError:
+            pages = []
+            utils._worker_events.append(('failed', 'sandbox', 'out of memory', 'MemoryError'))
+        conn.send((pages, utils._worker_events))
+        utils._worker_events = None
+
+
+def main(argv=None):
+    handle, memory_mb, cpu_seconds = (int(arg) for arg in (argv or sys.argv[1:]))
+    serve(_connection(handle), memory_mb, cpu_seconds)
+
+
+if __name__ == '__main__':
+    main()
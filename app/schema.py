@@ -0,0 +1,48 @@
+"""Additive schema upgrades for databases created by older versions.
+
+db.create_all() only creates missing tables. When a model gains a column or an
+index, existing databases are brought up to date here: missing nullable (or
+defaulted) columns are added with ALTER TABLE and missing indexes are created.
+Destructive changes are never attempted.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _column_ddl(column, dialect):
+    ddl = f'{column.name} {column.type.compile(dialect=dialect)}'
+    default = column.default
+    if default is not None and default.is_scalar:
+        value = int(default.arg) if isinstance(default.arg, bool) else default.arg
+        ddl += f" DEFAULT '{value}'" if isinstance(value, str) else f" DEFAULT {value}"
+    return ddl
+
+
+def upgrade_schema(db):
+    """Add columns and indexes declared on the models but missing from the database."""
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable and column.default is None and column.server_default is None:
+                    logger.warning("Cannot add NOT NULL column %s.%s without a default", table.name, column.name)
+                    continue
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column, engine.dialect)}'))
+                logger.info("Added column %s.%s", table.name, column.name)
+
+            indexed = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexed:
+                    conn.execute(CreateIndex(index))
+                    logger.info("Created index %s", index.name)
@@ -0,0 +1,68 @@
+"""Per-user data scoping.
+
+Documents and todos belong to the user who created them. Routes, the API and
+the profile page get their base queries here rather than from Document.query
+or Todo.query, so every read and write is filtered by owner. The filters lead
+with user_id, so they hit the (user_id, ...) composite indexes declared on the
+models.
+"""
+from flask import abort
+from flask_login import current_user
+
+from app.models import Document, DocumentEntity, DocumentPage, Todo, db
+
+
+def current_user_id():
+    if not current_user.is_authenticated:
+        abort(401)
+    return current_user.id
+
+
+def _uid(user_id):
+    return current_user_id() if user_id is None else user_id
+
+
+def documents(user_id=None):
+    """Document query limited to one user (default: the signed-in user)."""
+    return Document.query.filter(Document.user_id == _uid(user_id))
+
+
+def todos(user_id=None):
+    return Todo.query.filter(Todo.user_id == _uid(user_id))
+
+
+def pages(user_id=None):
+    """DocumentPage query joined to the owning documents."""
+    return DocumentPage.query.join(Document, Document.id == DocumentPage.document_id).filter(
+        Document.user_id == _uid(user_id))
+
+
+def owned(query, model, user_id=None):
+    """Add the owner filter to an arbitrary query over `model` (aggregates, joins)."""
+    return query.filter(model.user_id == _uid(user_id))
+
+
+def document_or_404(document_id, user_id=None, query=None):
+    """The user's document, or 404. Other users' ids are indistinguishable from missing ones."""
+    query = query if query is not None else documents(user_id)
+    return query.filter(Document.id == document_id).first_or_404()
+
+
+def todo_or_404(todo_id, user_id=None):
+    return todos(user_id).filter(Todo.id == todo_id).first_or_404()
+
+
+def dedup_scope(user_id=None):
+    """`scope` argument for dedup.find_near_duplicates: only compare within one user's documents."""
+    uid = _uid(user_id)
+    return lambda query: query.filter(Document.user_id == uid)
+
+
+def unowned_counts():
+    """Rows left without an owner, e.g. from before per-user data."""
+    return {
+        'documents': db.session.query(db.func.count(Document.id)).filter(Document.user_id.is_(None)).scalar() or 0,
+        'todos': db.session.query(db.func.count(Todo.id)).filter(Todo.user_id.is_(None)).scalar() or 0,
+        'entities': db.session.query(db.func.count(DocumentEntity.id)).filter(
+            DocumentEntity.user_id.is_(None)).scalar() or 0,
+    }
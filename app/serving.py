@@ -0,0 +1,96 @@
+"""Serving stored files with validators, byte ranges and proxy offload.
+
+send_stored_file() answers conditional requests from a strong content-hash
+ETag (304), honours single byte ranges (206) so PDF viewers can fetch pages
+incrementally, and, when SENDFILE_MODE is set, hands local files to the front
+proxy instead of streaming them through the worker:
+
+- SENDFILE_MODE=x-accel: nginx X-Accel-Redirect to X_ACCEL_PREFIX + the path
+  relative to the local storage root (configure that prefix as an internal
+  location aliased to UPLOAD_FOLDER).
+- SENDFILE_MODE=x-sendfile: Apache/lighttpd X-Sendfile with the absolute path.
+"""
+import hashlib
+import os
+
+from flask import Response, current_app, request, send_file, stream_with_context
+from werkzeug.datastructures import ContentRange
+
+
+def stored_sha256(storage, key):
+    """Hex SHA-256 of a stored object, computed by streaming it."""
+    digest = hashlib.sha256()
+    for chunk in storage.iter_range(key):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(256 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _offload(path, storage, mimetype, etag, cache_control):
+    mode = (current_app.config.get('SENDFILE_MODE') or '').lower()
+    if mode not in ('x-accel', 'x-sendfile'):
+        return None
+    response = Response(mimetype=mimetype)
+    if mode == 'x-accel':
+        root = getattr(storage, 'root', None)
+        if not root or not os.path.abspath(path).startswith(root + os.sep):
+            return None
+        prefix = current_app.config.get('X_ACCEL_PREFIX', '/protected-uploads').rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{os.path.relpath(path, root).replace(os.sep, '/')}"
+    else:
+        response.headers['X-Sendfile'] = path
+    # The proxy serves the bytes (and ranges); we still answer revalidation here
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+
+def _stream(storage, key, mimetype, etag, cache_control):
+    response = Response(mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = cache_control
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+
+    size = storage.size(key)
+    start, length = 0, size
+    byte_range = request.range
+    if_range = request.if_range
+    if if_range.date or (if_range.etag and if_range.etag != etag):
+        byte_range = None  # validator changed: send the full entity
+    if byte_range is not None and len(byte_range.ranges) == 1:
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, stop = bounds
+        length = stop - start
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, size)
+
+    response.response = stream_with_context(storage.iter_range(key, start, length))
+    response.content_length = length
+    return response
+
+
+def send_stored_file(storage, key, mimetype, etag, cache_control='private, no-cache'):
+    """Serve key from storage with ETag/304, Range/206 and optional proxy offload."""
+    path = storage.filesystem_path(key)
+    if path:
+        offloaded = _offload(path, storage, mimetype, etag, cache_control)
+        if offloaded is not None:
+            return offloaded
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True)
+        response.headers['Cache-Control'] = cache_control
+        return response
+    return _stream(storage, key, mimetype, etag, cache_control)
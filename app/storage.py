@@ -0,0 +1,312 @@
+"""File storage backends.
+
+Documents are addressed by a storage key (stored in Document.file_path), never
+by an absolute path, so any app node can serve any file. Backends:
+
+- LocalStorage: a directory sharded by key hash (root/ab/cd/<key>) so no single
+  directory grows without bound.
+- GCSStorage: a Google Cloud Storage bucket; downloads can bypass the Flask
+  worker through signed URLs.
+- MemoryStorage: in-process dict, for tests and local experiments.
+
+The backend is chosen by STORAGE_BACKEND (local, gcs or memory); it defaults to
+gcs when GCS_BUCKET_NAME is set and local otherwise.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Iterator, Optional
+
+from flask import current_app
+
+try:
+    from google.cloud import storage as gcs
+    _HAS_GCS = True
+except Exception:
+    _HAS_GCS = False
+
+CHUNK_SIZE = 256 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend:
+    """Interface shared by all backends. Keys are relative, '/'-separated names."""
+    name = 'base'
+
+    def save(self, key: str, stream, content_type: Optional[str] = None) -> int:
+        """Write stream to key in chunks; returns the number of bytes written."""
+        raise NotImplementedError
+
+    def save_file(self, key: str, path: str, content_type: Optional[str] = None) -> int:
+        """Store a local file under key; backends may move it instead of copying."""
+        with open(path, 'rb') as f:
+            return self.save(key, f, content_type)
+
+    def open(self, key: str):
+        """Return a readable binary file object."""
+        raise NotImplementedError
+
+    def iter_range(self, key: str, start: int = 0, length: Optional[int] = None,
+                   chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the bytes of key from start, at most length bytes, in chunks."""
+        with self.open(key) as f:
+            f.seek(start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                data = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def iter_keys(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def url(self, key: str, expires: int = 3600, download_name: Optional[str] = None) -> Optional[str]:
+        """A URL the client can fetch directly, or None if the app must serve the bytes."""
+        return None
+
+    def filesystem_path(self, key: str) -> Optional[str]:
+        """Absolute path when the object lives on the local filesystem, else None."""
+        return None
+
+    @contextmanager
+    def local_path(self, key: str):
+        """Yield a local filesystem path for key (a temporary copy for remote backends)."""
+        path = self.filesystem_path(key)
+        if path:
+            yield path
+            return
+        suffix = os.path.splitext(key)[1]
+        fd, tmp = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in self.iter_range(key):
+                    out.write(chunk)
+            yield tmp
+        finally:
+            os.remove(tmp)
+
+
+class LocalStorage(StorageBackend):
+    name = 'local'
+
+    def __init__(self, root: str, shard_depth: int = 2):
+        self.root = os.path.abspath(root)
+        self.shard_depth = shard_depth
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        if os.path.isabs(key):
+            # Rows written before storage keys existed hold absolute paths
+            return key
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        path = os.path.abspath(os.path.join(self.root, *shards, key))
+        if not path.startswith(self.root + os.sep):
+            raise StorageError(f"Invalid storage key: {key!r}")
+        return path
+
+    def save(self, key, stream, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(stream, out, CHUNK_SIZE)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return os.path.getsize(path)
+
+    def save_file(self, key, path, content_type=None):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        return os.path.getsize(target)
+
+    def open(self, key):
+        try:
+            return open(self._path(key), 'rb')
+        except FileNotFoundError:
+            raise StorageError(f"No such object: {key}")
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def iter_keys(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            parts = os.path.relpath(dirpath, self.root).split(os.sep)
+            if parts == ['.'] or len(parts) < self.shard_depth:
+                continue  # files above the shard level are not managed objects
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, filename), self.root).split(os.sep)
+                yield '/'.join(rel[self.shard_depth:])
+
+    def filesystem_path(self, key):
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+
+class GCSStorage(StorageBackend):
+    name = 'gcs'
+
+    def __init__(self, bucket_name: str, prefix: str = '', public_base_url: Optional[str] = None, client=None):
+        if client is None:
+            if not _HAS_GCS:
+                raise StorageError("google-cloud-storage is not installed")
+            client = gcs.Client()
+        self.bucket = client.bucket(bucket_name)
+        self.prefix = prefix.strip('/')
+        self.public_base_url = (public_base_url or '').rstrip('/') or None
+
+    def _name(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _blob(self, key):
+        return self.bucket.blob(self._name(key))
+
+    def save(self, key, stream, content_type=None):
+        blob = self._blob(key)
+        blob.upload_from_file(stream, content_type=content_type, rewind=False)
+        return blob.size if blob.size is not None else self.size(key)
+
+    def open(self, key):
+        return self._blob(key).open('rb', chunk_size=CHUNK_SIZE)
+
+    def iter_range(self, key, start=0, length=None, chunk_size=CHUNK_SIZE):
+        blob = self._blob(key)
+        total = self.size(key)
+        end = total if length is None else min(total, start + length)
+        position = start
+        while position < end:
+            # download_as_bytes takes an inclusive end offset
+            data = blob.download_as_bytes(start=position, end=min(position + chunk_size, end) - 1)
+            if not data:
+                break
+            yield data
+            position += len(data)
+
+    def delete(self, key):
+        try:
+            self._blob(key).delete()
+        except Exception as e:
+            if getattr(e, 'code', None) != 404:
+                raise
+
+    def exists(self, key):
+        return self._blob(key).exists()
+
+    def size(self, key):
+        blob = self.bucket.get_blob(self._name(key))
+        if blob is None:
+            raise StorageError(f"No such object: {key}")
+        return blob.size
+
+    def iter_keys(self):
+        start = len(self.prefix) + 1 if self.prefix else 0
+        for blob in self.bucket.list_blobs(prefix=f"{self.prefix}/" if self.prefix else None):
+            yield blob.name[start:]
+
+    def url(self, key, expires=3600, download_name=None):
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self._name(key)}"
+        disposition = f'inline; filename="{download_name}"' if download_name else None
+        return self._blob(key).generate_signed_url(
+            version='v4', expiration=timedelta(seconds=expires), method='GET',
+            response_disposition=disposition,
+        )
+
+
+class MemoryStorage(StorageBackend):
+    """In-process fake backend; optionally hands out fake direct URLs."""
+    name = 'memory'
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.objects = {}
+        self.base_url = base_url
+        self._lock = threading.Lock()
+
+    def save(self, key, stream, content_type=None):
+        data = b''.join(iter(lambda: stream.read(CHUNK_SIZE), b''))
+        with self._lock:
+            self.objects[key] = data
+        return len(data)
+
+    def open(self, key):
+        with self._lock:
+            if key not in self.objects:
+                raise StorageError(f"No such object: {key}")
+            return io.BytesIO(self.objects[key])
+
+    def delete(self, key):
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def exists(self, key):
+        return key in self.objects
+
+    def size(self, key):
+        with self._lock:
+            if key not in self.objects:
+                raise StorageError(f"No such object: {key}")
+            return len(self.objects[key])
+
+    def iter_keys(self):
+        with self._lock:
+            return iter(list(self.objects))
+
+    def url(self, key, expires=3600, download_name=None):
+        return f"{self.base_url.rstrip('/')}/{key}" if self.base_url else None
+
+
+def create_storage(config) -> StorageBackend:
+    backend = (os.getenv('STORAGE_BACKEND') or ('gcs' if os.getenv('GCS_BUCKET_NAME') else 'local')).lower()
+    if backend == 'gcs':
+        return GCSStorage(
+            os.environ['GCS_BUCKET_NAME'],
+            prefix=os.getenv('GCS_PREFIX', ''),
+            public_base_url=os.getenv('GCS_PUBLIC_BASE_URL'),
+        )
+    if backend == 'memory':
+        return MemoryStorage()
+    return LocalStorage(config['UPLOAD_FOLDER'])
+
+
+def init_storage(app):
+    app.extensions['flik_storage'] = create_storage(app.config)
+
+
+def get_storage() -> StorageBackend:
+    return current_app.extensions['flik_storage']
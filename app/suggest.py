@@ -0,0 +1,309 @@
+"""Search-as-you-type suggestions from a per-user prefix index.
+
+Each user's index is a sorted list of (token, kind, ident) keys. A prefix
+lookup is a bisect plus a short forward scan, so there is no database query.
+Prefixes with more than SCAN_LIMIT matches (one or two letters) are ranked
+in full once and kept until the index changes.
+It holds three kinds of completion:
+
+- filename: original filenames, matched on the whole name and on each word
+- category: the user's categories, weighted by document count
+- term: frequent words from extracted text, weighted by how many documents use them
+
+Indexes are built lazily on a user's first lookup and then kept in a
+per-process LRU of SUGGEST_MAX_USERS users. Uploads and deletes in this
+process update the loaded index in place through app.events. A
+recategorization drops it, and the next lookup rebuilds it. Other workers pick
+up changes when their copy is older than SUGGEST_INDEX_TTL seconds. At most
+SUGGEST_MAX_TERMS term completions are kept per user, chosen by document
+frequency, so memory stays bounded however large a library grows.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+
+from flask import current_app
+
+from app import events, metrics
+from app.models import Document, db
+
+SUGGEST_BUILDS = metrics.counter('flik_suggest_index_builds_total', 'Per-user suggestion index (re)builds')
+SUGGEST_SECONDS = metrics.histogram(
+    'flik_suggest_seconds', 'Suggestion lookup time, by whether the index had to be built', ('index',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+KIND_ORDER = {'category': 0, 'filename': 1, 'term': 2}
+TERMS_PER_DOCUMENT = 25
+TEXT_SAMPLE_CHARS = 20000  # of extracted text read per document when building
+SCAN_LIMIT = 2000
+TOP_CACHED = 20  # ranked completions kept for prefixes with more than SCAN_LIMIT matches
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9'-]{2,}")
+STOPWORDS = frozenset("""
+    about above after again against also among another because been before being below between both could
+    does doing down during each even every from further have having here however into itself just like made
+    make many more most much must near only other over same should since some such than that their them
+    then there these they this those through under until upon very was were what when where which while
+    with within without would your yours page please will shall dear date the and for are not you our
+""".split())
+
+
+def _terms(text):
+    """The most frequent non-stopword words of a document."""
+    counts = Counter(w.strip("'-") for w in _WORD_RE.findall((text or '').lower()))
+    return [w for w, _ in counts.most_common(TERMS_PER_DOCUMENT * 2)
+            if len(w) >= 4 and w not in STOPWORDS][:TERMS_PER_DOCUMENT]
+
+
+def _filename_tokens(name):
+    """The whole name and its words, without the extension (so "pd" does not match every PDF)."""
+    lowered = name.lower()
+    stem = lowered.rsplit('.', 1)[0]
+    return [lowered] + [w for w in re.findall(r'[a-z0-9]+', stem) if len(w) >= 2 and w != lowered]
+
+
+class PrefixIndex:
+    """One user's completions: a sorted key list for prefix scans and weighted entries."""
+
+    def __init__(self, max_terms=5000):
+        self.max_terms = max_terms
+        self.keys = []      # sorted (token, kind, ident)
+        self.entries = {}   # (kind, ident) -> [text, weight, tokens]
+        self.documents = {}  # document id -> [(kind, ident), ...] it contributed
+        self.term_count = 0
+        self._top = {}  # prefix -> ranked keys, for prefixes too common to rank per lookup
+        self._loading = False
+
+    def _add(self, kind, ident, text, tokens):
+        entry = self.entries.get((kind, ident))
+        if entry is not None:
+            entry[1] += 1
+            return True
+        if kind == 'term':
+            if self.term_count >= self.max_terms:
+                return False
+            self.term_count += 1
+        self.entries[(kind, ident)] = [text, 1, tokens]
+        self._top.clear()
+        for token in tokens:
+            if self._loading:
+                self.keys.append((token, kind, ident))
+            else:
+                insort(self.keys, (token, kind, ident))
+        return True
+
+    def _remove(self, kind, ident):
+        entry = self.entries.get((kind, ident))
+        if entry is None:
+            return
+        entry[1] -= 1
+        self._top.clear()
+        if entry[1] > 0:
+            return
+        del self.entries[(kind, ident)]
+        if kind == 'term':
+            self.term_count -= 1
+        for token in entry[2]:
+            key = (token, kind, ident)
+            i = bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+
+    def add_document(self, document_id, filename, category, terms, allowed_terms=None):
+        contributed = []
+        if filename:
+            ident = filename.lower()
+            self._add('filename', ident, filename, _filename_tokens(filename))
+            contributed.append(('filename', ident))
+        category = category or 'Other'
+        self._add('category', category.lower(), category, [category.lower()])
+        contributed.append(('category', category.lower()))
+        for term in terms:
+            if (allowed_terms is None or term in allowed_terms) and self._add('term', term, term, [term]):
+                contributed.append(('term', term))
+        self.documents[document_id] = contributed
+
+    def load(self, documents, allowed_terms=None):
+        """Add (document_id, filename, category, terms) rows in bulk: keys are sorted once at the end."""
+        self._loading = True
+        try:
+            for document_id, filename, category, terms in documents:
+                self.add_document(document_id, filename, category, terms, allowed_terms)
+        finally:
+            self._loading = False
+            self.keys.sort()
+
+    def remove_document(self, document_id):
+        for kind, ident in self.documents.pop(document_id, ()):
+            self._remove(kind, ident)
+
+    def search(self, prefix, limit=8):
+        """Best completions for `prefix`: highest weight first, then categories, filenames, terms."""
+        prefix = prefix.lower()
+        ranked = self._top.get(prefix)
+        if ranked is None or limit > TOP_CACHED:
+            matched, complete = self._scan(prefix, SCAN_LIMIT)
+            if not complete:
+                # Short prefixes match more keys than a lookup should walk, and an alphabetical
+                # cut-off would drop heavy completions late in the range: rank them all once,
+                # and reuse that until the index changes
+                matched, _ = self._scan(prefix, None)
+            ranked = sorted(matched, key=lambda key: (-self.entries[key][1], KIND_ORDER[key[0]], key[1]))
+            if not complete:
+                self._top[prefix] = ranked[:TOP_CACHED]
+        return [{'text': self.entries[key][0], 'kind': key[0], 'count': self.entries[key][1]}
+                for key in ranked[:limit]]
+
+    def _scan(self, prefix, cap):
+        """((kind, ident) keys whose tokens start with prefix, whether all were seen within `cap` keys)."""
+        matched = set()
+        i = bisect_left(self.keys, (prefix,))
+        end = len(self.keys) if cap is None else min(len(self.keys), i + cap)
+        while i < end and self.keys[i][0].startswith(prefix):
+            matched.add(self.keys[i][1:])
+            i += 1
+        return matched, not (i < len(self.keys) and self.keys[i][0].startswith(prefix))
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def build_index(user_id, max_terms=5000):
+    """Read the user's documents and build a PrefixIndex (one pass; text is sampled)."""
+    rows = (
+        db.session.query(Document.id, Document.original_filename, Document.category,
+                         db.func.substr(Document.extracted_text, 1, TEXT_SAMPLE_CHARS))
+        .filter(Document.user_id == user_id)
+        .order_by(Document.id)
+        .yield_per(500)
+    )
+    documents = [(document_id, filename, category, _terms(text)) for document_id, filename, category, text in rows]
+    frequency = Counter(term for *_, terms in documents for term in terms)
+    allowed = {term for term, _ in frequency.most_common(max_terms)}
+    index = PrefixIndex(max_terms)
+    index.load(documents, allowed)
+    SUGGEST_BUILDS.inc()
+    return index
+
+
+class SuggestionIndexes:
+    """Per-process LRU of user indexes with a rebuild age; thread-safe."""
+
+    def __init__(self, ttl=300.0, max_users=1000, max_terms=5000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_terms = max_terms
+        self._indexes = OrderedDict()  # user_id -> (built_at, PrefixIndex)
+        self._lock = threading.RLock()
+
+    def _loaded(self, user_id):
+        item = self._indexes.get(user_id)
+        if item is None or item[0] + self.ttl < time.monotonic():
+            return None
+        return item[1]
+
+    def get(self, user_id):
+        """(index, built): the user's loaded index, or a freshly built one."""
+        with self._lock:
+            index = self._loaded(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index, False
+        # Built outside the lock so one user's rebuild does not stall the others
+        index = build_index(user_id, self.max_terms)
+        with self._lock:
+            self._indexes[user_id] = (time.monotonic(), index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index, True
+
+    def search(self, user_id, prefix, limit=8):
+        started = time.perf_counter()
+        index, built = self.get(user_id)
+        with self._lock:
+            results = index.search(prefix, limit)
+        SUGGEST_SECONDS.labels(index='built' if built else 'loaded').observe(time.perf_counter() - started)
+        return results
+
+    def document_added(self, user_id, document):
+        with self._lock:
+            index = self._loaded(user_id)
+            if index is not None:
+                index.add_document(document.id, document.original_filename, document.category,
+                                   _terms((document.extracted_text or '')[:TEXT_SAMPLE_CHARS]))
+
+    def documents_removed(self, user_id, document_ids):
+        with self._lock:
+            index = self._loaded(user_id)
+            if index is not None:
+                for document_id in document_ids:
+                    index.remove_document(document_id)
+
+    def invalidate(self, user_id=None):
+        """Drop one user's index (or all); the next lookup rebuilds it."""
+        with self._lock:
+            if user_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(user_id, None)
+
+
+def get_suggestions():
+    return current_app.extensions.get('flik_suggest')
+
+
+def suggest(user_id, prefix, limit=8):
+    """Completions for `prefix` from the user's index ([] when suggestions are off)."""
+    indexes = get_suggestions()
+    if indexes is None or not prefix:
+        return []
+    return indexes.search(user_id, prefix, limit)
+
+
+def _document_ids(kwargs):
+    if 'document_ids' in kwargs:
+        return kwargs['document_ids']
+    if 'document_id' in kwargs:
+        return [kwargs['document_id']]
+    return [kwargs['document'].id] if kwargs.get('document') is not None else []
+
+
+def _on_uploaded(app, user_id=None, document=None, **kwargs):
+    indexes = app.extensions.get('flik_suggest')
+    if indexes is not None and document is not None:
+        indexes.document_added(user_id, document)
+
+
+def _on_deleted(app, user_id=None, **kwargs):
+    indexes = app.extensions.get('flik_suggest')
+    if indexes is not None:
+        indexes.documents_removed(user_id, _document_ids(kwargs))
+
+
+def _on_recategorized(app, user_id=None, **kwargs):
+    indexes = app.extensions.get('flik_suggest')
+    if indexes is not None:
+        indexes.invalidate(user_id)
+
+
+_connected = False
+
+
+def init_suggest(app):
+    """Install the per-process indexes unless SUGGEST_INDEX_TTL is 0."""
+    global _connected
+    if not _connected:
+        events.document_uploaded.connect(_on_uploaded, weak=False)
+        events.document_deleted.connect(_on_deleted, weak=False)
+        events.document_recategorized.connect(_on_recategorized, weak=False)
+        _connected = True
+    ttl = float(app.config.get('SUGGEST_INDEX_TTL') or 0)
+    if ttl > 0:
+        app.extensions['flik_suggest'] = SuggestionIndexes(
+            ttl,
+            max_users=int(app.config.get('SUGGEST_MAX_USERS') or 1000),
+            max_terms=int(app.config.get('SUGGEST_MAX_TERMS') or 5000),
+        )
@@ -0,0 +1,232 @@
+"""Streaming text extraction for TXT and DOCX uploads.
+
+Both readers stay in bounded memory whatever the file size:
+- They read in CHUNK_SIZE pieces and stop at `max_chars` characters.
+- TXT: the encoding is detected from the first SAMPLE_SIZE bytes. The
+  checks, in order, are a BOM, BOM-less UTF-16 (one byte lane nearly
+  constant), valid UTF-8, charset_normalizer (when installed; trusted only for non-Latin
+  scripts), and finally cp1252 with replacement characters, so Latin-1 and
+  UTF-16 files no longer come out empty.
+- DOCX: text comes from the XML parts inside the zip with an incremental
+  parser, not by loading the whole document model. The body (including
+  tables), then headers and footers. Parsed elements are cleared as soon
+  as their text is taken.
+
+Each reader returns (text, truncated).
+"""
+import codecs
+import re
+from collections import Counter
+import unicodedata
+import zipfile
+from xml.etree import ElementTree
+
+try:
+    from charset_normalizer import from_bytes as _detect_charset
+    _HAS_CHARSET_NORMALIZER = True
+except ImportError:
+    _HAS_CHARSET_NORMALIZER = False
+
+CHUNK_SIZE = 64 * 1024
+SAMPLE_SIZE = 64 * 1024
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+HEADER_FOOTER_PART = re.compile(r'^word/(header|footer)(\d*)\.xml$')
+
+
+class _Collector:
+    """Accumulates text up to max_chars."""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self.truncated = False
+
+    @property
+    def full(self):
+        return self.max_chars is not None and self.length >= self.max_chars
+
+    def add(self, text):
+        if not text or self.truncated:
+            return
+        if self.max_chars is not None and self.length + len(text) > self.max_chars:
+            text = text[:self.max_chars - self.length]
+            self.truncated = True
+        self.parts.append(text)
+        self.length += len(text)
+
+    def text(self):
+        return ''.join(self.parts)
+
+
+def _is_latin(text):
+    return all(unicodedata.name(ch, '').startswith('LATIN') for ch in text if ch.isalpha() and not ch.isascii())
+
+
+def _lane_share(lane):
+    """Fraction of a byte lane taken by its two most common values."""
+    return sum(count for _, count in Counter(lane).most_common(2)) / len(lane)
+
+
+def _bomless_utf16(sample):
+    """'utf-16-le'/'utf-16-be' when the sample looks like UTF-16 without a BOM, else None.
+
+    In UTF-16 text from one script, the high byte of nearly every code unit
+    is one of a few values (0x00 for Latin, 0x04 for Cyrillic, ...), so one
+    byte lane is concentrated and the other varies. The sample must also
+    decode to printable text.
+    """
+    if len(sample) < 4:
+        return None
+    even, odd = sample[0::2], sample[1::2]
+    # NUL high bytes (ASCII text) are decisive even in a few bytes
+    if odd.count(0) > len(odd) * 0.3 and even.count(0) < len(even) * 0.05:
+        encoding = 'utf-16-le'
+    elif even.count(0) > len(even) * 0.3 and odd.count(0) < len(odd) * 0.05:
+        encoding = 'utf-16-be'
+    elif len(sample) < 16:
+        return None
+    elif _lane_share(odd) >= 0.9 and _lane_share(even) < 0.9:
+        encoding = 'utf-16-le'
+    elif _lane_share(even) >= 0.9 and _lane_share(odd) < 0.9:
+        encoding = 'utf-16-be'
+    else:
+        return None
+    try:
+        text = codecs.getincrementaldecoder(encoding)().decode(sample[:len(sample) // 2 * 2], final=False)
+    except UnicodeDecodeError:
+        return None
+    printable = sum(1 for ch in text if ch.isprintable() or ch in '\r\n\t')
+    return encoding if text and printable >= len(text) * 0.95 else None
+
+
+def detect_encoding(sample):
+    """Best guess at the encoding of a file starting with `sample` bytes."""
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    # Before UTF-8: BOM-less UTF-16 of Latin or Cyrillic text is often valid UTF-8 byte for byte
+    encoding = _bomless_utf16(sample)
+    if encoding:
+        return encoding
+    try:
+        # final=False: a multi-byte character cut off by the sample boundary is fine
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode('cp1252')
+        western = True
+    except UnicodeDecodeError:
+        western = False
+    if _HAS_CHARSET_NORMALIZER:
+        match = _detect_charset(sample).best()
+        # Short Latin-script samples fit cp1250/cp1257 as well as cp1252, and the
+        # detector often picks the rarer one; only trust it for other scripts
+        if match is not None and match.encoding and (not western or not _is_latin(str(match))):
+            return match.encoding
+    return 'cp1252'
+
+
+def read_text_file(path, max_chars=None):
+    """Decode a plain-text file in chunks; returns (text, truncated)."""
+    out = _Collector(max_chars)
+    with open(path, 'rb') as f:
+        sample = f.read(SAMPLE_SIZE)
+        encoding = detect_encoding(sample)
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        chunk = sample
+        while chunk and not out.full:
+            out.add(decoder.decode(chunk).replace('\x00', ''))
+            chunk = f.read(CHUNK_SIZE)
+        if not out.full:
+            out.add(decoder.decode(b'', final=True))
+        elif f.read(1):
+            out.truncated = True
+    return out.text(), out.truncated
+
+
+def _part_order(name):
+    match = HEADER_FOOTER_PART.match(name)
+    return (match.group(1), int(match.group(2) or 0))
+
+
+def _docx_parts(archive):
+    names = set(archive.namelist())
+    parts = ['word/document.xml'] if 'word/document.xml' in names else []
+    parts.extend(sorted((n for n in names if HEADER_FOOTER_PART.match(n) and n.split('/')[1].startswith('header')),
+                        key=_part_order))
+    parts.extend(sorted((n for n in names if HEADER_FOOTER_PART.match(n) and n.split('/')[1].startswith('footer')),
+                        key=_part_order))
+    return parts
+
+
+def _read_part(stream, out):
+    """Stream one WordprocessingML part into `out`: paragraphs end in newlines, table cells in tabs."""
+    container = None
+    cell_depth = 0
+    paragraph, cell = [], []
+    for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == W + 'tc':
+                cell_depth += 1
+            elif tag in (W + 'body', W + 'hdr', W + 'ftr'):
+                container = elem
+            continue
+        if tag == W + 't':
+            paragraph.append(elem.text or '')
+        elif tag == W + 'tab':
+            paragraph.append('\t')
+        elif tag in (W + 'br', W + 'cr'):
+            paragraph.append('\n')
+        elif tag == W + 'p':
+            text = ''.join(paragraph)
+            paragraph = []
+            if not cell_depth:
+                out.add(text + '\n')
+            elif text.strip():
+                cell.append(text.strip())
+        elif tag == W + 'tc':
+            cell_depth -= 1
+            out.add(' '.join(cell) + '\t')
+            cell = []
+        elif tag == W + 'tr':
+            out.add('\n')
+        if tag in (W + 'p', W + 'tbl') and not cell_depth and container is not None:
+            # Everything read so far is in `out`; drop it from the tree
+            container.clear()
+        if out.full:
+            return
+
+
+def read_docx(path, max_chars=None):
+    """Text of a DOCX file's body, tables, headers and footers; returns (text, truncated)."""
+    out = _Collector(max_chars)
+    seen = set()
+    with zipfile.ZipFile(path) as archive:
+        for name in _docx_parts(archive):
+            if out.full:
+                out.truncated = True
+                break
+            part = _Collector(None if max_chars is None else max_chars - out.length)
+            with archive.open(name) as stream:
+                _read_part(stream, part)
+            text = part.text().strip()
+            # Sections usually repeat the same header and footer
+            if not text or (name != 'word/document.xml' and text in seen):
+                continue
+            seen.add(text)
+            out.add(text + '\n\n')
+            out.truncated = out.truncated or part.truncated
+    return out.text(), out.truncated
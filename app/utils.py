@@ -1,9 +1,50 @@
 import os
+import sys
+import time
+import logging
+import threading
 import pdfplumber
 import pytesseract
 from PIL import Image
 from werkzeug.utils import secure_filename
+from app import metrics
 from app.ai_processor import AIProcessor
+from app.resilience import env_float, get_breaker, record_fallback
+from app.textfiles import read_docx, read_text_file
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_SECONDS = metrics.histogram(
+    'flik_extraction_seconds', 'Text extraction time per file', ('file_type', 'extractor'))
+EXTRACTED_PAGES = metrics.counter(
+    'flik_extracted_pages_total', 'Pages extracted', ('file_type', 'extractor'))
+EXTRACTION_ERRORS = metrics.counter(
+    'flik_extraction_errors_total', 'Extractor failures (the file yields no text)', ('extractor',))
+EXTRACTION_TRUNCATED = metrics.counter(
+    'flik_extraction_truncated_total', 'Extractions cut off at EXTRACT_MAX_CHARS', ('extractor',))
+ANALYSIS_ERRORS = metrics.counter(
+    'flik_analysis_errors_total', 'AI processing failures that fell back to "Other" with no todos')
+
+# Inside an extraction sandbox worker (app.sandbox) failures and truncations are
+# collected here and replayed in the parent, where the logs and metrics live
+_worker_events = None
+
+def _extraction_failed(extractor, message):
+    if _worker_events is not None:
+        _worker_events.append(('failed', extractor, message, type(sys.exc_info()[1]).__name__))
+        return
+    logger.warning("%s: %s", extractor, message, exc_info=True)
+    EXTRACTION_ERRORS.labels(extractor=extractor).inc()
+
+def replay_worker_events(events):
+    """Log and count what a sandbox worker reported for one job."""
+    for kind, extractor, detail, error in events:
+        if kind == 'failed':
+            logger.warning("%s: %s (%s in extraction sandbox)", extractor, detail, error)
+            EXTRACTION_ERRORS.labels(extractor=extractor).inc()
+        else:
+            logger.info("%s: %s cut off at EXTRACT_MAX_CHARS", extractor, detail)
+            EXTRACTION_TRUNCATED.labels(extractor=extractor).inc()
 
 # Optional Google integrations (lazy import pattern)
 try:
@@ -12,6 +53,9 @@ try:
 except Exception:
     _has_docai = False
 
+_docai_client = None
+_docai_client_lock = threading.Lock()
+
 def extract_text_from_pdf(file_path):
     """Extract text from PDF file using pdfplumber (local)."""
     try:
@@ -23,75 +67,213 @@ def extract_text_from_pdf(file_path):
                     text += page_text + "\n"
         return text.strip()
     except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
+        _extraction_failed("pdfplumber", f"Error extracting text from PDF: {e}")
         return ""
 
+def _fake_ocr(image):
+    """OCR_BACKEND=fake: return the text embedded by the benchmark corpus, after FAKE_OCR_LATENCY_MS."""
+    latency = env_float("FAKE_OCR_LATENCY_MS", 0.0)
+    if latency:
+        time.sleep(latency / 1000.0)
+    text = image.info.get("flik_text") or image.info.get("comment") or ""
+    return text.decode("utf-8", "replace") if isinstance(text, bytes) else text
+
 def extract_text_from_image(file_path):
-    """Extract text from image using OCR (pytesseract)."""
+    """Extract text from image using OCR (pytesseract, or the fake backend for load tests)."""
     try:
         image = Image.open(file_path)
+        if os.getenv("OCR_BACKEND", "tesseract") == "fake":
+            return _fake_ocr(image).strip()
         text = pytesseract.image_to_string(image)
         return text.strip()
     except Exception as e:
-        print(f"Error extracting text from image: {e}")
+        _extraction_failed("ocr", f"Error extracting text from image: {e}")
         return ""
 
+def _max_chars():
+    limit = int(env_float("EXTRACT_MAX_CHARS", 2_000_000))
+    return limit if limit > 0 else None
+
+def _note_truncation(extractor, file_path, truncated):
+    if truncated and _worker_events is not None:
+        _worker_events.append(('truncated', extractor, os.path.basename(file_path), None))
+    elif truncated:
+        logger.info("%s: %s cut off at EXTRACT_MAX_CHARS", extractor, os.path.basename(file_path))
+        EXTRACTION_TRUNCATED.labels(extractor=extractor).inc()
+
 def extract_text_from_txt(file_path):
+    """Decode a text file in chunks with a detected encoding, up to EXTRACT_MAX_CHARS."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read().strip()
+        text, truncated = read_text_file(file_path, _max_chars())
+        _note_truncation("txt", file_path, truncated)
+        return text.strip()
     except Exception as e:
-        print(f"Error reading text file: {e}")
+        _extraction_failed("txt", f"Error reading text file: {e}")
         return ""
 
 def extract_text_from_docx(file_path):
+    """Body, table, header and footer text streamed from the DOCX XML, up to EXTRACT_MAX_CHARS."""
     try:
-        from docx import Document
-        doc = Document(file_path)
-        text = "\n".join(p.text for p in doc.paragraphs)
+        text, truncated = read_docx(file_path, _max_chars())
+        _note_truncation("docx", file_path, truncated)
         return text.strip()
     except Exception as e:
-        print(f"Error extracting text from DOCX: {e}")
+        _extraction_failed("docx", f"Error extracting text from DOCX: {e}")
         return ""
 
+def _document_ai_client():
+    """Shared client; DOCUMENTAI_API_ENDPOINT points it elsewhere (a plain http:// endpoint gets no credentials)."""
+    global _docai_client
+    with _docai_client_lock:
+        if _docai_client is None:
+            endpoint = os.getenv("DOCUMENTAI_API_ENDPOINT")
+            if endpoint:
+                credentials = None
+                if endpoint.startswith("http://"):
+                    from google.auth.credentials import AnonymousCredentials
+                    credentials = AnonymousCredentials()
+                _docai_client = documentai.DocumentProcessorServiceClient(
+                    client_options={"api_endpoint": endpoint}, transport="rest", credentials=credentials)
+            else:
+                _docai_client = documentai.DocumentProcessorServiceClient()
+        return _docai_client
+
+def _document_ai_request(file_path, project_id, location, processor_id, timeout):
+    client = _document_ai_client()
+    name = client.processor_path(project_id, location, processor_id)
+    with open(file_path, "rb") as f:
+        raw_document = documentai.RawDocument(content=f.read(), mime_type="application/pdf")
+    request = documentai.ProcessRequest(name=name, raw_document=raw_document)
+    result = client.process_document(request=request, timeout=timeout)
+    return result.document
+
+def _process_with_document_ai(file_path):
+    """Run the file through Document AI; returns the processed document or None.
+
+    The call is bounded by DOCUMENTAI_TIMEOUT and guarded by the 'documentai'
+    circuit breaker, so a slow upstream degrades to local extraction.
+    """
+    if not _has_docai:
+        return None
+    project_id = os.getenv("GOOGLE_PROJECT_ID")
+    location = os.getenv("GOOGLE_LOCATION", "us")
+    processor_id = os.getenv("GOOGLE_PROCESSOR_ID")
+    if not (project_id and processor_id):
+        return None
+    timeout = env_float("DOCUMENTAI_TIMEOUT", 30.0)
+    try:
+        return get_breaker("documentai").call(
+            _document_ai_request, file_path, project_id, location, processor_id, timeout, timeout=timeout
+        )
+    except Exception as e:
+        _extraction_failed("document_ai", f"Document AI extraction failed: {e}")
+        record_fallback("documentai")
+        return None
+
+def _document_ai_page_texts(document):
+    """Split a Document AI result into per-page texts using each page's text anchors."""
+    full_text = document.text or ''
+    texts = []
+    for page in document.pages:
+        segments = page.layout.text_anchor.text_segments
+        texts.append("".join(full_text[int(seg.start_index):int(seg.end_index)] for seg in segments).strip())
+    return texts if any(texts) else [full_text.strip()]
+
 def extract_text_with_document_ai(file_path):
     """Optional: Use Google Document AI if configured; otherwise return ''."""
-    if not _has_docai:
+    document = _process_with_document_ai(file_path)
+    if document is None:
         return ""
+    return (document.text or '').strip()
+
+def _page(number, text, method, started):
+    return {
+        'page_number': number,
+        'text': (text or '').strip(),
+        'method': method,
+        'duration_ms': (time.perf_counter() - started) * 1000.0,
+    }
+
+def extract_pages_from_pdf(file_path):
+    """Extract per-page text from a PDF using pdfplumber (local)."""
+    pages = []
     try:
-        project_id = os.getenv("GOOGLE_PROJECT_ID")
-        location = os.getenv("GOOGLE_LOCATION", "us")
-        processor_id = os.getenv("GOOGLE_PROCESSOR_ID")
-        if not (project_id and processor_id):
-            return ""
-        client = documentai.DocumentProcessorServiceClient()
-        name = client.processor_path(project_id, location, processor_id)
-        with open(file_path, "rb") as f:
-            raw_document = documentai.RawDocument(content=f.read(), mime_type="application/pdf")
-        request = documentai.ProcessRequest(name=name, raw_document=raw_document)
-        result = client.process_document(request=request)
-        return (result.document.text or '').strip()
+        with pdfplumber.open(file_path) as pdf:
+            for number, page in enumerate(pdf.pages, start=1):
+                started = time.perf_counter()
+                pages.append(_page(number, page.extract_text(), 'pdfplumber', started))
     except Exception as e:
-        print(f"Document AI extraction failed: {e}")
-        return ""
+        _extraction_failed("pdfplumber", f"Error extracting text from PDF: {e}")
+    return pages
 
-def extract_text_from_file(file_path, file_type):
+def extract_pages_with_document_ai(file_path):
+    """Per-page variant of extract_text_with_document_ai; [] when unavailable."""
+    started = time.perf_counter()
+    document = _process_with_document_ai(file_path)
+    if document is None:
+        return []
+    texts = _document_ai_page_texts(document)
+    # One API call covers every page, so its duration is shared evenly
+    share_ms = (time.perf_counter() - started) * 1000.0 / len(texts)
+    return [
+        {'page_number': n, 'text': t, 'method': 'document_ai', 'duration_ms': share_ms}
+        for n, t in enumerate(texts, start=1)
+    ]
+
+def extract_pages_from_file(file_path, file_type):
+    """Extract text page by page.
+
+    Returns a list of dicts with page_number, text, method and duration_ms.
+    Formats without real pages (images, TXT, DOCX) yield a single page.
+    """
     file_type = file_type.lower()
+    started = time.perf_counter()
+    pages = _extract_pages(file_path, file_type)
+    record_extraction(file_type, pages, started)
+    return pages
+
+def record_extraction(file_type, pages, started):
+    """Observe extraction metrics for pages extracted since perf_counter() `started`."""
+    extractor = pages[0]['method'] if pages else 'none'
+    EXTRACTION_SECONDS.labels(file_type=file_type, extractor=extractor).observe(time.perf_counter() - started)
+    if pages:
+        EXTRACTED_PAGES.labels(file_type=file_type, extractor=extractor).inc(len(pages))
+
+def _extract_pages(file_path, file_type):
 
     # Prefer GCP Document AI for PDFs if configured
     if file_type == 'pdf':
-        cloud_text = extract_text_with_document_ai(file_path)
-        if cloud_text:
-            return cloud_text
-        return extract_text_from_pdf(file_path)
-    elif file_type in ['png', 'jpg', 'jpeg']:
-        return extract_text_from_image(file_path)
+        pages = extract_pages_with_document_ai(file_path)
+        if any(p['text'] for p in pages):
+            return pages
+    from app.sandbox import extract_pages
+    return extract_pages(file_path, file_type)
+
+def extract_pages_locally(file_path, file_type):
+    """Extract without Document AI (pdfplumber, OCR, TXT, DOCX).
+
+    Takes only plain arguments and returns plain data, so it can run in a
+    worker process.
+    """
+    if file_type == 'pdf':
+        return extract_pages_from_pdf(file_path)
+
+    started = time.perf_counter()
+    if file_type in ['png', 'jpg', 'jpeg']:
+        return [_page(1, extract_text_from_image(file_path), 'ocr', started)]
     elif file_type == 'txt':
-        return extract_text_from_txt(file_path)
+        return [_page(1, extract_text_from_txt(file_path), 'txt', started)]
     elif file_type == 'docx':
-        return extract_text_from_docx(file_path)
+        return [_page(1, extract_text_from_docx(file_path), 'docx', started)]
     else:
-        return ""
+        return []
+
+def pages_to_text(pages):
+    """Flatten extracted pages into the single extracted_text string."""
+    return "\n".join(p['text'] for p in pages if p['text']).strip()
+
+def extract_text_from_file(file_path, file_type):
+    return pages_to_text(extract_pages_from_file(file_path, file_type))
 
 def get_file_size(file_path):
     return os.path.getsize(file_path)
@@ -107,10 +289,11 @@ def format_file_size(size_bytes):
     return f"{size_bytes:.1f} {size_names[i]}"
 
 def process_document_with_ai(text, filename=""):
+    """(category, todos/appointments, entities) for a document's text."""
     try:
-        ai_processor = AIProcessor()
-        category, appointments_todos = ai_processor.process_document(text, filename)
-        return category, appointments_todos
+        result = AIProcessor().analyze_document(text, filename)
+        return result['category'], result['todos'], result['entities']
     except Exception as e:
-        print(f"Error in AI processing: {e}")
-        return "Other", []
+        logger.exception("Error in AI processing: %s", e)
+        ANALYSIS_ERRORS.inc()
+        return "Other", [], {}
@@ -0,0 +1,90 @@
+"""Concurrent upload capacity: the async ASGI mode against gunicorn -w 4.
+
+    python -m benchmarks.capacity --concurrency 4,16,64 --duration 30
+    python -m benchmarks.capacity --servers asgi:1,asgi:2,wsgi:4 --fake-latency-ms 800
+
+For each server (kind:workers) the app is spawned against the Gemini and
+Document AI fakes (benchmarks.load.SpawnedApp). Then a closed loop of
+--concurrency users uploads back to back with no think time. The report has
+uploads/s, uploads/s per worker process, p95 latency and error rate at each
+concurrency level. A sync worker holds one upload for its whole wait on the
+fakes, so at high concurrency its throughput tops out near workers / latency.
+The async mode is limited instead by ASGI_IO_THREADS and CPU.
+
+Without gunicorn installed, wsgi falls back to the threaded Werkzeug server, so
+it is not a -w 4 comparison. Results go to --output as a harness result set,
+one entry per server and level (capacity/<kind>-w<workers>/c<N>).
+"""
+import argparse
+import os
+import sys
+
+from benchmarks.harness import write_results
+from benchmarks.load import LoadTest, SpawnedApp
+
+
+def parse_servers(value):
+    servers = []
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        kind, _, workers = part.strip().partition(':')
+        if kind not in ('asgi', 'wsgi'):
+            raise ValueError(f"unknown server {kind!r} (asgi or wsgi)")
+        servers.append((kind, int(workers or 1)))
+    return servers
+
+
+def measure(kind, workers, levels, args):
+    results = {}
+    spawned = SpawnedApp(workers, args.fake_latency_ms, args.fake_jitter_ms, 0.0, args.ocr_latency_ms, args.seed,
+                         server=kind, cpu_workers=args.cpu_workers)
+    try:
+        for level in levels:
+            test = LoadTest(spawned.url, users=level, rate=0, duration=args.duration, mix='upload=1',
+                            seed=args.seed, think=0)
+            run, _ = test.run()
+            upload = run['load/upload']
+            results[f"capacity/{kind}-w{workers}/c{level}"] = {
+                **upload,
+                'server': kind,
+                'workers': workers,
+                'concurrency': level,
+                'uploads_per_s_per_worker': upload['throughput_rps'] / workers,
+            }
+            print(f"{kind + ' -w' + str(workers):<10}{level:>6}{upload['throughput_rps']:>10.2f}"
+                  f"{upload['throughput_rps'] / workers:>12.2f}{upload['p95_s'] * 1000:>10.0f}"
+                  f"{upload['error_rate'] * 100:>7.1f}")
+    finally:
+        spawned.stop()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', default='asgi:1,wsgi:4', help='kind:workers list (default: asgi:1,wsgi:4)')
+    parser.add_argument('--concurrency', default='4,16,64', help='Concurrent uploaders per level')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per level')
+    parser.add_argument('--cpu-workers', type=int, default=None, help='ASGI_CPU_WORKERS for asgi servers')
+    parser.add_argument('--fake-latency-ms', type=float, default=500.0)
+    parser.add_argument('--fake-jitter-ms', type=float, default=100.0)
+    parser.add_argument('--ocr-latency-ms', type=float, default=200.0)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='capacity_results.json')
+    args = parser.parse_args(argv)
+
+    levels = [int(n) for n in args.concurrency.split(',') if n.strip()]
+    print(f"{'server':<10}{'conc':>6}{'uploads/s':>10}{'per worker':>12}{'p95 ms':>10}{'err%':>7}")
+    results = {}
+    for kind, workers in parse_servers(args.servers):
+        results.update(measure(kind, workers, levels, args))
+
+    write_results(args.output, results, cpu_count=os.cpu_count(), duration=args.duration,
+                  fake_latency_ms=args.fake_latency_ms, fake_jitter_ms=args.fake_jitter_ms,
+                  ocr_latency_ms=args.ocr_latency_ms, seed=args.seed)
+    print(f"wrote {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Local stand-ins for Gemini and Document AI, for offline, repeatable load tests.
+
+Both speak enough of the real REST APIs for the official clients pointed at them
+(GEMINI_API_ENDPOINT, DOCUMENTAI_API_ENDPOINT). Latency and error rate are
+tunable, and each server draws from its own seeded generator. Gemini answers are
+produced by the app's local categorizer and extractor; Document AI answers by
+pdfplumber, with per-page text anchors.
+
+    python -m benchmarks.fakes --latency-ms 400 --jitter-ms 200 --error-rate 0.02
+
+prints the environment for an app that should use them.
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GEMINI_PATH = re.compile(r'^/v1(beta)?/models/[^/:]+:generateContent$')
+DOCUMENTAI_PATH = re.compile(r'^/v1(beta\d*)?/projects/[^/]+/locations/[^/]+/processors/[^/:]+(/processorVersions/[^/:]+)?:process$')
+
+
+class FakeService:
+    """A fake API on 127.0.0.1; `respond(path, body)` returns a JSON-able object or None for 404."""
+
+    def __init__(self, name, respond, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0, port=0):
+        self.name = name
+        self.respond = respond
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                path = self.path.split('?', 1)[0]
+                delay, fail = service._draw()
+                time.sleep(delay)
+                if fail:
+                    self._send(503, {'error': {'code': 503, 'message': f'{service.name}: injected failure',
+                                               'status': 'UNAVAILABLE'}})
+                    return
+                try:
+                    payload = service.respond(path, json.loads(body or b'{}'))
+                except Exception as exc:
+                    self._send(500, {'error': {'code': 500, 'message': str(exc), 'status': 'INTERNAL'}})
+                    return
+                if payload is None:
+                    self._send(404, {'error': {'code': 404, 'message': f'no route {path}', 'status': 'NOT_FOUND'}})
+                else:
+                    self._send(200, payload)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name=f'fake-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def gemini_response(path, body):
+    if not GEMINI_PATH.match(path):
+        return None
+    from app.ai_processor import FakeGeminiModel
+
+    prompt = '\n'.join(part.get('text', '') for content in body.get('contents', [])
+                       for part in content.get('parts', []))
+    text = FakeGeminiModel()._local_response(prompt)
+    return {
+        'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'finishReason': 'STOP',
+            'index': 0,
+        }],
+        'usageMetadata': {'promptTokenCount': len(prompt) // 4, 'candidatesTokenCount': len(text) // 4},
+    }
+
+
+def documentai_response(path, body):
+    if not DOCUMENTAI_PATH.match(path):
+        return None
+    import pdfplumber
+
+    content = base64.b64decode(body.get('rawDocument', {}).get('content', ''))
+    texts = []
+    with pdfplumber.open(io.BytesIO(content)) as pdf:
+        for page in pdf.pages:
+            texts.append((page.extract_text() or '') + '\n')
+    full, pages, offset = ''.join(texts), [], 0
+    for number, text in enumerate(texts, start=1):
+        pages.append({
+            'pageNumber': number,
+            'layout': {'textAnchor': {'textSegments': [{'startIndex': str(offset), 'endIndex': str(offset + len(text))}]}},
+        })
+        offset += len(text)
+    return {'document': {'mimeType': 'application/pdf', 'text': full, 'pages': pages}}
+
+
+def start_fakes(latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=1234, gemini_port=0, documentai_port=0):
+    """Start both fakes; returns (gemini, documentai)."""
+    gemini = FakeService('gemini', gemini_response, latency_ms, jitter_ms, error_rate, seed, gemini_port).start()
+    documentai = FakeService('documentai', documentai_response, latency_ms, jitter_ms, error_rate, seed + 1,
+                             documentai_port).start()
+    return gemini, documentai
+
+
+def app_environment(gemini, documentai, ocr_latency_ms=0.0):
+    """Environment variables that route an app's external calls to the fakes."""
+    return {
+        'GEMINI_API_KEY': 'fake-key',
+        'GEMINI_API_ENDPOINT': gemini.url,
+        'DOCUMENTAI_API_ENDPOINT': documentai.url,
+        'GOOGLE_PROJECT_ID': 'fake-project',
+        'GOOGLE_LOCATION': 'us',
+        'GOOGLE_PROCESSOR_ID': 'fake-processor',
+        'OCR_BACKEND': 'fake',
+        'FAKE_OCR_LATENCY_MS': str(ocr_latency_ms),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gemini-port', type=int, default=8701)
+    parser.add_argument('--documentai-port', type=int, default=8702)
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    parser.add_argument('--jitter-ms', type=float, default=100.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--ocr-latency-ms', type=float, default=200.0)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    gemini, documentai = start_fakes(args.latency_ms, args.jitter_ms, args.error_rate, args.seed,
+                                     args.gemini_port, args.documentai_port)
+    for key, value in app_environment(gemini, documentai, args.ocr_latency_ms).items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gemini.stop()
+        documentai.stop()
+
+
+if __name__ == '__main__':
+    main()
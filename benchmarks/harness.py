@@ -0,0 +1,93 @@
+"""Timing, result files and baseline comparison shared by the benchmark suites."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+class Benchmark:
+    """Collects named measurements into a result set."""
+
+    def __init__(self):
+        self.results = {}
+
+    def measure(self, name, func, repeat=20, warmup=2, ops=1, **meta):
+        """Time func() `repeat` times after `warmup` calls; ops = work units per call."""
+        for _ in range(warmup):
+            func()
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        samples.sort()
+        median = statistics.median(samples)
+        self.results[name] = {
+            'median_s': median,
+            'p95_s': samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+            'min_s': samples[0],
+            'mean_s': statistics.fmean(samples),
+            'stdev_s': statistics.pstdev(samples),
+            'repeat': repeat,
+            'ops_per_s': ops / median if median > 0 else None,
+            **meta,
+        }
+        print(f"{name:<55} median {median * 1000:9.3f} ms  p95 {self.results[name]['p95_s'] * 1000:9.3f} ms",
+              file=sys.stderr)
+        return self.results[name]
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def environment():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_results(path, results, **meta):
+    payload = {'environment': environment(), 'meta': meta, 'results': results}
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    return payload
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(current, baseline, tolerance=0.20, metric='median_s'):
+    """Return rows (name, baseline, current, ratio, status); status is ok/regression/improved/new."""
+    rows = []
+    for name, result in sorted(current.items()):
+        base = baseline.get(name)
+        if base is None or not base.get(metric):
+            rows.append((name, None, result[metric], None, 'new'))
+            continue
+        ratio = result[metric] / base[metric]
+        status = 'regression' if ratio > 1 + tolerance else 'improved' if ratio < 1 - tolerance else 'ok'
+        rows.append((name, base[metric], result[metric], ratio, status))
+    return rows
+
+
+def print_comparison(rows):
+    for name, base, cur, ratio, status in rows:
+        if base is None:
+            print(f"{name:<55} {'-':>10} {cur * 1000:10.3f} ms  {'':>7}  {status}")
+        else:
+            print(f"{name:<55} {base * 1000:10.3f} {cur * 1000:10.3f} ms  {ratio:6.2f}x  {status}")
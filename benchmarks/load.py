@@ -0,0 +1,432 @@
+"""Load test against a running app (or one it starts itself with fake dependencies).
+
+    python -m benchmarks.load --spawn --users 20 --rate 15 --duration 60
+    python -m benchmarks.load --url http://staging:5000 --users 50 --rate 0 --think 1.0
+    python -m benchmarks.load --spawn --baseline benchmarks/load_baseline.json --tolerance 0.25
+
+Traffic is a weighted mix of upload, index, search, calendar, insights and
+toggle_todo (--mix upload=1,index=5,...), sent by --users virtual users, each
+with its own account and session.
+- With --rate > 0, arrivals are an open-loop Poisson process at that many
+  requests per second. Latency is measured from the scheduled arrival time, so
+  queueing in front of a saturated server counts against it.
+- With --rate 0, every user sends requests back to back, with exponential think
+  time (--think).
+
+--spawn starts Gemini and Document AI fakes (benchmarks.fakes) and an app
+process routed to them (gunicorn with --workers when installed, otherwise the
+threaded Werkzeug server; --server asgi runs uvicorn with app.asgi instead). That process uses the fake OCR backend, a fresh
+database and a fresh upload folder, so a run needs no network and is repeatable
+for a given --seed.
+
+The per-route report has request counts, throughput, error rate and
+p50/p90/p95/p99 latency, and is written as JSON (--output). With --baseline,
+the run fails (exit 1) when a route's p95 or throughput is worse than the
+baseline by more than --tolerance, or its error rate rises by more than
+--max-error-increase.
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import CATEGORY_VOCAB, CorpusGenerator
+from benchmarks.harness import compare, load_results, print_comparison, write_results
+
+ROUTES = ('upload', 'index', 'search', 'calendar', 'insights', 'toggle_todo')
+DEFAULT_MIX = 'upload=1,index=5,search=3,calendar=1,insights=1,toggle_todo=2'
+PASSWORD = 'load-test-password'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"unknown route {name!r} (choose from {', '.join(ROUTES)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('the mix needs at least one route with a positive weight')
+    return mix
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))]
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class VirtualUser:
+    def __init__(self, base_url, index, run_id):
+        self.base_url = base_url.rstrip('/')
+        self.email = f"load-{run_id}-{index}@example.com"
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        self.todo_ids = []
+
+    def request(self, method, path, data=None, content_type=None, timeout=120):
+        """Return (status, location header)."""
+        headers = {'Content-Type': content_type} if content_type else {}
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=timeout) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code, exc.headers.get('Location')
+
+    def form(self, path, fields):
+        return self.request('POST', path, urllib.parse.urlencode(fields).encode(),
+                            'application/x-www-form-urlencoded')
+
+    def json(self, path):
+        with self.opener.open(self.base_url + path, timeout=60) as response:
+            return json.loads(response.read())
+
+    def setup(self, todos=5, rng=None):
+        self.form('/signup', {'email': self.email, 'first_name': 'Load', 'last_name': 'Tester',
+                              'password': PASSWORD, 'confirm': PASSWORD})
+        self.form('/login', {'email': self.email, 'password': PASSWORD})
+        rng = rng or random.Random(0)
+        for n in range(todos):
+            self.form('/add_task', {'title': f'Load task {n}',
+                                    'due_date': f"2030-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"})
+        self.refresh_todos()
+
+    def refresh_todos(self):
+        self.todo_ids = [t['id'] for t in self.json('/api/v1/todos?fields=id&limit=200')['data']]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def record(self, route, seconds, status, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            self.statuses.setdefault(route, {}).setdefault(str(status), 0)
+            self.statuses[route][str(status)] += 1
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def results(self, elapsed):
+        results = {}
+        for route, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            errors = self.errors.get(route, 0)
+            results[f"load/{route}"] = {
+                'requests': len(samples),
+                'errors': errors,
+                'error_rate': errors / len(samples),
+                'throughput_rps': len(samples) / elapsed,
+                'median_s': percentile(samples, 0.50),
+                'p90_s': percentile(samples, 0.90),
+                'p95_s': percentile(samples, 0.95),
+                'p99_s': percentile(samples, 0.99),
+                'max_s': samples[-1],
+                'mean_s': sum(samples) / len(samples),
+                'statuses': self.statuses.get(route, {}),
+            }
+        return results
+
+
+class LoadTest:
+    def __init__(self, base_url, users=10, rate=10.0, duration=30.0, mix=DEFAULT_MIX, seed=1234,
+                 concurrency=None, think=0.5, corpus_size=40):
+        self.base_url = base_url
+        self.mix = parse_mix(mix) if isinstance(mix, str) else mix
+        self.rate = rate
+        self.duration = duration
+        self.think = think
+        self.concurrency = concurrency or max(users, 1)
+        self.random = random.Random(seed)
+        self.recorder = Recorder()
+        run_id = f"{seed}-{uuid.uuid4().hex[:6]}"
+        self.users = [VirtualUser(base_url, i, run_id) for i in range(users)]
+        gen = CorpusGenerator(seed, median_words=250, sigma=0.7)
+        self.corpus = [gen.document() for _ in range(corpus_size)]
+        self._corpus_cycle = itertools.cycle(self.corpus)
+        self._corpus_lock = threading.Lock()
+        self._words = sorted({w for vocab in CATEGORY_VOCAB.values() for w in vocab})
+        self._routes, self._weights = zip(*self.mix.items())
+
+    def _pick(self, rng):
+        return rng.choices(self._routes, weights=self._weights)[0], rng.randrange(len(self.users))
+
+    def _call(self, route, user, rng):
+        if route == 'upload':
+            with self._corpus_lock:
+                document = next(self._corpus_cycle)
+            body, content_type = _multipart('file', document.filename, document.data)
+            return user.request('POST', '/upload', body, content_type)
+        if route == 'index':
+            return user.request('GET', '/')
+        if route == 'search':
+            return user.request('GET', '/search?q=' + urllib.parse.quote(rng.choice(self._words)))
+        if route == 'calendar':
+            return user.request('GET', '/calendar')
+        if route == 'insights':
+            return user.request('GET', '/insights')
+        if route == 'toggle_todo':
+            if not user.todo_ids:
+                return 0, None
+            return user.request('POST', f'/toggle_todo/{rng.choice(user.todo_ids)}')
+        raise ValueError(route)
+
+    def _execute(self, route, user, scheduled, rng):
+        try:
+            status, location = self._call(route, user, rng)
+        except Exception:
+            status, location = 'exception', None
+        # A redirect to /login means the session was lost: count it as a failure
+        ok = isinstance(status, int) and 0 < status < 400 and not (location and '/login' in location)
+        self.recorder.record(route, time.perf_counter() - scheduled, status, ok)
+
+    def setup(self):
+        setup_rng = random.Random(self.random.random())
+        with ThreadPoolExecutor(max_workers=min(16, len(self.users))) as pool:
+            list(pool.map(lambda u: u.setup(rng=random.Random(setup_rng.random())), self.users))
+
+    def _open_loop(self):
+        arrivals = random.Random(self.random.random())
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='load') as pool:
+            start = time.perf_counter()
+            scheduled = start
+            while True:
+                scheduled += arrivals.expovariate(self.rate)
+                if scheduled - start > self.duration:
+                    break
+                route, user = self._pick(arrivals)
+                task_rng = random.Random(arrivals.random())
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._execute, route, self.users[user], scheduled, task_rng)
+        return time.perf_counter() - start
+
+    def _closed_loop(self):
+        start = time.perf_counter()
+        deadline = start + self.duration
+
+        def loop(user, rng):
+            while time.perf_counter() < deadline:
+                route = rng.choices(self._routes, weights=self._weights)[0]
+                self._execute(route, user, time.perf_counter(), rng)
+                if self.think:
+                    time.sleep(min(rng.expovariate(1.0 / self.think), max(0.0, deadline - time.perf_counter())))
+
+        threads = [threading.Thread(target=loop, args=(user, random.Random(self.random.random())), daemon=True)
+                   for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    def run(self):
+        self.setup()
+        elapsed = self._open_loop() if self.rate > 0 else self._closed_loop()
+        return self.recorder.results(elapsed), elapsed
+
+
+def print_report(results, elapsed):
+    print(f"\n{'route':<22}{'reqs':>7}{'rps':>8}{'err%':>7}{'p50 ms':>10}{'p90 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['requests']:>7}{r['throughput_rps']:>8.2f}{r['error_rate'] * 100:>7.1f}"
+              f"{r['median_s'] * 1000:>10.1f}{r['p90_s'] * 1000:>10.1f}{r['p95_s'] * 1000:>10.1f}{r['p99_s'] * 1000:>10.1f}")
+    total = sum(r['requests'] for r in results.values())
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.2f} req/s)")
+
+
+def check_regressions(results, baseline, tolerance, max_error_increase):
+    """Return human-readable regression messages (empty when the run is acceptable)."""
+    failures = []
+    rows = compare(results, baseline, tolerance, metric='p95_s')
+    print_comparison(rows)
+    for name, _, _, ratio, status in rows:
+        if status == 'regression':
+            failures.append(f"{name}: p95 {ratio:.2f}x baseline")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['error_rate'] > base.get('error_rate', 0) + max_error_increase:
+            failures.append(f"{name}: error rate {result['error_rate']:.1%} (baseline {base.get('error_rate', 0):.1%})")
+        if base.get('throughput_rps') and result['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            failures.append(f"{name}: throughput {result['throughput_rps']:.2f}/s (baseline {base['throughput_rps']:.2f}/s)")
+    return failures
+
+
+# ---------------------------------------------------------------------------
+# --spawn
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, timeout=60.0, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"app process exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(url + '/login', timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.25)
+    raise RuntimeError(f"app did not come up at {url}")
+
+
+class SpawnedApp:
+    """The app in a subprocess, with its external dependencies routed to local fakes."""
+
+    def __init__(self, workers=4, fake_latency_ms=300.0, fake_jitter_ms=100.0, fake_error_rate=0.0,
+                 ocr_latency_ms=200.0, seed=1234, server='wsgi', cpu_workers=None):
+        from benchmarks.fakes import app_environment, start_fakes
+
+        self.workdir = tempfile.mkdtemp(prefix='flik-load-')
+        self.fakes = start_fakes(fake_latency_ms, fake_jitter_ms, fake_error_rate, seed)
+        port = _free_port()
+        self.url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ)
+        env.update(app_environment(*self.fakes, ocr_latency_ms=ocr_latency_ms))
+        env.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(self.workdir, 'load.db')}",
+            'UPLOAD_FOLDER': os.path.join(self.workdir, 'uploads'),
+            'STORAGE_BACKEND': 'local',
+            'PROFILE_DIR': os.path.join(self.workdir, 'profiles'),
+            'SECRET_KEY': 'load-test',
+            'PROMETHEUS_MULTIPROC_DIR': os.path.join(self.workdir, 'prometheus'),
+        })
+        if cpu_workers is not None:
+            env['ASGI_CPU_WORKERS'] = str(cpu_workers)
+        os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if server == 'asgi':
+            command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                       '--port', str(port), '--workers', str(workers), '--no-access-log']
+        elif shutil.which('gunicorn'):
+            command = ['gunicorn', '--config', os.path.join(root, 'gunicorn.conf.py'), '--bind', f'127.0.0.1:{port}',
+                       '--workers', str(workers), '--timeout', '300', 'run:app']
+        else:
+            env.pop('PROMETHEUS_MULTIPROC_DIR')
+            command = [sys.executable, '-c',
+                       "from werkzeug.serving import run_simple; from app import create_app; "
+                       f"run_simple('127.0.0.1', {port}, create_app(), threaded=True)"]
+        self.log = open(os.path.join(self.workdir, 'app.log'), 'wb')
+        self.process = subprocess.Popen(command, cwd=root, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        try:
+            _wait_for(self.url, process=self.process)
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+        for fake in self.fakes:
+            fake.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Base URL of a running app')
+    target.add_argument('--spawn', action='store_true', help='Start the app and the fakes locally')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=10.0, help='Open-loop arrivals per second (0 = closed loop)')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of traffic after setup')
+    parser.add_argument('--think', type=float, default=0.5, help='Mean think time in closed-loop mode (seconds)')
+    parser.add_argument('--concurrency', type=int, default=None, help='Max in-flight requests (default: --users)')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--workers', type=int, default=4, help='Server worker processes with --spawn')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi', help='Server to spawn')
+    parser.add_argument('--fake-latency-ms', type=float, default=300.0)
+    parser.add_argument('--fake-jitter-ms', type=float, default=100.0)
+    parser.add_argument('--fake-error-rate', type=float, default=0.0)
+    parser.add_argument('--ocr-latency-ms', type=float, default=200.0)
+    parser.add_argument('--output', default='load_results.json')
+    parser.add_argument('--baseline', help='Saved profile to compare against')
+    parser.add_argument('--save-baseline', help='Also write results to this profile path')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95/throughput degradation ratio')
+    parser.add_argument('--max-error-increase', type=float, default=0.01, help='Allowed absolute error-rate increase')
+    args = parser.parse_args(argv)
+
+    spawned = None
+    if args.spawn:
+        spawned = SpawnedApp(args.workers, args.fake_latency_ms, args.fake_jitter_ms, args.fake_error_rate,
+                             args.ocr_latency_ms, args.seed, args.server)
+        print(f"app at {spawned.url}", file=sys.stderr)
+    try:
+        test = LoadTest(args.url or spawned.url, users=args.users, rate=args.rate, duration=args.duration,
+                        mix=args.mix, seed=args.seed, concurrency=args.concurrency, think=args.think)
+        results, elapsed = test.run()
+    finally:
+        if spawned is not None:
+            spawned.stop()
+
+    print_report(results, elapsed)
+    meta = {key: getattr(args, key) for key in ('users', 'rate', 'duration', 'think', 'mix', 'seed', 'workers',
+                                                 'fake_latency_ms', 'fake_jitter_ms', 'fake_error_rate',
+                                                 'ocr_latency_ms')}
+    meta['target'] = f"spawn:{args.server}" if args.spawn else args.url
+    write_results(args.output, results, **meta)
+    print(f"wrote {args.output}")
+    if args.save_baseline:
+        write_results(args.save_baseline, results, **meta)
+
+    if args.baseline:
+        failures = check_regressions(results, load_results(args.baseline), args.tolerance, args.max_error_increase)
+        if failures:
+            for failure in failures:
+                print(f"REGRESSION {failure}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Macro-benchmarks: upload, dashboard, search and insights against populated databases.
+
+Each size gets its own SQLite database under --db-dir, generated once from the
+seeded corpus and reused by later runs (pass --rebuild after schema changes
+that upgrade_schema cannot apply). Rows carry short bodies, a page each and
+about 1.5 todos, so a 1M-document database is a few GB rather than tens.
+"""
+import io
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.corpus import CATEGORY_VOCAB, CorpusGenerator
+
+BATCH = 20000
+SEARCH_TERMS = ('appointment', 'invoice', 'zzzz-no-match')
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = 'bench-password'
+
+
+def _db_path(db_dir, size, seed):
+    return os.path.join(db_dir, f"corpus_{size}_{seed}.db")
+
+
+def create_bench_app(db_path, upload_folder=None):
+    from app import create_app
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.abspath(db_path)}",
+        'UPLOAD_FOLDER': upload_folder or tempfile.mkdtemp(prefix='flik-bench-uploads-'),
+    })
+
+
+def populate(app, size, seed):
+    """Bulk-insert `size` documents (plus pages and todos) and the benchmark user."""
+    from app.models import Document, DocumentPage, Todo, User, db
+
+    rng = random.Random(seed)
+    gen = CorpusGenerator(seed, median_words=80, sigma=0.6)
+    categories = list(CATEGORY_VOCAB)
+    pool = [gen.text(rng.choice(categories), gen.word_count()) for _ in range(500)]
+    now = datetime.utcnow()
+
+    with app.app_context():
+        user = User.query.filter_by(email=BENCH_EMAIL).first()
+        if not user:
+            user = User(email=BENCH_EMAIL, first_name='Bench', last_name='User', name='Bench User')
+            user.set_password(BENCH_PASSWORD)
+            db.session.add(user)
+            db.session.commit()
+        user_id = user.id
+
+        doc_id = (db.session.query(db.func.max(Document.id)).scalar() or 0)
+        remaining = size - doc_id
+        while remaining > 0:
+            n = min(BATCH, remaining)
+            docs, pages, todos = [], [], []
+            for _ in range(n):
+                doc_id += 1
+                text = pool[rng.randrange(len(pool))]
+                file_type = rng.choice(('pdf', 'pdf', 'txt', 'docx', 'png'))
+                docs.append({
+                    'id': doc_id,
+                    'user_id': user_id,
+                    'filename': f"doc_{doc_id}.{file_type}",
+                    'original_filename': f"doc_{doc_id}.{file_type}",
+                    'file_path': f"doc_{doc_id}.{file_type}",
+                    'file_size': rng.randint(2_000, 5_000_000),
+                    'file_type': file_type,
+                    'extracted_text': text,
+                    'category': rng.choice(categories),
+                    'upload_date': now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60)),
+                })
+                pages.append({'document_id': doc_id, 'page_number': 1, 'text': text,
+                              'extraction_method': 'pdfplumber', 'extraction_ms': 1.0, 'char_count': len(text)})
+                for _ in range(rng.choice((0, 1, 1, 2, 3))):
+                    todos.append({
+                        'title': 'Task', 'description': text[:120], 'category': 'Other',
+                        'due_date': now + timedelta(days=rng.randint(-200, 200)) if rng.random() < 0.8 else None,
+                        'is_completed': rng.random() < 0.4, 'document_id': doc_id, 'user_id': user_id,
+                        'created_date': now,
+                    })
+            db.session.execute(Document.__table__.insert(), docs)
+            db.session.execute(DocumentPage.__table__.insert(), pages)
+            if todos:
+                db.session.execute(Todo.__table__.insert(), todos)
+            db.session.commit()
+            remaining -= n
+            print(f"  populated {doc_id}/{size}", end='\r', flush=True)
+        print()
+
+
+def login(client):
+    response = client.post('/login', data={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD})
+    if response.status_code not in (200, 302):
+        raise RuntimeError(f"benchmark login failed: {response.status_code}")
+
+
+def run(bench, sizes=(1000,), seed=1234, db_dir='benchmarks/.data', rebuild=False, quick=False):
+    os.makedirs(db_dir, exist_ok=True)
+    for size in sizes:
+        path = _db_path(db_dir, size, seed)
+        if rebuild and os.path.exists(path):
+            os.remove(path)
+        app = create_bench_app(path)
+        print(f"preparing {size}-document database at {path}")
+        populate(app, size, seed)
+
+        client = app.test_client()
+        login(client)
+        repeat = 3 if quick or size >= 1_000_000 else 10 if size >= 100_000 else 20
+        label = f"{size:,}".replace(',', '_')
+
+        def get(url):
+            def call():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {url} -> {response.status_code}")
+            return call
+
+        bench.measure(f"macro/{label}/dashboard", get('/'), repeat=repeat, rows=size)
+        for term in SEARCH_TERMS:
+            bench.measure(f"macro/{label}/dashboard_search/{term}", get(f'/?search={term}'), repeat=repeat, rows=size)
+            bench.measure(f"macro/{label}/search_pages/{term}", get(f'/search/pages?q={term}'), repeat=repeat, rows=size)
+        bench.measure(f"macro/{label}/insights", get('/insights'), repeat=repeat, rows=size)
+        bench.measure(f"macro/{label}/calendar", get('/calendar'), repeat=repeat, rows=size)
+
+        gen = CorpusGenerator(seed + size)
+
+        def upload():
+            doc = gen.document(file_type='txt')
+            response = client.post('/upload', data={'file': (io.BytesIO(doc.data), doc.filename)},
+                                   content_type='multipart/form-data')
+            if response.status_code != 302:
+                raise RuntimeError(f"upload -> {response.status_code}")
+
+        bench.measure(f"macro/{label}/upload_txt", upload, repeat=max(3, repeat // 2), warmup=1, rows=size)
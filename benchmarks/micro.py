@@ -0,0 +1,42 @@
+"""Micro-benchmarks: categorization, appointment extraction, date parsing and text extraction."""
+import os
+import tempfile
+
+from benchmarks.corpus import CorpusGenerator
+
+
+def run(bench, seed=1234, quick=False):
+    from app.ai_processor import AppointmentExtractor, DocumentCategorizer, chunk_text
+    from app.dedup import compute_signature
+    from app.utils import extract_text_from_file
+
+    repeat = 5 if quick else 20
+    gen = CorpusGenerator(seed)
+    categorizer = DocumentCategorizer()
+    extractor = AppointmentExtractor()
+
+    texts = {
+        'short': gen.text('Medical', 150),
+        'medium': gen.text('Finance', 1500),
+        'long': gen.text('Insurance', 15000),
+    }
+    for label, text in texts.items():
+        words = len(text.split())
+        bench.measure(f"categorize/{label}", lambda t=text: categorizer.categorize_document(t, 'doc.pdf'),
+                      repeat=repeat, words=words)
+        bench.measure(f"extract_appointments/{label}", lambda t=text: extractor.extract_appointments_and_todos(t, 'Medical'),
+                      repeat=repeat, words=words)
+        bench.measure(f"chunk_text/{label}", lambda t=text: chunk_text(t, 8000, 400), repeat=repeat, words=words)
+        bench.measure(f"minhash/{label}", lambda t=text: compute_signature(t), repeat=repeat, words=words)
+
+    dates = ['March 14, 2025', '03/14/2025', '14-03-2025', 'not a date', '2025-03-14'] * 200
+    bench.measure("parse_date/1000", lambda: [extractor._parse_date(d) for d in dates], repeat=repeat, ops=len(dates))
+
+    workdir = tempfile.mkdtemp(prefix='flik-bench-')
+    for file_type in ('txt', 'docx', 'pdf', 'png'):
+        doc = gen.document(file_type=file_type)
+        path = os.path.join(workdir, doc.filename)
+        with open(path, 'wb') as f:
+            f.write(doc.data)
+        bench.measure(f"extract_text/{file_type}", lambda p=path, t=file_type: extract_text_from_file(p, t),
+                      repeat=max(3, repeat // 4), bytes=len(doc.data), pages=doc.pages)
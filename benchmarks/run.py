@@ -0,0 +1,57 @@
+"""Benchmark runner.
+
+    python -m benchmarks.run --suite micro
+    python -m benchmarks.run --suite macro --sizes 1000,100000 --output bench.json
+    python -m benchmarks.run --suite all --baseline benchmarks/baseline.json --tolerance 0.25
+
+Results are written as JSON (timings in seconds per call). With --baseline,
+each result is compared to the stored one and the process exits with status 1
+if any median regressed by more than --tolerance. --save-baseline writes the
+current results as the new baseline.
+"""
+import argparse
+import sys
+
+from benchmarks import macro, micro
+from benchmarks.harness import Benchmark, compare, load_results, print_comparison, write_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', choices=('micro', 'macro', 'all'), default='micro')
+    parser.add_argument('--sizes', default='1000', help='Comma-separated document counts for macro runs, e.g. 1000,100000,1000000')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--db-dir', default='benchmarks/.data')
+    parser.add_argument('--rebuild', action='store_true', help='Regenerate macro databases')
+    parser.add_argument('--quick', action='store_true', help='Fewer repetitions (smoke runs)')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed slowdown ratio before failing')
+    parser.add_argument('--save-baseline', help='Also write results to this baseline path')
+    args = parser.parse_args(argv)
+
+    bench = Benchmark()
+    if args.suite in ('micro', 'all'):
+        micro.run(bench, seed=args.seed, quick=args.quick)
+    if args.suite in ('macro', 'all'):
+        sizes = tuple(int(s) for s in args.sizes.split(',') if s)
+        macro.run(bench, sizes=sizes, seed=args.seed, db_dir=args.db_dir, rebuild=args.rebuild, quick=args.quick)
+
+    meta = {'suite': args.suite, 'seed': args.seed, 'sizes': args.sizes}
+    write_results(args.output, bench.results, **meta)
+    print(f"wrote {args.output}")
+    if args.save_baseline:
+        write_results(args.save_baseline, bench.results, **meta)
+
+    if args.baseline:
+        rows = compare(bench.results, load_results(args.baseline), args.tolerance)
+        print_comparison(rows)
+        regressions = [r for r in rows if r[4] == 'regression']
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""gunicorn settings picked up automatically from the project root.
+
+Points prometheus_client at a shared directory so /metrics aggregates every
+worker, and cleans up after workers that exit.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+
+# Must be set before any worker imports prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "flik-prometheus"))
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be summed into the new one
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
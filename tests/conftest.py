@@ -0,0 +1,30 @@
+import pytest
+
+from app import create_app, db
+from app.models import User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'flik.db'}",
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'REMINDER_NOTIFIERS': 'fake',
+        'REMINDER_WORKER': False,
+        'GC_WORKER': False,
+        'EXTRACT_SANDBOX': False,
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user(app):
+    user = User(email='pat@example.com', first_name='Pat', last_name='Doe')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
@@ -0,0 +1,36 @@
+from app import db
+from app.models import User
+
+
+def _sign_in(client, email='pat@example.com', password='secret'):
+    return client.post('/login', data={'email': email, 'password': password})
+
+
+def _admins(app, *args):
+    result = app.test_cli_runner().invoke(args=['admins', *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_email_alone_does_not_make_an_admin(app, user):
+    client = app.test_client()
+    _sign_in(client)
+    assert client.get('/admin/profiles').status_code == 403
+    assert client.get('/metrics').status_code == 401
+
+    client.post('/profile/edit', data={'first_name': 'Pat', 'last_name': 'Doe', 'email': 'root@example.com'})
+    assert db.session.get(User, user.id, populate_existing=True).email == 'root@example.com'
+    assert client.get('/admin/profiles').status_code == 403
+
+
+def test_granted_admin_can_read_profiles_and_metrics(app, user):
+    _admins(app, 'grant', 'pat@example.com')
+    client = app.test_client()
+    _sign_in(client)
+    assert client.get('/admin/profiles').status_code == 200
+    assert client.get('/metrics').status_code == 200
+    assert _admins(app, 'list') == 'pat@example.com\n'
+
+    _admins(app, 'revoke', 'pat@example.com')
+    app.extensions['flik_identity'].invalidate()
+    assert client.get('/admin/profiles').status_code == 403
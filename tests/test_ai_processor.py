@@ -0,0 +1,49 @@
+import time
+
+from app.ai_processor import FakeGeminiModel, GeminiAnalyzer, chunk_text
+from app.resilience import CLOSED, HALF_OPEN, CircuitBreaker
+
+FILLER = 'The weather stayed mild and the garden grew well all year. '
+
+
+def _document(appointment, filler=300):
+    half = FILLER * (filler // 2)
+    return half + appointment + ' ' + half
+
+
+def test_appointment_in_a_skipped_chunk_survives():
+    text = _document('Your dental appointment is on March 15, 2030 at 10:00 am with Dr. Smith.')
+    model = FakeGeminiModel(responder=lambda prompt: '{"category": "Dental", "todos": [], "entities": {}}')
+    analyzer = GeminiAnalyzer(model=model, chunk_size=1000, chunk_overlap=0, max_chunks=2, parallelism=2)
+    assert len(chunk_text(text, 1000, 0)) > 2
+
+    result = analyzer.analyze(text, 'letter.txt')
+    assert len(model.calls) == 2
+    assert 'March 15' not in ''.join(model.calls)
+    assert result['category'] == 'Dental'
+    [todo] = result['todos']
+    assert todo['type'] == 'appointment' and todo['due_date'].date().isoformat() == '2030-03-15'
+    assert result['entities']['doctor'] == 'Dr. Smith'
+
+
+def test_short_document_is_read_by_gemini_only():
+    model = FakeGeminiModel()
+    analyzer = GeminiAnalyzer(model=model, chunk_size=1000, max_chunks=2)
+    result = analyzer.analyze('Dental appointment on March 15, 2030 with Dr. Smith.', 'card.txt')
+    assert len(model.calls) == 1
+    assert [t['type'] for t in result['todos']] == ['appointment']
+
+
+def test_half_open_breaker_trials_one_chunk_then_fans_out():
+    text = _document('Your dental appointment is on March 15, 2030 at 10:00 am with Dr. Smith.', filler=100)
+    model = FakeGeminiModel(latency=0.05)
+    analyzer = GeminiAnalyzer(model=model, chunk_size=1000, chunk_overlap=0, max_chunks=8, parallelism=4)
+    analyzer.breaker = CircuitBreaker('gemini-test', failure_threshold=1, reset_timeout=0.01)
+    analyzer.breaker.record_failure()
+    time.sleep(0.02)
+    assert analyzer.breaker.state == HALF_OPEN
+
+    result = analyzer.analyze(text, 'letter.txt')
+    assert result is not None and len(model.calls) == len(chunk_text(text, 1000, 0)) > 2
+    assert analyzer.breaker.state == CLOSED
+    assert [t['type'] for t in result['todos']] == ['appointment']
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('multipart')
+httpx = pytest.importorskip('httpx')
+
+from app.asgi import create_asgi_app  # noqa: E402
+from app.models import Document  # noqa: E402
+
+BOUNDARY = 'flikboundary'
+HEAD = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="note.txt"\r\n'
+        'Content-Type: text/plain\r\n\r\n').encode()
+TAIL = f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+def _upload(app, size, chunked):
+    """POST a size-byte text file to the API, streamed without Content-Length when chunked."""
+    async def chunks():
+        yield HEAD
+        for _ in range(size // 1024):
+            yield b'x' * 1024
+        yield TAIL
+
+    async def run():
+        asgi = create_asgi_app(app)
+        transport = httpx.ASGITransport(app=asgi)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                await client.post('/login', data={'email': 'pat@example.com', 'password': 'secret'})
+                body = chunks() if chunked else HEAD + b'x' * size + TAIL
+                return await client.post('/api/v1/uploads', content=body,
+                                         headers={'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'})
+        finally:
+            asgi.close()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_upload_over_max_content_length_is_rejected(app, user, chunked):
+    app.config['MAX_CONTENT_LENGTH'] = 64 * 1024
+    response = _upload(app, 256 * 1024, chunked)
+    assert response.status_code == 413
+    assert Document.query.count() == 0
+
+
+def test_upload_under_the_limit_is_stored(app, user):
+    app.config['MAX_CONTENT_LENGTH'] = 64 * 1024
+    response = _upload(app, 8 * 1024, chunked=True)
+    assert response.status_code == 201, response.text
+    assert Document.query.count() == 1
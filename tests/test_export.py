@@ -0,0 +1,89 @@
+import hashlib
+import io
+import zipfile
+
+import pytest
+
+from app import db
+from app.export import ExportError, import_archive, iter_export
+from app.models import Document, DocumentPage
+from app.storage import get_storage
+
+FILES = [
+    ('note.txt', 'txt', b'Dentist on Friday at 10am\n' * 200),
+    # Stored uncompressed; contains the data descriptor signature to exercise the size check
+    ('scan.pdf', 'pdf', b'%PDF-1.4 ' + b'PK\x07\x08' + bytes(range(256)) * 40),
+]
+
+
+def _export(user):
+    storage = get_storage()
+    for filename, file_type, data in FILES:
+        size = storage.save(filename, io.BytesIO(data))
+        db.session.add(Document(user_id=user.id, filename=filename, original_filename=filename, file_path=filename,
+                                file_size=size, file_type=file_type, category='Medical'))
+    db.session.commit()
+    archive = b''.join(iter_export([user.id], 'zip'))
+    # Start over so the import creates the documents again
+    Document.query.delete()
+    for filename, _, _ in FILES:
+        storage.delete(filename)
+    db.session.commit()
+    return archive
+
+
+def _import(tmp_path, user, data):
+    path = tmp_path / 'library.zip'
+    path.write_bytes(data)
+    return import_archive(str(path), user)
+
+
+def test_complete_zip(app, user, tmp_path):
+    counts = _import(tmp_path, user, _export(user))
+    assert counts['documents'] == 2 and counts['complete'] and counts['incomplete'] == 0
+
+
+def test_zip_cut_before_central_directory_keeps_everything(app, user, tmp_path):
+    archive = _export(user)
+    cut = zipfile.ZipFile(io.BytesIO(archive)).start_dir
+    counts = _import(tmp_path, user, archive[:cut])
+    assert counts['documents'] == 2 and counts['complete']
+
+
+@pytest.mark.parametrize('into', [10, 600])
+def test_cut_off_zip_keeps_complete_documents(app, user, tmp_path, into):
+    archive = _export(user)
+    second = min(i.header_offset for i in zipfile.ZipFile(io.BytesIO(archive)).infolist()
+                 if i.filename.startswith('documents/2/'))
+    counts = _import(tmp_path, user, archive[:second + into])
+    assert counts['documents'] == 1 and not counts['complete']
+    assert counts['last_document_id'] == 1
+    assert [d.original_filename for d in Document.query] == ['note.txt']
+
+
+def test_not_an_archive(app, user, tmp_path):
+    with pytest.raises(ExportError):
+        _import(tmp_path, user, b'just some text, not an archive' * 100)
+
+
+def test_reimport_replaces_the_pages_of_an_existing_document(app, user, tmp_path):
+    storage = get_storage()
+    size = storage.save('letter.txt', io.BytesIO(b'Dentist on Friday'))
+    document = Document(user_id=user.id, filename='letter.txt', original_filename='letter.txt', file_path='letter.txt',
+                        file_size=size, file_type='txt', extracted_text='Dentist on Friday', category='Dental',
+                        content_hash=hashlib.sha256(b'Dentist on Friday').hexdigest())
+    document.pages = [DocumentPage(page_number=1, text='Dentist on Friday', char_count=17)]
+    db.session.add(document)
+    db.session.commit()
+    archive = b''.join(iter_export([user.id], 'zip'))
+
+    document.extracted_text = 'Edited'
+    document.pages.filter_by(page_number=1).one().text = 'Edited'
+    document.pages.append(DocumentPage(page_number=2, text='Stale page', char_count=10))
+    db.session.commit()
+
+    counts = _import(tmp_path, user, archive)
+    assert counts['updated'] == 1 and counts['documents'] == 0
+    document = db.session.get(Document, document.id, populate_existing=True)
+    assert document.extracted_text == 'Dentist on Friday'
+    assert [(p.page_number, p.text) for p in document.pages] == [(1, 'Dentist on Friday')]
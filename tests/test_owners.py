@@ -0,0 +1,35 @@
+from app import db
+from app.entities import facet_counts, store
+from app.models import Document, DocumentEntity
+
+
+def _unowned_document():
+    document = Document(filename='visit.txt', original_filename='visit.txt', file_path='visit.txt', file_size=1,
+                        file_type='txt', extracted_text='Seen by Dr. Jane Smith')
+    db.session.add(document)
+    db.session.flush()
+    # As `entities backfill` writes them for a document without an owner
+    store(document, {'doctor': 'Dr. Jane Smith'})
+    db.session.commit()
+    return document
+
+
+def test_assign_gives_entities_the_document_owner(app, user):
+    document = _unowned_document()
+    assert facet_counts(user.id) == {}
+
+    result = app.test_cli_runner().invoke(args=['owners', 'assign'])
+    assert result.exit_code == 0, result.output
+    assert {e.user_id for e in DocumentEntity.query.filter_by(document_id=document.id)} == {user.id}
+    assert facet_counts(user.id) == {'doctor': [('jane smith', 'Dr. Jane Smith', 1)]}
+
+
+def test_assign_repairs_entities_of_already_owned_documents(app, user):
+    document = _unowned_document()
+    Document.query.update({Document.user_id: user.id})
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['owners', 'assign'])
+    assert result.exit_code == 0, result.output
+    assert 'Gave 1 entity row' in result.output
+    assert DocumentEntity.query.filter(DocumentEntity.user_id.is_(None)).count() == 0
@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import db
+from app.models import Document, DocumentPage
+
+
+@contextmanager
+def _statements():
+    seen = []
+    listener = lambda conn, cursor, statement, *args: seen.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        yield seen
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+
+def _document(app, user, pages=()):
+    document = Document(user_id=user.id, filename='scan.pdf', original_filename='scan.pdf', file_path='scan.pdf',
+                        file_size=1, file_type='pdf', extracted_text='\n\n'.join(pages) or 'Legacy text')
+    document.pages = [DocumentPage(page_number=i, text=text, char_count=len(text)) for i, text in enumerate(pages, 1)]
+    db.session.add(document)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'email': 'pat@example.com', 'password': 'secret'})
+    return client, document.id
+
+
+def test_detail_page_does_not_load_the_text_blob(app, user):
+    client, document_id = _document(app, user, ['First page', 'Second page'])
+    with _statements() as statements:
+        response = client.get(f'/file/{document_id}')
+    assert response.status_code == 200
+    assert b'(2 pages)' in response.data
+    assert not any('document.extracted_text AS' in s for s in statements)
+
+
+def test_legacy_text_is_served_as_page_one(app, user):
+    client, document_id = _document(app, user)
+    detail = client.get(f'/file/{document_id}')
+    assert b'(1 page)' in detail.data
+    pages = client.get(f'/file/{document_id}/pages').get_json()['pages']
+    assert [(p['page_number'], p['text'], p['extraction_method']) for p in pages] == [(1, 'Legacy text', 'legacy')]
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Todo
+from app.reminders import FakeNotifier, ReminderScheduler, reschedule_all
+
+
+def _todo(user, hours=2, **kwargs):
+    todo = Todo(title='Dentist', user_id=user.id if user else None,
+                due_date=datetime.utcnow() + timedelta(hours=hours), **kwargs)
+    db.session.add(todo)
+    db.session.commit()
+    return todo
+
+
+def _scheduler(app, node_id, notifier=None, **kwargs):
+    return ReminderScheduler(app, notifier or FakeNotifier(), node_id=node_id, **kwargs)
+
+
+def test_insert_schedules_the_reminder_that_is_already_due(app, user):
+    todo = _todo(user)
+    # A day-before reminder for something due in two hours is sent right away
+    assert todo.next_reminder_at == todo.due_date - timedelta(minutes=1440)
+
+
+def test_claim_is_exclusive_until_the_lease_expires(app, user):
+    todo = _todo(user)
+    first, second = _scheduler(app, 'a', lease_seconds=60), _scheduler(app, 'b', lease_seconds=60)
+    now = datetime.utcnow()
+
+    assert first.claim(todo.id, todo.next_reminder_at, now)
+    assert not second.claim(todo.id, todo.next_reminder_at, now)
+    assert second.claim(todo.id, todo.next_reminder_at, now + timedelta(seconds=61))
+    assert db.session.get(Todo, todo.id, populate_existing=True).reminder_lease_owner == 'b'
+
+
+def test_claim_fails_when_the_schedule_moved(app, user):
+    todo = _todo(user)
+    scheduler = _scheduler(app, 'a')
+    assert not scheduler.claim(todo.id, todo.next_reminder_at - timedelta(minutes=1), datetime.utcnow())
+
+
+def test_run_once_sends_and_schedules_the_next_lead(app, user):
+    todo = _todo(user)
+    notifier = FakeNotifier()
+    scheduler = _scheduler(app, 'a', notifier)
+
+    assert scheduler.run_once() == 1
+    assert [r.todo_id for r in notifier.sent] == [todo.id]
+    todo = db.session.get(Todo, todo.id, populate_existing=True)
+    assert todo.last_reminded_at == todo.due_date - timedelta(minutes=1440)
+    assert todo.next_reminder_at == todo.due_date - timedelta(minutes=60)
+    assert todo.reminder_lease_owner is None
+    # Nothing else is due until the hour-before reminder
+    assert scheduler.run_once() == 0
+
+
+def test_failed_send_is_retried_after_backoff(app, user):
+    todo = _todo(user)
+    notifier = FakeNotifier()
+    notifier.fail = True
+    scheduler = _scheduler(app, 'a', notifier, retry_seconds=300)
+    now = datetime.utcnow()
+
+    assert scheduler.run_once(now) == 0
+    todo = db.session.get(Todo, todo.id, populate_existing=True)
+    assert todo.next_reminder_at == now + timedelta(seconds=300)
+    assert todo.reminder_lease_owner is None and todo.last_reminded_at is None
+
+    notifier.fail = False
+    assert scheduler.run_once(now + timedelta(seconds=301)) == 1
+    assert len(notifier.sent) == 1
+
+
+def test_no_retry_past_the_due_date(app, user):
+    todo = _todo(user, hours=0.05)
+    notifier = FakeNotifier()
+    notifier.fail = True
+    _scheduler(app, 'a', notifier, retry_seconds=3600).run_once()
+    assert db.session.get(Todo, todo.id, populate_existing=True).next_reminder_at is None
+
+
+def test_listener_reschedules_on_edit_and_completion(app, user):
+    todo = _todo(user)
+    _scheduler(app, 'a').run_once()
+    todo = db.session.get(Todo, todo.id, populate_existing=True)
+    assert todo.last_reminded_at is not None
+
+    todo.due_date = datetime.utcnow() + timedelta(days=3)
+    db.session.commit()
+    # A new due date restarts the sequence
+    assert todo.last_reminded_at is None
+    assert todo.next_reminder_at == todo.due_date - timedelta(minutes=1440)
+
+    todo.is_completed = True
+    db.session.commit()
+    assert todo.next_reminder_at is None
+
+
+def test_owners_assign_schedules_unowned_todos(app, user):
+    todo = _todo(None)
+    assert todo.next_reminder_at is None
+
+    result = app.test_cli_runner().invoke(args=['owners', 'assign'])
+    assert result.exit_code == 0, result.output
+    todo = db.session.get(Todo, todo.id, populate_existing=True)
+    assert todo.user_id == user.id
+    assert todo.next_reminder_at == todo.due_date - timedelta(minutes=1440)
+
+
+def test_sending_does_not_touch_updated_at(app, user):
+    todo = _todo(user)
+    stamp = datetime(2020, 1, 1)
+    Todo.query.filter_by(id=todo.id).update({Todo.updated_at: stamp}, synchronize_session=False)
+    db.session.commit()
+
+    notifier = FakeNotifier()
+    notifier.fail = True
+    scheduler = _scheduler(app, 'a', notifier)
+    now = datetime.utcnow()
+    scheduler.run_once(now)
+    notifier.fail = False
+    assert scheduler.run_once(now + timedelta(seconds=301)) == 1
+    reschedule_all()
+    # Claims, releases and sends are bookkeeping, not edits: incremental exports must not pick them up
+    assert db.session.get(Todo, todo.id, populate_existing=True).updated_at == stamp
@@ -0,0 +1,38 @@
+import io
+
+from PIL import Image
+
+from app import db
+from app.models import Document
+from app.renditions import rendition_version
+from app.storage import MemoryStorage
+
+
+def _photo(app, user, storage):
+    app.extensions['flik_storage'] = storage
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300), 'teal').save(buffer, 'PNG')
+    buffer.seek(0)
+    size = storage.save('photo.png', buffer)
+    document = Document(user_id=user.id, filename='photo.png', original_filename='photo.png', file_path='photo.png',
+                        file_size=size, file_type='png', content_hash='ab' * 32)
+    db.session.add(document)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'email': 'pat@example.com', 'password': 'secret'})
+    return client, f'/file/{document.id}/rendition/thumb?v={rendition_version(document)}'
+
+
+def test_versioned_rendition_served_directly_is_immutable(app, user):
+    client, url = _photo(app, user, MemoryStorage())
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'immutable' not in client.get(url.split('?')[0]).headers['Cache-Control']
+
+
+def test_redirect_to_a_signed_url_is_not_cached(app, user):
+    client, url = _photo(app, user, MemoryStorage(base_url='https://storage.example.com'))
+    response = client.get(url)
+    assert response.status_code == 302
+    assert response.headers['Cache-Control'] == 'private, no-store'
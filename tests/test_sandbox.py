@@ -0,0 +1,30 @@
+from PIL import Image
+
+from app.sandbox import ExtractionSandbox
+
+
+def test_job_runs_in_a_worker_and_the_worker_is_reused(tmp_path):
+    path = tmp_path / 'note.txt'
+    path.write_text('Dentist on Friday')
+    sandbox = ExtractionSandbox(workers=1, timeout=60)
+    try:
+        assert sandbox.extract(str(path), 'txt')[0]['text'] == 'Dentist on Friday'
+        [worker] = sandbox._idle
+        assert worker.process.args[1:3] == ['-m', 'app.sandbox_worker']
+        assert sandbox.extract(str(path), 'txt')[0]['text'] == 'Dentist on Friday'
+        assert sandbox._idle == [worker] and worker.jobs == 2
+    finally:
+        sandbox.close()
+
+
+def test_timed_out_job_is_killed(tmp_path, monkeypatch):
+    image = tmp_path / 'slow.png'
+    Image.new('RGB', (10, 10)).save(image)
+    monkeypatch.setenv('OCR_BACKEND', 'fake')
+    monkeypatch.setenv('FAKE_OCR_LATENCY_MS', '30000')
+    sandbox = ExtractionSandbox(workers=1, timeout=2)
+    try:
+        assert sandbox.extract(str(image), 'png') == []
+        assert sandbox._idle == []
+    finally:
+        sandbox.close()
@@ -0,0 +1,23 @@
+from app.suggest import SCAN_LIMIT, PrefixIndex
+
+
+def test_load_matches_incremental_adds():
+    rows = [(i, f'visit {i}.pdf', 'Medical', ['dentist', f'term{i}']) for i in range(50)]
+    loaded, incremental = PrefixIndex(), PrefixIndex()
+    loaded.load(rows)
+    for row in rows:
+        incremental.add_document(*row)
+    assert loaded.keys == incremental.keys == sorted(loaded.keys)
+    assert loaded.search('de') == incremental.search('de')
+
+
+def test_common_prefix_ranks_every_match():
+    index = PrefixIndex(max_terms=SCAN_LIMIT * 2)
+    # More 'a' terms than one lookup scans; the most used one sorts last
+    index.load([(i, None, 'Other', [f'a{i:05d}']) for i in range(SCAN_LIMIT + 500)])
+    for i in range(10):
+        index.add_document(100000 + i, None, 'Other', ['azzzz'])
+    assert index.search('a', 1)[0]['text'] == 'azzzz'
+
+    index.remove_document(100000)
+    assert index.search('a', 1) == [{'text': 'azzzz', 'kind': 'term', 'count': 9}]
@@ -0,0 +1,27 @@
+import pytest
+
+from app.textfiles import detect_encoding, read_text_file
+
+RUSSIAN = 'Привет мир, как дела? ' * 20
+ENGLISH = 'Hello world, invoice 42. ' * 20
+
+
+@pytest.mark.parametrize('text, encoding', [
+    (RUSSIAN, 'utf-16-le'),
+    (RUSSIAN, 'utf-16-be'),
+    (ENGLISH, 'utf-16-le'),
+    (ENGLISH, 'utf-16-be'),
+    ('Hi', 'utf-16-le'),
+    (ENGLISH, 'utf-8'),
+    (RUSSIAN, 'utf-8'),
+    ('a' * 100, 'utf-8'),
+    ('Café crème à côté, réservé. ' * 20, 'cp1252'),
+])
+def test_detect_encoding(text, encoding):
+    assert detect_encoding(text.encode(encoding)) == encoding
+
+
+def test_bomless_utf16_file(tmp_path):
+    path = tmp_path / 'note.txt'
+    path.write_bytes(RUSSIAN.encode('utf-16-le'))
+    assert read_text_file(str(path)) == (RUSSIAN, False)